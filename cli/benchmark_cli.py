@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+from lib.preprocessing import GetData
+from lib.inverted_index import document_text
+from lib.benchmark import (benchmark_analyzer, benchmark_ann, benchmark_quantization, benchmark_startup,
+                           benchmark_suite, compare_reports, synthetic_embeddings, startup_commands)
+
+cache_path = Path(__file__).resolve().parents[1]/'cache'
+
+
+def load_embeddings(args):
+    """ --synthetic N vectors, or the cached --embeddings """
+    if args.synthetic:
+        return synthetic_embeddings(args.synthetic)
+    return np.load(cache_path/f"{args.embeddings}_embeddings.npy")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark CLI")
+    subparsers = parser.add_subparsers(dest="command", help="Available benchmarks")
+
+    # analyzer cmd parser
+    analyzer_parser = subparsers.add_parser("analyzer", help="Tokens/sec of the text analyzer vs the legacy pipeline")
+    analyzer_parser.add_argument("--docs", type=int, default=1000, help="no. of movies to analyze")
+    analyzer_parser.add_argument("--repeat", type=int, default=3, help="runs per pipeline (fastest is reported)")
+
+    # ann cmd parser
+    ann_parser = subparsers.add_parser("ann", help="Recall@k vs latency of the IVF index against exact search")
+    ann_parser.add_argument("--embeddings", choices=['movie', 'chunk'], default='movie',
+                            help="cached embeddings to index (cache/<movie|chunk>_embeddings.npy)")
+    ann_parser.add_argument("--synthetic", type=int, default=None,
+                            help="use this many synthetic vectors instead of the cached embeddings")
+    ann_parser.add_argument("--queries", type=int, default=200, help="no. of queries")
+    ann_parser.add_argument("--limit", type=int, default=10, help="k of recall@k")
+    ann_parser.add_argument("--lists", type=int, default=None, help="no. of clusters (default: sqrt(n))")
+    ann_parser.add_argument("--nprobe", type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                            help="nprobe values to measure")
+
+    # quantization cmd parser
+    quantization_parser = subparsers.add_parser("quantization",
+                                                help="Memory, recall@k & latency of the compressed embedding storage modes")
+    quantization_parser.add_argument("--embeddings", choices=['movie', 'chunk'], default='movie',
+                                     help="cached embeddings to compress (cache/<movie|chunk>_embeddings.npy)")
+    quantization_parser.add_argument("--synthetic", type=int, default=None,
+                                     help="use this many synthetic vectors instead of the cached embeddings")
+    quantization_parser.add_argument("--queries", type=int, default=200, help="no. of queries")
+    quantization_parser.add_argument("--limit", type=int, default=10, help="k of recall@k")
+
+    # startup cmd parser
+    startup_parser = subparsers.add_parser("startup", help="Wall & import time (python -X importtime) of CLI subcommands")
+    startup_parser.add_argument("--command-line", type=str, action='append', default=None,
+                                help='a command to time instead of the defaults, e.g. "semantic_search_cli.py search bear" '
+                                     '(repeatable)')
+    startup_parser.add_argument("--repeat", type=int, default=3, help="runs per command (the fastest counts)")
+    startup_parser.add_argument("--budget", type=float, default=None,
+                                help="exit with status 1 if a command's overhead over the bare interpreter exceeds this (ms)")
+
+    # suite cmd parser
+    suite_parser = subparsers.add_parser("suite", help="Build / load / query benchmarks on synthetic corpora (JSON report)")
+    suite_parser.add_argument("--docs", type=int, nargs='+', default=[1000, 10000, 100000],
+                              help="no. of movies of every synthetic corpus (up to 1M)")
+    suite_parser.add_argument("--queries", type=int, default=200, help="no. of queries per search kind")
+    suite_parser.add_argument("--limit", type=int, default=10, help="no. of results per query")
+    suite_parser.add_argument("--seed", type=int, default=0, help="seed of the corpora & queries")
+    suite_parser.add_argument("--workers", type=int, default=None, help="build processes (default: one per CPU)")
+    suite_parser.add_argument("--no-semantic", action='store_true', help="skip the semantic (stand-in embedder) searches")
+    suite_parser.add_argument("--semantic-max-docs", type=int, default=100000,
+                              help="larger corpora skip the semantic searches (their embeddings are in memory)")
+    suite_parser.add_argument("--dim", type=int, default=384, help="dimensions of the stand-in embeddings")
+    suite_parser.add_argument("--output", type=str, default=None, help="JSON report file (default: stdout)")
+    suite_parser.add_argument("--baseline", type=str, default=None,
+                              help="JSON report to compare with, exit status 1 on a regression")
+    suite_parser.add_argument("--tolerance", type=float, default=0.25,
+                              help="relative change of a metric counted as a regression (default 0.25 -> 25%%)")
+
+    args = parser.parse_args()
+
+    match args.command:
+        case "analyzer":
+            movies = islice(GetData('movies.json').iter_documents(), args.docs)
+            report = benchmark_analyzer([document_text(movie) for movie in movies], args.repeat)
+
+            legacy = report['legacy']['tokens_per_sec']
+            for name, run in report.items():
+                print(f"{name:<22} {run['tokens_per_sec']:>12,.0f} tokens/sec  "
+                      f"({run['seconds'] * 1000:.1f} ms, x{run['tokens_per_sec'] / legacy:.1f})")
+
+        case "ann":
+            embeddings = load_embeddings(args)
+
+            build_seconds, n_lists, report = benchmark_ann(embeddings, args.queries, args.limit,
+                                                           args.nprobe, args.lists)
+
+            print(f"{len(embeddings)} vectors, {n_lists} lists, index built in {build_seconds:.2f} s")
+            for row in report:
+                nprobe = 'exact' if row['nprobe'] is None else f"nprobe {row['nprobe']}"
+                print(f"{nprobe:<11} recall@{args.limit}: {row['recall']:.3f}  "
+                      f"{row['ms_per_query']:.3f} ms/query")
+
+        case "quantization":
+            embeddings = load_embeddings(args)
+            report = benchmark_quantization(embeddings, args.queries, args.limit)
+
+            print(f"{len(embeddings)} vectors, recall@{args.limit} against exact float32 search")
+            for row in report:
+                print(f"{row['storage']:<8} {row['bytes_per_vector']:>5} B/vector "
+                      f"(x{report[0]['bytes_per_vector'] / row['bytes_per_vector']:.0f})  "
+                      f"codes: {row['recall']:.3f} {row['ms_per_query']:.2f} ms  "
+                      f"rescored: {row['rescored_recall']:.3f} {row['rescored_ms_per_query']:.2f} ms  "
+                      f"(built in {row['build_seconds']:.1f} s)")
+
+        case "startup":
+            commands = [command.split() for command in args.command_line] if args.command_line else startup_commands
+            report = benchmark_startup(commands, args.repeat)
+
+            over_budget = False
+            for row in report:
+                heaviest = ", ".join(f"{module} {ms:.0f}" for module, ms in row['heaviest'])
+                flag = ""
+                if args.budget is not None and row['overhead_ms'] > args.budget:
+                    flag, over_budget = "  OVER BUDGET", True
+                print(f"{row['command']:<55} {row['wall_ms']:>6.0f} ms (+{row['overhead_ms']:.0f})  "
+                      f"imports {row['import_ms']:>5.0f} ms  [{heaviest}]{flag}")
+
+            if over_budget:
+                raise SystemExit(1)
+
+        case "suite":
+            report = benchmark_suite(args.docs, args.queries, args.limit, args.seed, args.workers,
+                                     not args.no_semantic, args.semantic_max_docs, args.dim)
+
+            if args.output:
+                with open(args.output, 'w') as f:
+                    json.dump(report, f, indent=2)
+            else:
+                json.dump(report, sys.stdout, indent=2)
+                print()
+
+            # summary on stderr, stdout may be the report
+            for corpus in report['corpora']:
+                build, query = corpus['build'], corpus['query']
+                print(f"{corpus['docs']:>9} docs  build {build['build_seconds']:.2f} s  save {build['save_seconds']:.2f} s  "
+                      f"load {query['load_seconds'] * 1000:.1f} ms  peak RSS {build['peak_rss_mb'] or 0:.0f} MB  "
+                      f"bm25 p50/p95/p99 {query['bm25']['p50_ms']:.2f}/{query['bm25']['p95_ms']:.2f}/"
+                      f"{query['bm25']['p99_ms']:.2f} ms", file=sys.stderr)
+
+            if args.baseline:
+                with open(args.baseline) as f:
+                    rows = compare_reports(json.load(f), report, args.tolerance)
+
+                regressions = [row for row in rows if row['regression']]
+                for row in rows:
+                    flag = "  REGRESSION" if row['regression'] else ""
+                    print(f"{row['docs']:>9} {row['metric']:<40} {row['baseline']:>12.4g} -> {row['current']:>12.4g} "
+                          f"({row['change']:+.0%}){flag}", file=sys.stderr)
+                print(f"{len(regressions)} regressions in {len(rows)} metrics (tolerance {args.tolerance:.0%})",
+                      file=sys.stderr)
+
+                if regressions:
+                    raise SystemExit(1)
+
+        case _:
+            parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from parameters import RRF_K, HYBRID_ALPHA, BM25_SEARCH_STRATEGY, ANN_NPROBE, EMBEDDING_STORAGE, SERVER_ADDRESS
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Hybrid (BM25 + Semantic) Search CLI")
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+
+    # search cmd parser
+    search_parser = subparsers.add_parser("search", help="BM25 & semantic search (run concurrently), results fused")
+    search_parser.add_argument("query", type=str, help="user query on which search is performed")
+    search_parser.add_argument("--limit", type=int, default=5, help="no. of results")
+    search_parser.add_argument("--method", choices=['rrf', 'weighted'], default='rrf',
+                               help="rrf: reciprocal rank fusion, weighted: alpha * bm25 + (1 - alpha) * semantic")
+    search_parser.add_argument("--k", type=int, default=RRF_K, help="rrf: 1 / (k + rank)")
+    search_parser.add_argument("--alpha", type=float, default=HYBRID_ALPHA, help="weighted: weight of the BM25 scores")
+    search_parser.add_argument("--strategy", choices=['exhaustive', 'wand', 'bmw', 'impact'], default=BM25_SEARCH_STRATEGY,
+                               help="BM25 top-k algorithm")
+    search_parser.add_argument("--ann", action='store_true', help="approximate semantic search with the IVF index")
+    search_parser.add_argument("--nprobe", type=int, default=ANN_NPROBE, help="clusters scanned with --ann")
+    search_parser.add_argument("--storage", choices=['float32', 'float16', 'int8', 'pq'], default=EMBEDDING_STORAGE,
+                               help="search compressed embeddings (rescored in float32)")
+    search_parser.add_argument("--timings", action='store_true', help="print the time taken by each retriever")
+    search_parser.add_argument("--server", nargs='?', const=SERVER_ADDRESS, default=None,
+                               help="send the query to a running search server (default address: %(const)s), --ann & --storage are the server's")
+
+    args = parser.parse_args()
+
+    match args.command:
+        case "search":
+            options = {'k': args.k, 'alpha': args.alpha, 'strategy': args.strategy, 'nprobe': args.nprobe}
+
+            if args.server:
+                from lib.search_server import query_server
+                results, timings = query_server(args.server, 'hybrid', query=args.query, limit=args.limit,
+                                                method=args.method, **options), None
+            else:
+                # torch & the model are only imported if this process searches itself
+                from lib.hybrid_search import hybrid_search
+                results, timings = hybrid_search(args.query, args.limit, args.method, args.ann, args.storage, **options)
+
+            for i, res in enumerate(results):
+                bm25_rank = res['bm25_rank'] or '-'
+                semantic_rank = res['semantic_rank'] or '-'
+                print(f"{i+1}. ({res['id']}) {res['title']} - Score: {res['score']:.4f} "
+                      f"(BM25 rank: {bm25_rank}, semantic rank: {semantic_rank})")
+
+            if args.timings and timings:
+                print(f"\nBM25: {timings['bm25'] * 1000:.1f} ms, semantic: {timings['semantic'] * 1000:.1f} ms, "
+                      f"hybrid: {timings['total'] * 1000:.1f} ms")
+
+        case _:
+            parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,64 @@
 #!/usr/bin/env python3
 
 import argparse
+from pathlib import Path
 
-from lib.preprocessing import Preprocessing
+from lib import profiling
+from lib.preprocessing import GetData
 from lib.inverted_index import InvertedIndex
-from parameters import BM25_K1, BM25_B
+from lib.boolean_query import QueryError
+from parameters import BM25_K1, BM25_B, BM25_SEARCH_STRATEGY, BUILD_WORKERS, BATCH_WORKERS, SERVER_ADDRESS
+
+
+def bm25f_fields(args):
+    """ {field: {'boost':, 'b':}} of the bm25search BM25F flags, None without --bm25f """
+    if not args.bm25f:
+        return None
+
+    fields = {}
+    for field in ('title', 'description'):
+        for parameter in ('boost', 'b'):
+            value = getattr(args, f"{field}_{parameter}")
+            if value is not None:
+                fields.setdefault(field, {})[parameter] = value
+    return fields
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Keyword Search CLI")
+    parser.add_argument("--profile", action='store_const', const='text', default=None,
+                        help="print the time spent per stage & counters (to stderr)")
+    parser.add_argument("--profile-json", dest='profile', action='store_const', const='json',
+                        help="--profile as a single JSON line (metrics pipelines)")
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     # Search cmd parser
-    search_parser = subparsers.add_parser("search", help="Search movies using BM25")
-    search_parser.add_argument("query", type=str, help="Search query")
+    search_parser = subparsers.add_parser("search", help="Search movies with a boolean keyword query")
+    search_parser.add_argument("query", type=str,
+                               help='Boolean query: bear AND (jungle OR forest) NOT hunting, "quoted phrases" '
+                                    '(words without an operator are OR-ed)')
+    search_parser.add_argument("--limit", type=int, default=5, help="return x (default 5) number of results")
+    search_parser.add_argument("--rank", action='store_true', help="order the matches by BM25 score instead of id")
+    search_parser.add_argument("--server", nargs='?', const=SERVER_ADDRESS, default=None,
+                               help="send the query to a running search server (default address: %(const)s)")
 
     # Build cmd parser
     build_parser = subparsers.add_parser("build", help="Builts the Inverted Index for faster lookups")
+    build_parser.add_argument("--impacts", action='store_true',
+                              help="also store quantized BM25 impacts (current k1/b) for --strategy impact")
+    build_parser.add_argument("--workers", type=int, default=BUILD_WORKERS,
+                              help="no. of processes tokenizing the corpus (default: one per CPU, 1 = serial)")
+    build_parser.add_argument("--positions", action='store_true',
+                              help='also store token positions for "phrase" queries & bm25search --proximity')
+
+    # incremental index updates (no rebuild)
+    add_parser = subparsers.add_parser("add", help="Add movies to the index")
+    add_parser.add_argument("file", type=str, help='json file: {"movies": [...]}, a list of movies or jsonl')
+    update_parser = subparsers.add_parser("update", help="Replace indexed movies (matched by id)")
+    update_parser.add_argument("file", type=str, help='json file: {"movies": [...]}, a list of movies or jsonl')
+    delete_parser = subparsers.add_parser("delete", help="Delete movies from the index")
+    delete_parser.add_argument("doc_ids", type=int, nargs='+', help="Ids of the movies to delete")
+    subparsers.add_parser("merge", help="Merge the index segments into one (drops deleted movies)")
 
     # tf (term frequency) cmd parser
     tf_parser = subparsers.add_parser("tf", help="List term frequency of a keyword in a given document")
@@ -45,50 +87,98 @@ def main() -> None:
 
     # BM25 Search
     bm25search_parser = subparsers.add_parser("bm25search", help="Search movies using full BM25 scoring")
-    bm25search_parser.add_argument("query", type=str, help="Search query")
+    bm25search_parser.add_argument("query", type=str, help='Search query, "quoted phrases" must match exactly')
     bm25search_parser.add_argument("--limit", type=int, nargs='?', default=5, help="return x (default 5) number of results")
+    bm25search_parser.add_argument("--strategy", type=str, choices=['exhaustive', 'wand', 'bmw', 'impact'], default=BM25_SEARCH_STRATEGY,
+                                   help="top-k strategy: score every match, prune with (Block-Max) WAND or use quantized impacts")
+    bm25search_parser.add_argument("--k1", type=float, default=BM25_K1, help="Tunable BM25 K1 parameter")
+    bm25search_parser.add_argument("--b", type=float, default=BM25_B, help="Tunable BM25 b parameter")
+    bm25search_parser.add_argument("--compare", action='store_true',
+                                   help="run every strategy and check the pruned top-k matches the exhaustive one")
+    bm25search_parser.add_argument("--proximity", action='store_true',
+                                   help="boost results whose query tokens occur close together (index built with --positions)")
+    bm25search_parser.add_argument("--no-cache", action='store_true',
+                                   help="score the query even if its results are cached (cache/bm25_results.sqlite)")
+    bm25search_parser.add_argument("--bm25f", action='store_true',
+                                   help="BM25F: score the title & description as separate fields (BM25F_FIELDS defaults)")
+    for field in ('title', 'description'):
+        bm25search_parser.add_argument(f"--{field}-boost", type=float, default=None, help=f"BM25F weight of the {field}")
+        bm25search_parser.add_argument(f"--{field}-b", type=float, default=None, help=f"BM25F length normalization of the {field}")
+    bm25search_parser.add_argument("--server", nargs='?', const=SERVER_ADDRESS, default=None,
+                                   help="send the query to a running search server (default address: %(const)s)")
+
+    # Batch BM25 search
+    batch_parser = subparsers.add_parser("batch", help="BM25 search of a file of queries, JSONL results")
+    batch_parser.add_argument("queries", type=str, nargs='?', default='-',
+                              help='one query per line or JSONL {"query": ...} (default: stdin)')
+    batch_parser.add_argument("--output", type=str, default=None, help="JSONL results file (default: stdout)")
+    batch_parser.add_argument("--limit", type=int, default=5, help="no. of results per query")
+    batch_parser.add_argument("--strategy", type=str, choices=['exhaustive', 'wand', 'bmw', 'impact'], default=BM25_SEARCH_STRATEGY,
+                              help="top-k strategy {refer bm25search}")
+    batch_parser.add_argument("--k1", type=float, default=BM25_K1, help="Tunable BM25 K1 parameter")
+    batch_parser.add_argument("--b", type=float, default=BM25_B, help="Tunable BM25 b parameter")
+    batch_parser.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                              help="no. of processes sharing the memory-mapped index (default: one per CPU, 1 = serial)")
 
     args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
 
     match args.command:
         case "search":
             # Search (updating user search has begin)
             print(f"Searching for: {args.query}")
 
-            # Loads the Cache file
-            #index_cache, docmap_cache, tf_cache = InvertedIndex().load('index.pkl','docmap.pkl', 'term_frequencies.pkl')
-            index_cache = InvertedIndex().load('index.pkl')
-            docmap_cache = InvertedIndex().load('docmap.pkl')
-
-            tokens = Preprocessing(args.query).stemming()   # query text is processed {refer cli/preprocessing.py}
-            tokens = list(set(tokens))  # removes duplicate tokens
-
-            indexes = []    # contains index of movies, which matched the search
-            for token in tokens:
+            if args.server:
+                from lib.search_server import query_server
                 try:
-                    indexes.extend(index_cache[token])
-                except KeyError:
-                    continue
-
-            indexes = list(set(indexes))     # Remove duplicate indexes  
-            indexes.sort()    # Sort the list
+                    movies = query_server(args.server, 'keyword', query=args.query, limit=args.limit, rank=args.rank)
+                except ValueError as e:     # rejected by the server (400), e.g. a malformed query
+                    search_parser.error(str(e))
+            else:
+                # Loads the Cache file (memory-mapped index segment)
+                inverted_index = InvertedIndex()
+                inverted_index.load_index()
+
+                # movies matching the boolean query (processed {refer cli/lib/preprocessing.py}
+                # tokens), by id or ranked by BM25
+                try:
+                    movies = inverted_index.keyword_search(args.query, args.limit, args.rank)
+                except QueryError as e:
+                    search_parser.error(f"invalid query: {e}")
 
             # Output to the User
-            i = 1
-            for index in indexes:
-                if i > 5:
-                   break
-
-                movie_object = docmap_cache[index]
+            for i, movie_object in enumerate(movies, start=1):
                 print(f"{i}. {movie_object['title']}\n")
-                i += 1
 
         case "build":
             inverted_index = InvertedIndex()
             
-            inverted_index.build()  # builds the cache
+            inverted_index.build(impacts=args.impacts, workers=args.workers, positions=args.positions)  # builds the cache
             inverted_index.save()   # saves the cache
 
+        case "add" | "update":
+            # {"movies": [...]}, a list of movies or jsonl
+            movies = list(GetData(Path(args.file).resolve()).iter_documents())
+
+            inverted_index = InvertedIndex()
+            if args.command == "add":
+                inverted_index.add_documents(movies)
+                print(f"Added {len(movies)} movies ({len(inverted_index.segments)} segments)")
+            else:
+                inverted_index.update_documents(movies)
+                print(f"Updated {len(movies)} movies ({len(inverted_index.segments)} segments)")
+
+        case "delete":
+            inverted_index = InvertedIndex()
+            inverted_index.delete_documents(args.doc_ids)
+            print(f"Deleted {len(args.doc_ids)} movies ({len(inverted_index.segments)} segments)")
+
+        case "merge":
+            inverted_index = InvertedIndex()
+            inverted_index.merge()
+            print(f"Merged index: {inverted_index.no_of_docs} movies")
+
         case "tf":
             frequency = InvertedIndex().get_tf(args.doc_id, args.term)
             print(frequency)
@@ -121,19 +211,61 @@ def main() -> None:
 
             print(f"BM25 IDF score of {args.term}: {bm25_idf:.2f}")
 
+        case "bm25search" if args.server:
+            if args.compare:
+                bm25search_parser.error("--compare times the strategies locally, it can't be combined with --server")
+
+            from lib.search_server import query_server
+            results = query_server(args.server, 'bm25', query=args.query, limit=args.limit,
+                                   strategy=args.strategy, k1=args.k1, b=args.b, proximity=args.proximity,
+                                   use_cache=not args.no_cache, fields=bm25f_fields(args))
+
+            for i, res in enumerate(results, start=1):
+                print(f"{i}. ({res['id']}) {res['title']} - Score: {res['score']}")
+
         case "bm25search":
-            results = InvertedIndex().bm25_search(args.query, args.limit)
+            inverted_index = InvertedIndex()
+
+            if args.compare:
+                report = inverted_index.compare_strategies(args.query, args.limit, bm25f_fields(args))
+                exhaustive = report['exhaustive']['results']
+
+                for strategy, run in report.items():
+                    identical = "identical" if run['results'] == exhaustive else "MISMATCH"
+                    if strategy == 'impact' and run['results'] != exhaustive:
+                        identical = "differs, quantized"
+                    print(f"{strategy:<10} docs scored: {run['docs_scored']:<6} "
+                          f"time: {run['seconds'] * 1000:.2f} ms  ({identical})")
+                print()
+
+            results = inverted_index.bm25_search(args.query, args.limit, args.strategy, args.k1, args.b,
+                                                 args.proximity, use_cache=not args.no_cache, fields=bm25f_fields(args))
 
-            docmap_cache = InvertedIndex().load('docmap.pkl')
-            
             i = 1
             for id, score in results.items():
-                print(f"{i}. ({id}) {docmap_cache[id]['title']} - Score: {score}")
+                print(f"{i}. ({id}) {inverted_index.get_document(id)['title']} - Score: {score}")
                 i += 1
 
+        case "batch":
+            import sys
+            from lib.batch_search import read_queries, batch_bm25_search, write_results, print_batch_report
+
+            queries = read_queries(args.queries)
+            batch = batch_bm25_search(queries, args.limit, args.strategy, args.k1, args.b, args.workers)
+
+            if args.output:
+                with open(args.output, 'w') as output:
+                    report = write_results(batch, output)
+            else:
+                report = write_results(batch, sys.stdout)
+            print_batch_report(report)
+
         case _:
             parser.print_help()
 
+    if args.profile:
+        profiling.print_report(args.profile)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,204 @@
+"""
+    ann
+
+        Approximate nearest neighbour search over unit-length embeddings,
+        NumPy only.
+
+        IVFIndex (inverted file)
+            build   -> spherical k-means splits the vectors into n_lists
+                       clusters (coarse quantizer), every vector is
+                       stored in the list of its closest centroid
+            search  -> scores the centroids, then only the vectors of the
+                       `nprobe` closest lists (exact dot products)
+
+        nprobe trades recall for latency: nprobe = n_lists is an exact
+        search, nprobe = 1 scans ~1/n_lists of the vectors.
+
+        The index (centroids, list offsets & ids) is saved as .npz next to
+        the embeddings it was built from, with a fingerprint of them so a
+        stale index is rebuilt instead of used.
+"""
+from time import perf_counter
+import os
+
+import numpy as np
+
+from lib.vectors import l2_normalize, top_k, fingerprint
+from parameters import ANN_LISTS, ANN_NPROBE, ANN_KMEANS_ITERATIONS, ANN_TRAIN_SIZE
+
+# rows scored against the centroids at once (bounds the (rows, n_lists) score matrix)
+_ASSIGN_BATCH = 8192
+
+
+class IVFIndex:
+    """
+    :param centroids: (n_lists, dim) unit-length centroids
+    :param list_offsets: (n_lists + 1,) list i is ids[list_offsets[i]:list_offsets[i + 1]]
+    :param ids: (n,) row numbers of the vectors, grouped by list
+    :param fingerprint: of the vectors the index was built from
+    """
+    def __init__(self, centroids, list_offsets, ids, fingerprint):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.ids = ids
+        self.fingerprint = fingerprint
+        # vectors in list order (contiguous per list), set by attach()
+        self.vectors = None
+
+    @classmethod
+    def build(cls, unit_vectors, n_lists=ANN_LISTS, iterations=ANN_KMEANS_ITERATIONS, seed=0):
+        """
+        Docstring for build
+
+        :param unit_vectors: (n, dim) L2-normalized vectors
+        :param n_lists: no. of clusters (None -> sqrt(n))
+        :param iterations: k-means iterations
+        :param seed: of the random initial centroids / training sample
+        """
+        unit_vectors = np.asarray(unit_vectors, dtype=np.float32)
+        n = len(unit_vectors)
+        n_lists = max(1, min(n, n_lists or round(np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+
+        # centroids are trained on a sample, every vector is assigned after
+        train = unit_vectors
+        if n > ANN_TRAIN_SIZE:
+            train = unit_vectors[np.sort(rng.choice(n, ANN_TRAIN_SIZE, replace=False))]
+        centroids = train[rng.choice(len(train), n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = _assign(train, centroids)
+            sums, counts = _cluster_sums(train, assignment, n_lists)
+
+            # an empty cluster gets a random vector as its new centroid
+            empty = counts == 0
+            sums[empty] = train[rng.choice(len(train), int(empty.sum()))]
+            centroids = l2_normalize(sums)
+
+        assignment = _assign(unit_vectors, centroids)
+        ids = np.argsort(assignment, kind='stable')
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=n_lists), out=list_offsets[1:])
+
+        index = cls(centroids, list_offsets, ids, fingerprint(unit_vectors))
+        index.attach(unit_vectors)
+        return index
+
+    def attach(self, unit_vectors):
+        """ keeps a copy of the vectors in list order (one slice per list) """
+        self.vectors = np.ascontiguousarray(np.asarray(unit_vectors, dtype=np.float32)[self.ids])
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def search(self, unit_queries, limit, nprobe=ANN_NPROBE):
+        """
+        Docstring for search
+
+        :param unit_queries: (no. of queries, dim) L2-normalized queries
+        :param limit: no. of results per query
+        :param nprobe: no. of closest lists scanned per query
+        :return: [(row numbers, scores), ...] one per query, best first
+        """
+        unit_queries = np.atleast_2d(unit_queries)
+        probes = top_k(unit_queries @ self.centroids.T, nprobe)
+
+        results = []
+        for query, lists in zip(unit_queries, probes):
+            starts, ends = self.list_offsets[lists], self.list_offsets[lists + 1]
+            positions = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+            scores = np.concatenate([self.vectors[start:end] @ query for start, end in zip(starts, ends)])
+
+            best = top_k(scores, limit)[0]
+            results.append( (self.ids[positions[best]], scores[best]) )
+
+        return results
+
+    def save(self, path):
+        """ writes the index (not the vectors) to `path` (.npz) atomically """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, centroids=self.centroids, list_offsets=self.list_offsets,
+                     ids=self.ids, fingerprint=np.frombuffer(self.fingerprint, dtype=np.uint8))
+
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, unit_vectors):
+        """ the saved index of unit_vectors, None if missing or built from other vectors """
+        try:
+            with np.load(path) as data:
+                index = cls(data['centroids'], data['list_offsets'], data['ids'], data['fingerprint'].tobytes())
+        except FileNotFoundError:
+            return None
+
+        if index.fingerprint != fingerprint(unit_vectors):
+            return None     # embeddings changed since
+
+        index.attach(unit_vectors)
+        return index
+
+
+def load_or_build_ivf(path, unit_vectors, n_lists=ANN_LISTS):
+    """ loads the IVF index saved at `path`, (re)builds & saves it if missing or stale """
+    index = IVFIndex.load(path, unit_vectors)
+    if index is None:
+        index = IVFIndex.build(unit_vectors, n_lists)
+        index.save(path)
+
+    return index
+
+
+def recall_report(unit_vectors, unit_queries, limit, nprobes, index=None):
+    """
+    Docstring for recall_report
+
+        recall@limit & latency of the IVF index for every nprobe, against
+        the exact (brute force) search
+
+    :return: [{'nprobe':, 'recall':, 'ms_per_query':}, ...] the exact search
+             first (nprobe None, recall 1.0)
+    """
+    index = index or IVFIndex.build(unit_vectors)
+    unit_queries = np.atleast_2d(unit_queries)
+
+    start = perf_counter()
+    exact = [top_k(query @ unit_vectors.T, limit)[0] for query in unit_queries]
+    report = [{'nprobe': None, 'recall': 1.0,
+               'ms_per_query': (perf_counter() - start) * 1000 / len(unit_queries)}]
+
+    for nprobe in nprobes:
+        start = perf_counter()
+        results = [index.search(query, limit, nprobe)[0][0] for query in unit_queries]
+        seconds = perf_counter() - start
+
+        hits = sum(len(np.intersect1d(found, expected)) for found, expected in zip(results, exact))
+        report.append({'nprobe': nprobe,
+                       'recall': hits / sum(len(expected) for expected in exact),
+                       'ms_per_query': seconds * 1000 / len(unit_queries)})
+
+    return report
+
+
+def _assign(unit_vectors, centroids):
+    """ closest centroid (highest dot product) of every vector """
+    assignment = np.empty(len(unit_vectors), dtype=np.int64)
+    for start in range(0, len(unit_vectors), _ASSIGN_BATCH):
+        batch = unit_vectors[start:start + _ASSIGN_BATCH]
+        assignment[start:start + _ASSIGN_BATCH] = np.argmax(batch @ centroids.T, axis=1)
+
+    return assignment
+
+
+def _cluster_sums(vectors, assignment, n_lists):
+    """ (sum of the vectors, no. of vectors) of every cluster """
+    order = np.argsort(assignment, kind='stable')
+    counts = np.bincount(assignment, minlength=n_lists)
+    sums = np.zeros((n_lists, vectors.shape[1]), dtype=np.float32)
+
+    non_empty = np.flatnonzero(counts)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[non_empty]
+    sums[non_empty] = np.add.reduceat(vectors[order], starts, axis=0)
+
+    return sums, counts
@@ -0,0 +1,201 @@
+"""
+    batch_search
+
+        Runs a batch of queries (offline evaluation, backfills) without
+        paying the per-process index / model load of a query each.
+
+        read_queries()          queries from a file or stdin, one per line:
+                                    plain text        -> the query
+                                    {"query":, ...}   -> JSONL, the other
+                                                         keys are kept
+                                (ids default to the line no.)
+        batch_bm25_search()     BM25 queries spread over a process pool.
+                                Every worker memory-maps the same index
+                                segments read-only: the OS page cache holds
+                                one copy of them, whatever the no. of workers.
+        batch_semantic_search() semantic queries `batch_size` at a time, one
+                                encode() call & one matrix product per batch
+                                {refer SemanticSearch.search_many}
+        latency_report()        queries/sec & per-query latency percentiles
+
+        Both searches yield (query, results, seconds) in the order of the
+        queries, so results can be written as they come.
+        seconds -> BM25: time the worker spent on the query,
+                   semantic: time of the batch the query was in (what the
+                   query waited for its results)
+"""
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+import json
+import os
+import sys
+
+from parameters import (BM25_K1, BM25_B, BM25_SEARCH_STRATEGY, BATCH_WORKERS, BATCH_SEMANTIC_SIZE,
+                        ANN_NPROBE, EMBEDDING_STORAGE)
+
+
+def read_queries(file):
+    """
+    Docstring for read_queries
+
+    :param file: path of the queries, '-' -> stdin
+    :return: [{'id':, 'query':, ...}, ...], blank lines are skipped
+    """
+    if file == '-':
+        return _parse_queries(sys.stdin)
+
+    with open(file) as f:
+        return _parse_queries(f)
+
+
+def _parse_queries(lines):
+    queries = []
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+
+        if line.startswith('{'):
+            record = json.loads(line)
+            if not isinstance(record.get('query'), str):
+                raise ValueError(f"Line {line_no}: a JSONL query needs a 'query' string")
+        else:
+            record = {'query': line}
+
+        queries.append({'id': line_no, **record})
+
+    return queries
+
+
+# the index of a pool worker, loaded once by _init_bm25_worker
+_worker_index = None
+
+
+def _init_bm25_worker():
+    global _worker_index
+    from lib.inverted_index import InvertedIndex
+    from lib.preprocessing import get_analyzer
+
+    _worker_index = InvertedIndex()
+    _worker_index.load_index()
+    get_analyzer()      # nltk is imported here, not in the latency of the first query
+
+
+def _bm25_worker(job):
+    """ (results, seconds) of one query in a pool worker """
+    query, limit, strategy, k1, b = job
+
+    start = perf_counter()
+    results = _worker_index.bm25_search(query, limit, strategy, k1, b)
+    results = [{'id': doc_id, 'title': _worker_index.get_document(doc_id)['title'], 'score': score}
+               for doc_id, score in results.items()]
+
+    return results, perf_counter() - start
+
+
+def batch_bm25_search(queries, limit, strategy=BM25_SEARCH_STRATEGY, k1=BM25_K1, b=BM25_B, workers=BATCH_WORKERS):
+    """
+    Docstring for batch_bm25_search
+
+    :param queries: [{'query':, ...}, ...] {refer read_queries}
+    :param limit: no. of results per query
+    :param strategy, k1, b: {refer InvertedIndex.bm25_search}
+    :param workers: no. of processes (None -> one per CPU, 1 -> this process)
+    :return: generator of (query, [{'id':, 'title':, 'score':}, ...], seconds)
+    """
+    jobs = [(query['query'], limit, strategy, k1, b) for query in queries]
+
+    if workers == 1:
+        _init_bm25_worker()
+        for query, job in zip(queries, jobs):
+            yield query, *_bm25_worker(job)
+        return
+
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_bm25_worker) as executor:
+        # a few chunks per worker: little IPC, balanced even if some queries are slow
+        chunksize = max(1, len(jobs) // (4 * workers))
+        for query, (results, seconds) in zip(queries, executor.map(_bm25_worker, jobs, chunksize=chunksize)):
+            yield query, results, seconds
+
+
+def batch_semantic_search(queries, limit, ann=False, nprobe=ANN_NPROBE, storage=EMBEDDING_STORAGE,
+                          batch_size=BATCH_SEMANTIC_SIZE):
+    """
+    Docstring for batch_semantic_search
+
+    :param queries: [{'query':, ...}, ...] {refer read_queries}
+    :param limit: no. of results per query
+    :param ann, nprobe, storage: {refer lib/semantic_search.search}
+    :param batch_size: queries per encode() call & matrix product
+    :return: generator of (query, results (as SemanticSearch.search), seconds)
+    """
+    from lib.preprocessing import GetData
+    from lib.semantic_search import SemanticSearch
+
+    semantic_search = SemanticSearch(storage=storage)
+    semantic_search.load_or_create_embeddings(GetData('movies.json').get_file_data_json()['movies'])
+    if ann:
+        semantic_search.load_or_create_ann_index()
+
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+
+        batch_start = perf_counter()
+        results = semantic_search.search_many([query['query'] for query in batch], limit, nprobe)
+        seconds = perf_counter() - batch_start
+
+        for query, query_results in zip(batch, results):
+            yield query, query_results, seconds
+
+
+def latency_report(latencies, seconds):
+    """
+    Docstring for latency_report
+
+    :param latencies: seconds of every query
+    :param seconds: wall time of the whole batch
+    :return: {'queries':, 'seconds':, 'queries_per_second':,
+              'p50_ms':, 'p90_ms':, 'p95_ms':, 'p99_ms':, 'max_ms':}
+    """
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        # nearest rank
+        if not latencies:
+            return 0.0
+        return latencies[max(0, -(-p * len(latencies) // 100) - 1)] * 1000
+
+    return {'queries': len(latencies),
+            'seconds': seconds,
+            'queries_per_second': len(latencies) / seconds if seconds > 0 else 0.0,
+            'p50_ms': percentile(50),
+            'p90_ms': percentile(90),
+            'p95_ms': percentile(95),
+            'p99_ms': percentile(99),
+            'max_ms': latencies[-1] * 1000 if latencies else 0.0}
+
+
+def write_results(batch, output):
+    """
+    Docstring for write_results
+
+        writes every (query, results, seconds) of a batch search as a JSONL
+        line {"id":, "query":, ..., "results": [...], "ms":} to output
+
+    :return: latency_report() of the batch
+    """
+    start = perf_counter()
+    latencies = []
+    for query, results, seconds in batch:
+        output.write(json.dumps({**query, 'results': results, 'ms': round(seconds * 1000, 3)}) + "\n")
+        latencies.append(seconds)
+
+    return latency_report(latencies, perf_counter() - start)
+
+
+def print_batch_report(report, file=sys.stderr):
+    """ prints a latency_report() (to stderr by default: stdout may be the JSONL results) """
+    print(f"{report['queries']} queries in {report['seconds']:.2f} s ({report['queries_per_second']:.1f} queries/sec)  "
+          f"latency p50 {report['p50_ms']:.2f} ms, p90 {report['p90_ms']:.2f} ms, "
+          f"p99 {report['p99_ms']:.2f} ms, max {report['max_ms']:.2f} ms", file=file)
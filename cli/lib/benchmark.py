@@ -0,0 +1,437 @@
+"""
+    benchmark
+
+        Micro-benchmarks of the search pipeline, run through
+        cli/benchmark_cli.py
+
+        benchmark_analyzer
+            tokens/sec of the text Analyzer vs the original
+            Preprocessing pipeline (re-reads stopwords.txt, list lookups
+            and a new PorterStemmer for every text)
+
+        benchmark_ann
+            recall@k vs latency of the IVF index for several nprobe
+            values, against the exact search {refer lib/ann.py}
+
+        benchmark_quantization
+            memory, recall@k & latency of every compressed storage mode
+            {refer lib/quantization.py}
+
+        benchmark_startup
+            wall time & import time (python -X importtime) of CLI
+            subcommands, each run in a fresh interpreter
+
+        benchmark_suite
+            build / save / load time, peak memory, query latency
+            percentiles & cache file sizes on synthetic corpora of several
+            sizes (JSON report), compare_reports() diffs two reports
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from time import perf_counter
+import multiprocessing
+import os
+import string
+import subprocess
+import sys
+
+import numpy as np
+
+from lib import profiling
+from lib.preprocessing import Analyzer, stopwords_path
+from lib.vectors import l2_normalize, top_k
+from lib.ann import IVFIndex, recall_report
+from lib.quantization import CompressedVectors
+
+
+def _legacy_analyze(text):
+    """ the per-text pipeline Analyzer replaced (kept for comparison only) """
+    from nltk.stem import PorterStemmer     # only when the analyzer benchmark runs
+
+    tokens = text.lower().translate(str.maketrans('', '', string.punctuation)).split()
+
+    with open(stopwords_path) as f:
+        stop_words = [line.strip() for line in f]
+
+    stemmer = PorterStemmer()
+    return [stemmer.stem(token) for token in tokens if token not in stop_words]
+
+
+def _timed(fn, texts, repeat):
+    """ best of `repeat` runs -> (seconds, no. of tokens produced) """
+    best, no_of_tokens = float('inf'), 0
+    for _ in range(repeat):
+        start = perf_counter()
+        no_of_tokens = sum(len(tokens) for tokens in fn(texts))
+        best = min(best, perf_counter() - start)
+
+    return best, no_of_tokens
+
+
+def benchmark_analyzer(texts, repeat=3):
+    """
+    Docstring for benchmark_analyzer
+
+    :param texts: documents / queries to analyze
+    :param repeat: runs per pipeline, the fastest one is reported
+    :return: {pipeline: {'seconds':, 'tokens':, 'tokens_per_sec':}, ...}
+    """
+    texts = list(texts)
+    analyzer = Analyzer()   # fresh stem memo, the first run fills it
+
+    pipelines = {
+        'legacy': lambda texts: [_legacy_analyze(text) for text in texts],
+        'analyzer (cold memo)': lambda texts: Analyzer().analyze_many(texts),
+        'analyzer': analyzer.analyze_many,
+    }
+
+    report = {}
+    for name, fn in pipelines.items():
+        seconds, no_of_tokens = _timed(fn, texts, repeat)
+        report[name] = {'seconds': seconds,
+                        'tokens': no_of_tokens,
+                        'tokens_per_sec': no_of_tokens / seconds if seconds else 0.0}
+
+    return report
+
+
+def synthetic_embeddings(no_of_vectors, dim=384, no_of_topics=1000, seed=0):
+    """ unit vectors scattered around `no_of_topics` random directions
+        (stand-in for real embeddings when none are cached) """
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(no_of_topics, dim))
+    vectors = topics[rng.integers(no_of_topics, size=no_of_vectors)] + rng.normal(scale=1.5, size=(no_of_vectors, dim))
+
+    return l2_normalize(vectors)
+
+
+def benchmark_ann(embeddings, no_of_queries, limit, nprobes, n_lists=None, seed=0):
+    """
+    Docstring for benchmark_ann
+
+        queries are random embeddings with noise added (a query is close
+        to, but not exactly, a stored vector)
+
+    :param embeddings: (n, dim) embedding matrix
+    :return: (seconds to build the index, n_lists, recall_report rows)
+    """
+    unit_vectors = l2_normalize(embeddings)
+    queries = _noisy_queries(unit_vectors, no_of_queries, seed)
+
+    start = perf_counter()
+    index = IVFIndex.build(unit_vectors, n_lists)
+    build_seconds = perf_counter() - start
+
+    return build_seconds, index.n_lists, recall_report(unit_vectors, queries, limit, nprobes, index)
+
+
+def benchmark_quantization(embeddings, no_of_queries, limit, storages=('float16', 'int8', 'pq'), seed=0):
+    """
+    Docstring for benchmark_quantization
+
+    :param embeddings: (n, dim) embedding matrix
+    :return: [{'storage':, 'bytes_per_vector':, 'build_seconds':,
+               'recall':, 'ms_per_query':,                    # scored on the codes
+               'rescored_recall':, 'rescored_ms_per_query':}, ...] float32 first
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    unit_vectors = l2_normalize(embeddings)
+    queries = _noisy_queries(unit_vectors, no_of_queries, seed)
+
+    start = perf_counter()
+    exact = top_k(queries @ unit_vectors.T, limit)
+    exact_ms = (perf_counter() - start) * 1000 / no_of_queries
+
+    report = [{'storage': 'float32', 'bytes_per_vector': embeddings.itemsize * embeddings.shape[1],
+               'build_seconds': 0.0, 'recall': 1.0, 'ms_per_query': exact_ms,
+               'rescored_recall': 1.0, 'rescored_ms_per_query': exact_ms}]
+
+    for storage in storages:
+        start = perf_counter()
+        compressed = CompressedVectors.build(embeddings, storage)
+        row = {'storage': storage,
+               'bytes_per_vector': compressed.bytes_per_vector,
+               'build_seconds': perf_counter() - start}
+
+        for prefix, full_vectors in (('', None), ('rescored_', embeddings)):
+            start = perf_counter()
+            results = compressed.search(queries, limit, full_vectors)
+            row[f'{prefix}ms_per_query'] = (perf_counter() - start) * 1000 / no_of_queries
+
+            hits = sum(len(np.intersect1d(rows, expected)) for (rows, _), expected in zip(results, exact))
+            row[f'{prefix}recall'] = hits / exact.size
+
+        report.append(row)
+
+    return report
+
+
+def _noisy_queries(unit_vectors, no_of_queries, seed):
+    """ random stored vectors with noise added (a query is close to, but
+        not exactly, a stored vector) """
+    rng = np.random.default_rng(seed)
+    rows = unit_vectors[rng.integers(len(unit_vectors), size=no_of_queries)]
+
+    return l2_normalize(rows + rng.normal(scale=1 / np.sqrt(unit_vectors.shape[1]), size=rows.shape))
+
+
+cli_path = Path(__file__).resolve().parents[1]
+
+# commands that need neither the embedding model nor nltk (query analysis)
+# nor NumPy, they should start in tens of ms (on top of the bare interpreter)
+startup_commands = [
+    ['keyword_search_cli.py', '--help'],
+    ['semantic_search_cli.py', '--help'],
+    ['semantic_search_cli.py', 'chunk', 'the bear attack was terrifying'],
+    ['semantic_search_cli.py', 'semantic_chunk', 'The bear attacks. Hunters flee.'],
+    ['hybrid_search_cli.py', '--help'],
+    ['search_server_cli.py', '--help'],
+]
+
+
+def benchmark_startup(commands=startup_commands, repeat=3):
+    """
+    Docstring for benchmark_startup
+
+    :param commands: [[script, arg, ...], ...] scripts in cli/
+    :param repeat: runs per command, the fastest counts
+    :return: [{'command':, 'wall_ms':, 'overhead_ms':, 'import_ms':,
+               'heaviest': [(module, ms), ...]}, ...]
+             overhead -> wall time minus the bare interpreter's (`python -c pass`),
+             heaviest -> the 3 slowest top-level imports (incl. their imports)
+    """
+    baseline_ms = min(_run([sys.executable, '-c', 'pass'])[0] for _ in range(repeat))
+
+    report = []
+    for command in commands:
+        argv = [sys.executable, str(cli_path/command[0]), *command[1:]]
+        wall_ms = min(_run(argv)[0] for _ in range(repeat))
+
+        # separate run: -X importtime slows the imports down
+        imports = _parse_importtime(_run([sys.executable, '-X', 'importtime', *argv[1:]])[1])
+        top_level = sorted(((module, cumulative) for module, cumulative, _, level in imports if level == 0),
+                           key=lambda item: -item[1])
+
+        report.append({'command': " ".join(command),
+                       'wall_ms': wall_ms,
+                       'overhead_ms': wall_ms - baseline_ms,
+                       'import_ms': sum(own for _, _, own, _ in imports),
+                       'heaviest': top_level[:3]})
+
+    return report
+
+
+def _run(argv):
+    """ (wall ms, stderr) of running argv in cli/ """
+    start = perf_counter()
+    completed = subprocess.run(argv, cwd=cli_path, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return (perf_counter() - start) * 1000, completed.stderr
+
+
+def _parse_importtime(stderr):
+    """ [(module, cumulative ms, own ms, nesting level), ...] of `-X importtime` output
+        ("import time: self [us] | cumulative | imported package" lines) """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        imports.append((name.strip(), int(cumulative) / 1000, int(own) / 1000, level))
+
+    return imports
+
+
+def benchmark_suite(sizes, no_of_queries=200, limit=10, seed=0, workers=None,
+                    semantic=True, semantic_max_docs=100_000, dim=384):
+    """
+    Docstring for benchmark_suite
+
+        builds, saves & loads the index of synthetic corpora of every size
+        {refer lib/synthetic_corpus.py} and times keyword, BM25 & semantic
+        (stand-in embedder, no model needed) queries against them.
+
+        Every phase runs in a fresh process, in a temporary cache
+        directory: its peak RSS is its own (the interpreter & imports
+        included) and nothing in cache/ is touched.
+            build    -> generate + build() + save(), peak RSS of the process
+                        & of its build workers
+            query    -> load_index() + the keyword & BM25 queries
+            semantic -> encode the corpus + the semantic queries (corpora
+                        up to semantic_max_docs, the embeddings are in memory)
+
+    :param sizes: no. of movies of every corpus, e.g. [1000, 10000, 100000]
+    :param workers: build processes {refer InvertedIndex.build}
+    :param dim: of the stand-in embeddings
+    :return: {'meta': {...}, 'corpora': [{'docs':, 'build':, 'query':,
+              'semantic':, 'files': {name: bytes}}, ...]} (JSON serializable),
+             query latencies as lib/batch_search.latency_report()
+    """
+    import platform
+    import tempfile
+
+    from lib.synthetic_corpus import synthetic_queries
+    from parameters import BM25_SEARCH_STRATEGY
+
+    queries = synthetic_queries(no_of_queries, seed)
+    report = {'meta': {'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'cpus': os.cpu_count(),
+                       'queries': no_of_queries,
+                       'limit': limit,
+                       'seed': seed,
+                       'bm25_strategy': BM25_SEARCH_STRATEGY,
+                       'dim': dim},
+              'corpora': []}
+
+    for no_of_docs in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            corpus = {'docs': no_of_docs,
+                      'build': _in_fresh_process(_suite_build, directory, no_of_docs, seed, workers),
+                      'query': _in_fresh_process(_suite_query, directory, queries, limit)}
+            if semantic and no_of_docs <= semantic_max_docs:
+                corpus['semantic'] = _in_fresh_process(_suite_semantic, directory, no_of_docs, seed, queries, limit, dim)
+
+            corpus['files'] = {str(path.relative_to(directory)): path.stat().st_size
+                               for path in sorted(Path(directory).rglob('*')) if path.is_file()}
+            report['corpora'].append(corpus)
+
+    return report
+
+
+def _in_fresh_process(fn, *args):
+    """ fn(*args) in a new interpreter (spawned, not forked: nothing is inherited) """
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def _suite_build(directory, no_of_docs, seed, workers):
+    from lib.inverted_index import InvertedIndex
+    from lib.synthetic_corpus import synthetic_movies
+
+    inverted_index = InvertedIndex(directory)
+    inverted_index.movies = synthetic_movies(no_of_docs, seed)
+
+    start = perf_counter()
+    inverted_index.build(workers=workers)
+    build_seconds = perf_counter() - start
+
+    start = perf_counter()
+    inverted_index.save()
+    save_seconds = perf_counter() - start
+
+    return {'build_seconds': build_seconds,
+            'save_seconds': save_seconds,
+            'docs_per_second': no_of_docs / build_seconds if build_seconds else 0.0,
+            'peak_rss_mb': profiling.peak_rss_mb(),
+            'workers_peak_rss_mb': profiling.peak_rss_mb(children=True)}
+
+
+def _suite_query(directory, queries, limit):
+    from lib.inverted_index import InvertedIndex
+    from lib.preprocessing import get_analyzer
+    from lib.batch_search import latency_report
+
+    get_analyzer()      # nltk import, not part of the first query
+
+    start = perf_counter()
+    inverted_index = InvertedIndex(directory)
+    inverted_index.load_index()
+    report = {'load_seconds': perf_counter() - start}
+
+    # results aren't cached: the Zipfian queries repeat, the suite times scoring them
+    bm25_search = partial(inverted_index.bm25_search, use_cache=False)
+    for name, search in (('keyword', inverted_index.keyword_search), ('bm25', bm25_search)):
+        report[name] = latency_report(*_time_queries(search, queries, limit))
+
+    report['peak_rss_mb'] = profiling.peak_rss_mb()
+    return report
+
+
+def _suite_semantic(directory, no_of_docs, seed, queries, limit, dim):
+    from lib.semantic_search import SemanticSearch
+    from lib.synthetic_corpus import synthetic_movies, StandInEmbedder
+    from lib.batch_search import latency_report
+
+    semantic_search = SemanticSearch(model_name=f"stand-in-{dim}", model=StandInEmbedder(dim), directory=directory)
+    documents = list(synthetic_movies(no_of_docs, seed))
+
+    start = perf_counter()
+    semantic_search.load_or_create_embeddings(documents)
+    report = {'embed_seconds': perf_counter() - start}
+
+    report['search'] = latency_report(*_time_queries(semantic_search.search, queries, limit))
+    report['peak_rss_mb'] = profiling.peak_rss_mb()
+    return report
+
+
+def _time_queries(search, queries, limit):
+    """ ([seconds of every query], total seconds) of search(query, limit) for every query """
+    latencies = []
+    total_start = perf_counter()
+    for query in queries:
+        start = perf_counter()
+        search(query, limit)
+        latencies.append(perf_counter() - start)
+
+    return latencies, perf_counter() - total_start
+
+
+# smallest slowdown (by metric unit) compare_reports() counts as a regression
+_NOISE_FLOORS = {'ms': 0.5, 'seconds': 0.05}
+
+
+def compare_reports(baseline, report, tolerance=0.25):
+    """
+    Docstring for compare_reports
+
+        compares the metrics of two benchmark_suite() reports, corpus size
+        by corpus size (sizes missing from either report are skipped)
+
+    :param tolerance: a metric > (1 + tolerance) x its baseline (< for
+                      queries/sec & docs/sec) is a regression, timings
+                      must also be slower by more than _NOISE_FLOORS
+    :return: [{'docs':, 'metric':, 'baseline':, 'current':, 'change':,
+               'regression':}, ...], change -> current / baseline - 1
+    """
+    baseline_corpora = {corpus['docs']: _suite_metrics(corpus) for corpus in baseline['corpora']}
+
+    rows = []
+    for corpus in report['corpora']:
+        old_metrics = baseline_corpora.get(corpus['docs'], {})
+        for metric, value in _suite_metrics(corpus).items():
+            old_value = old_metrics.get(metric)
+            if old_value is None or value is None or not old_value:
+                continue
+
+            change = value / old_value - 1
+            if metric.endswith('_per_second'):
+                regression = change < -tolerance
+            else:
+                # sub-ms timings are mostly noise: a slowdown must also exceed the floor
+                floor = _NOISE_FLOORS.get(metric.rsplit('.', 1)[-1].rsplit('_', 1)[-1], 0)
+                regression = change > tolerance and value - old_value > floor
+
+            rows.append({'docs': corpus['docs'],
+                         'metric': metric,
+                         'baseline': old_value,
+                         'current': value,
+                         'change': change,
+                         'regression': regression})
+
+    return rows
+
+
+def _suite_metrics(corpus, prefix=''):
+    """ {'query.bm25.p95_ms': value, ...} the timing, throughput, memory &
+        size metrics of a corpus report (counts are not metrics) """
+    metrics = {}
+    for key, value in corpus.items():
+        if isinstance(value, dict):
+            metrics.update(_suite_metrics(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and key not in ('docs', 'queries'):
+            metrics[f"{prefix}{key}"] = value
+
+    return metrics
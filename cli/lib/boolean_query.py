@@ -0,0 +1,293 @@
+"""
+    boolean_query
+
+        Boolean keyword queries over sorted postings:
+
+            bear AND (jungle OR forest) NOT hunting
+            "jurassic park" OR dinosaurs
+
+        parse_query()   query -> tree of ('term', token), ('phrase', offsets),
+                        ('and', [nodes]), ('or', [nodes]), ('not', node).
+                        Precedence NOT > AND > OR, (...) groups, operators
+                        are upper case, `a NOT b` is `a AND NOT b`. Words
+                        without an operator between them are joined by
+                        default_operator. Words are analyzed like the
+                        documents (stop words drop out of the query).
+        evaluate()      matching docnums of one segment, sorted
+
+        A malformed query (`bear AND`, `(bear`, ...) raises QueryError, a
+        ValueError whose message is meant for the user.
+
+        Without positions in the index a phrase can't be matched:
+        phrases_as_terms() turns it into the AND of its tokens (what a
+        quoted phrase matched before phrases existed).
+
+        An AND evaluates its rarest operand only: the other operands
+        filter those candidates. A rare term probes its postings with
+        galloping search through the candidates, a common one is looked up
+        per candidate through its block skip pointers (only the blocks
+        holding candidates are decoded), so AND of common terms never
+        builds their full postings or union.
+
+        Postings come from a source (one per segment):
+            source.no_of_docs           docnums are 0..no_of_docs-1
+            source.live(docnums)        docnums without the deleted ones
+            source.df(token)            no. of postings of token (estimate)
+            source.postings(token)      sorted live docnums of token
+            source.contains(token)      f(docnum) -> bool, for increasing docnums
+            source.phrase(offsets)      sorted live docnums matching a phrase
+"""
+from bisect import bisect_left
+from itertools import chain
+import re
+
+# "phrase", parenthesis or word (a lone quote is dropped)
+_QUERY_TOKEN = re.compile(r'"[^"]*"|[()]|[^\s()"]+')
+
+
+class QueryError(ValueError):
+    """ a malformed query """
+
+
+def parse_query(query, analyzer, default_operator='OR'):
+    """
+    Docstring for parse_query
+
+    :param query: raw query text
+    :param analyzer: lib/preprocessing.py Analyzer
+    :param default_operator: 'OR' (a plain query matches any token) or 'AND'
+    :return: tree of the query, None if nothing is left to match
+    """
+    return _Parser(_QUERY_TOKEN.findall(query), analyzer, default_operator).parse()
+
+
+class _Parser:
+    """ recursive descent, one method per precedence level """
+    def __init__(self, tokens, analyzer, default_operator):
+        if default_operator not in ('AND', 'OR'):
+            raise ValueError(f"Unknown default operator: {default_operator}")
+        self.tokens = tokens
+        self.position = 0
+        self.analyzer = analyzer
+        self.default_operator = default_operator
+
+    def parse(self):
+        if not self.tokens:
+            return None
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise QueryError(f"Unexpected {self.peek()!r} in query")
+        return node
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        if token is None:
+            raise QueryError("Query ends with an operator")
+        self.position += 1
+        return token
+
+    def starts_operand(self):
+        return self.peek() not in (None, ')', 'AND', 'OR')
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() == 'OR' or (self.default_operator == 'OR' and self.starts_operand()):
+            if self.peek() == 'OR':
+                self.take()
+            nodes.append(self.parse_and())
+        return _combine('or', nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_not()]
+        while self.peek() in ('AND', 'NOT') or (self.default_operator == 'AND' and self.starts_operand()):
+            if self.peek() == 'AND':
+                self.take()
+            nodes.append(self.parse_not())
+        return _combine('and', nodes)
+
+    def parse_not(self):
+        if self.peek() == 'NOT':
+            self.take()
+            node = self.parse_not()
+            return None if node is None else ('not', node)
+        return self.parse_primary()
+
+    def parse_primary(self):
+        token = self.take()
+
+        if token == '(':
+            node = self.parse_or() if self.peek() != ')' else None
+            if self.peek() != ')':
+                raise QueryError("Unbalanced parenthesis in query")
+            self.take()
+            return node
+
+        if token in (')', 'AND', 'OR'):
+            raise QueryError(f"Unexpected {token!r} in query")
+
+        if token.startswith('"'):
+            tokens, positions = self.analyzer.analyze_with_positions(token.strip('"'))
+            if len(tokens) < 2:
+                return ('term', tokens[0]) if tokens else None
+            offsets = {}
+            for analyzed, position in zip(tokens, positions):
+                offsets.setdefault(analyzed, []).append(position - positions[0])
+            return ('phrase', offsets)
+
+        return _combine('and', [('term', analyzed) for analyzed in self.analyzer.analyze(token)])
+
+
+def _combine(operator, nodes):
+    """ drops empty operands (stop words), flattens a single operand & nested same operators """
+    children = []
+    for node in nodes:
+        if node is None:
+            continue
+        children.extend(node[1] if node[0] == operator else [node])
+
+    if not children:
+        return None
+    return children[0] if len(children) == 1 else (operator, children)
+
+
+def phrases_as_terms(node):
+    """ node with every ('phrase', offsets) replaced by the AND of its tokens """
+    if node is None:
+        return None
+    match node[0]:
+        case 'term':
+            return node
+        case 'phrase':
+            return _combine('and', [('term', token) for token in node[1]])
+        case 'not':
+            return ('not', phrases_as_terms(node[1]))
+        case _:
+            return _combine(node[0], [phrases_as_terms(child) for child in node[1]])
+
+
+def query_terms(node):
+    """ tokens of the query that a match contains (not the negated ones), in query order """
+    if node is None:
+        return []
+    match node[0]:
+        case 'term':
+            return [node[1]]
+        case 'phrase':
+            return list(node[1])
+        case 'not':
+            return []
+        case _:
+            return list(chain.from_iterable(query_terms(child) for child in node[1]))
+
+
+def estimate(node, source):
+    """ upper bound of the no. of documents node matches (order of evaluation) """
+    match node[0]:
+        case 'term':
+            return source.df(node[1])
+        case 'phrase':
+            return min(source.df(token) for token in node[1])
+        case 'and':
+            return min((estimate(child, source) for child in node[1] if child[0] != 'not'),
+                       default=source.no_of_docs)
+        case 'or':
+            return min(source.no_of_docs, sum(estimate(child, source) for child in node[1]))
+        case 'not':
+            return source.no_of_docs
+
+
+def evaluate(node, source):
+    """ sorted live docnums matching node """
+    match node[0]:
+        case 'term':
+            return source.postings(node[1])
+        case 'phrase':
+            return source.phrase(node[1])
+        case 'or':
+            return sorted(set(chain.from_iterable(evaluate(child, source) for child in node[1])))
+        case 'not':
+            return _filter(node, source.live(range(source.no_of_docs)), source)
+        case 'and':
+            children = _by_selectivity(node[1], source)
+            if children[0][0] == 'not':
+                candidates = source.live(range(source.no_of_docs))     # only negations
+            else:
+                candidates = evaluate(children.pop(0), source)
+
+            for child in children:
+                if not candidates:
+                    break
+                candidates = _filter(child, candidates, source)
+            return candidates
+
+
+def _by_selectivity(children, source):
+    """ rarest first, negations last (they only remove candidates) """
+    return sorted(children, key=lambda child: (child[0] == 'not', estimate(child, source)))
+
+
+def _filter(node, candidates, source):
+    """ the candidates (sorted docnums) that match node """
+    match node[0]:
+        case 'term':
+            df = source.df(node[1])
+            if df < len(candidates):
+                return intersect(source.postings(node[1]), candidates)
+            contains = source.contains(node[1])
+            return [docnum for docnum in candidates if contains(docnum)]
+        case 'phrase':
+            return intersect(source.phrase(node[1]), candidates)
+        case 'and':
+            for child in _by_selectivity(node[1], source):
+                if not candidates:
+                    break
+                candidates = _filter(child, candidates, source)
+            return candidates
+        case 'or':
+            matched, remaining = set(), candidates
+            for child in node[1]:
+                matched.update(_filter(child, remaining, source))
+                remaining = [docnum for docnum in remaining if docnum not in matched]
+            return [docnum for docnum in candidates if docnum in matched]
+        case 'not':
+            return difference(candidates, _filter(node[1], candidates, source))
+
+
+def gallop(values, target, low=0):
+    """ first index >= low of the sorted values with values[i] >= target (len(values) if none):
+        steps of 1, 2, 4, ... from low, then a binary search in the last step """
+    step, high = 1, low
+    while high < len(values) and values[high] < target:
+        low = high + 1
+        high += step
+        step *= 2
+    return bisect_left(values, target, low, min(high, len(values)))
+
+
+def intersect(a, b):
+    """ sorted values in both sorted lists: every value of the shorter one is
+        galloped to in the longer one, O(len(short) * log(len(long) / len(short))) """
+    if len(a) > len(b):
+        a, b = b, a
+
+    result, i = [], 0
+    for value in a:
+        i = gallop(b, value, i)
+        if i == len(b):
+            break
+        if b[i] == value:
+            result.append(value)
+    return result
+
+
+def difference(a, b):
+    """ sorted values of a that aren't in b (both sorted) """
+    result, i = [], 0
+    for value in a:
+        i = gallop(b, value, i)
+        if i == len(b) or b[i] != value:
+            result.append(value)
+    return result
@@ -0,0 +1,35 @@
+"""
+    chunking
+
+        Splits long text into chunks for embedding. Pure string
+        operations (no NumPy / model imports), so the chunking commands
+        start instantly.
+"""
+import re
+
+
+def semantic_chunk(text, chunk_size, overlap):
+    """
+    Implements Semantic Chunk bases on grouping
+    text into sentences.
+
+    :param text:    text to be chunked
+    :param chunk_size: size of each chunk
+    :param overlap: overlapping between two chunks
+    """
+    if overlap >= chunk_size:
+        raise ValueError("Overlap cann't be bigger than chunk size")
+            
+    # split text based on sentences
+    sentences = re.split(r"(?<=[.!?])\s+", text)
+
+    res = []
+    for i in range(0, len(sentences), chunk_size-overlap):
+        chunk = sentences[i:i+chunk_size]
+                
+        if len(chunk) <= overlap:
+            break
+                
+        res.append(" ".join(chunk))
+
+    return res
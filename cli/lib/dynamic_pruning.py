@@ -0,0 +1,282 @@
+"""
+    dynamic_pruning
+
+        Top-k BM25 retrieval that skips documents which cannot make it
+        into the results (WAND & Block-Max WAND).
+
+        Every query token gets a PostingCursor walking its postings in
+        doc_id order (decoding one block at a time). Each cursor knows an upper bound of the score it
+        can add to a document - for the whole postings list (max_score)
+        and for every block of BM25_BLOCK_SIZE postings (block maxima).
+
+        top_k() keeps the best `limit` documents in a bounded min-heap.
+        Once the heap is full its smallest score is the threshold, and
+        a document is only scored when the upper bounds of the cursors
+        on it can beat that threshold.
+
+        Results (rounding, tie-breaking) are identical to scoring every
+        document exhaustively.
+
+        score_at_a_time() works on impact-ordered postings instead (8-bit
+        quantized BM25 scores, highest first) and stops as soon as the
+        remaining impacts can't change which documents are in the top-k.
+"""
+from collections import defaultdict
+import heapq
+from bisect import bisect_left
+from operator import attrgetter
+
+# doc_id of an exhausted cursor (compares greater than any doc_id)
+END = float('inf')
+
+# slack for float rounding between summed bounds & summed scores,
+# a document is only pruned if its bound is below the threshold by this much
+EPSILON = 1e-9
+
+
+class PostingCursor:
+    """
+    Walks the postings of a single token, one block at a time.
+
+    A block is only decoded when the cursor actually lands in it, skipped
+    blocks are never read. A block may come back with fewer postings than
+    it was written with (deleted documents), even none.
+
+    :param blocks: list of (last_doc_id, max_tf, min_doc_length), one per block
+    :param read_block: read_block(i) -> (doc_ids, tfs, doc_lengths) of the i-th block
+    :param score_fn: score_fn(tf, doc_length) -> BM25 score of the token
+    :param bound_fn: bound_fn(max_tf, min_doc_length) -> upper bound of
+                     the BM25 score of the token in a block
+    :param weight: no. of times the token occurs in the query
+    """
+    def __init__(self, blocks, read_block, score_fn, bound_fn, weight=1):
+        self.read_block = read_block
+        self.score_fn = score_fn
+
+        self.block_last = [last_doc_id for last_doc_id, _, _ in blocks]
+        self.block_max = [weight * bound_fn(max_tf, min_doc_length)
+                          for _, max_tf, min_doc_length in blocks]
+        self.max_score = max(self.block_max, default=0.0)
+
+        # current block (decoded) & position inside it
+        self.block = -1
+        self.block_doc_ids = []
+        self.block_tfs = []
+        self.block_doc_lengths = []
+        self.position = 0
+        # current doc_id (END once the postings are exhausted)
+        self.doc_id = END
+        self._load_block(0, 0)
+
+    def score(self):
+        """ BM25 score of the token in the current doc """
+        return self.score_fn(self.block_tfs[self.position], self.block_doc_lengths[self.position])
+
+    def next(self):
+        self.position += 1
+        if self.position < len(self.block_doc_ids):
+            self.doc_id = self.block_doc_ids[self.position]
+        else:
+            self._load_block(self.block + 1, 0)
+
+    def next_geq(self, target):
+        """ moves to the first doc_id >= target, skipping whole blocks """
+        if self.doc_id >= target:
+            return
+
+        block = self._block_of(target)
+        if block == self.block:
+            self.position = bisect_left(self.block_doc_ids, target, self.position)
+            if self.position < len(self.block_doc_ids):
+                self.doc_id = self.block_doc_ids[self.position]
+            else:
+                self._load_block(block + 1, target)
+        else:
+            self._load_block(block, target)
+
+    def block_max_score(self, target):
+        """ upper bound of the score in the block that would hold target """
+        block = self._block_of(target)
+        if block == len(self.block_last):
+            return 0.0  # target is past the last posting
+        return self.block_max[block]
+
+    def block_last_doc(self, target):
+        """ last doc_id of the block that would hold target """
+        block = self._block_of(target)
+        if block == len(self.block_last):
+            return END
+        return self.block_last[block]
+
+    def _load_block(self, block, target):
+        """ decodes `block` and moves to its first doc_id >= target
+            (to the following blocks if it has none left) """
+        while block < len(self.block_last):
+            self.block_doc_ids, self.block_tfs, self.block_doc_lengths = self.read_block(block)
+            position = bisect_left(self.block_doc_ids, target)
+
+            if position < len(self.block_doc_ids):
+                self.block = block
+                self.position = position
+                self.doc_id = self.block_doc_ids[position]
+                return
+            block += 1
+
+        self.block = len(self.block_last)
+        self.block_doc_ids, self.block_tfs, self.block_doc_lengths = [], [], []
+        self.position = 0
+        self.doc_id = END
+
+    def _block_of(self, target):
+        block = max(self.block, 0)
+        if block < len(self.block_last) and self.block_last[block] >= target:
+            return block    # target is inside the current block
+        return bisect_left(self.block_last, target, block)
+
+
+def top_k(cursors, score_order, limit, block_max=True):
+    """
+    Docstring for top_k
+
+        WAND (block_max=False) / Block-Max WAND (block_max=True)
+
+    :param cursors: one PostingCursor per distinct query token (and segment)
+    :param score_order: cursors in query token order (repeats included);
+                        a document's score is summed in this order, so it
+                        matches term-at-a-time scoring bit for bit
+    :param limit: no. of results
+    :param block_max: also check block maxima before scoring a document
+    :return: ([(doc_id, score), ...] best first, no. of documents scored)
+    """
+    if limit <= 0:
+        return [], 0
+
+    # min-heap of (score, -doc_id): the root is the worst result kept.
+    # docs arrive in increasing doc_id order, so a later doc with the same
+    # (rounded) score never replaces the root - ties go to the lower doc_id
+    heap = []
+    docs_scored = 0
+    cursors = list(cursors)
+    by_doc_id = attrgetter('doc_id')
+
+    while True:
+        threshold = heap[0][0] if len(heap) == limit else -END
+
+        cursors.sort(key=by_doc_id)
+
+        # pivot: first cursor where the summed max scores can beat threshold
+        upper_bound = 0.0
+        pivot = None
+        for i, cursor in enumerate(cursors):
+            if cursor.doc_id == END:
+                break
+            upper_bound += cursor.max_score
+            if upper_bound + EPSILON > threshold:
+                pivot = i
+                break
+
+        if pivot is None:
+            break   # no remaining document can enter the top-k
+
+        pivot_doc = cursors[pivot].doc_id
+        # cursors already sitting on the pivot doc also contribute to it
+        while pivot + 1 < len(cursors) and cursors[pivot + 1].doc_id == pivot_doc:
+            pivot += 1
+
+        if block_max:
+            block_bound = sum(cursor.block_max_score(pivot_doc) for cursor in cursors[:pivot + 1])
+
+            if block_bound + EPSILON <= threshold:
+                # nothing before the end of the shallowest block can qualify
+                next_doc = min(cursor.block_last_doc(pivot_doc) for cursor in cursors[:pivot + 1]) + 1
+                if pivot + 1 < len(cursors):
+                    next_doc = min(next_doc, cursors[pivot + 1].doc_id)
+
+                for cursor in cursors[:pivot + 1]:
+                    cursor.next_geq(next_doc)
+                continue
+
+        if cursors[0].doc_id == pivot_doc:
+            score = 0.0
+            for cursor in score_order:
+                if cursor.doc_id == pivot_doc:
+                    score += cursor.score()
+            score = round(score, 2)
+            docs_scored += 1
+
+            if len(heap) < limit:
+                heapq.heappush(heap, (score, -pivot_doc))
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, (score, -pivot_doc))
+
+            for cursor in cursors[:pivot + 1]:
+                cursor.next()
+        else:
+            # docs before the pivot can't qualify, jump straight to it
+            for cursor in cursors[:pivot]:
+                cursor.next_geq(pivot_doc)
+
+    results = sorted(((-neg_doc_id, score) for score, neg_doc_id in heap),
+                     key=lambda item: (-item[1], item[0]))
+
+    return results, docs_scored
+
+
+def score_at_a_time(impact_postings, limit):
+    """
+    Docstring for score_at_a_time
+
+        Accumulates integer impacts, highest impact group first across all
+        query tokens. Stops once the k-th best accumulator can't be caught
+        by the (k+1)-th one, nor by an unseen document, even if they got
+        every impact still unread.
+
+    :param impact_postings: [(groups, weight), ...] one per distinct query
+                            token, groups yields (impact, doc_ids) with the
+                            highest impact first
+    :param limit: no. of results
+    :return: (doc_ids of the top `limit` documents, no. of postings read)
+    """
+    if limit <= 0:
+        return [], 0
+
+    accumulators = defaultdict(int)
+    best = 0    # highest accumulator so far
+    postings_read = 0
+
+    # next unread group of every token: (-contribution, token no., doc_ids)
+    pending = []
+
+    def push_next_group(i):
+        groups, weight = impact_postings[i]
+        group = next(groups, None)
+        if group is not None:
+            impact, doc_ids = group
+            heapq.heappush(pending, (-impact * weight, i, doc_ids))
+
+    for i in range(len(impact_postings)):
+        push_next_group(i)
+
+    while pending:
+        neg_contribution, i, doc_ids = heapq.heappop(pending)
+        for doc_id in doc_ids:
+            accumulators[doc_id] -= neg_contribution
+            best = max(best, accumulators[doc_id])
+        postings_read += len(doc_ids)
+
+        push_next_group(i)
+
+        # pending holds one group per token, i.e max score still to come
+        remaining = -sum(contribution for contribution, _, _ in pending)
+
+        if remaining < best and len(accumulators) >= limit:
+            top = heapq.nlargest(limit + 1, accumulators.values())
+            kth = top[limit - 1]
+            next_best = top[limit] if len(top) > limit else 0
+
+            if kth > next_best + remaining and kth > remaining:
+                break   # the top-k set can't change any more
+
+    top_k = heapq.nlargest(limit, accumulators.items(), key=lambda item: (item[1], -item[0]))
+
+    return [doc_id for doc_id, _ in top_k], postings_read
@@ -0,0 +1,183 @@
+"""
+    embedding_store
+
+        Keeps an embedding matrix (.npy, one row per text) in sync with its
+        texts, re-encoding only what changed.
+
+        Next to <name>.npy a manifest <name>.manifest.json records
+
+            model   -> name of the model the rows were encoded with
+            dim     -> no. of dimensions of a row
+            hashes  -> content hash of the text of every row (in row order)
+
+        update_embeddings() hashes the current texts: rows whose hash is in
+        the manifest are copied from the old matrix (whatever their old
+        position), only new or edited texts are encoded. Another model,
+        another dimension or a matrix without manifest -> every text is
+        encoded.
+
+        Missing texts are encoded `window` at a time (sorted by length, so
+        a batch needs little padding) straight into a preallocated
+        <name>.npy.tmp memmap. <name>.progress.json checkpoints every
+        finished window: an interrupted update resumes where it stopped.
+
+        Files derived from the matrix (<name>.*.npz, the IVF index &
+        compressed codes) are deleted when it changes, they are rebuilt on
+        next use.
+"""
+from pathlib import Path
+from time import perf_counter
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from lib import profiling
+from parameters import EMBEDDING_BATCH_SIZE, EMBEDDING_WINDOW
+
+# rows copied from the old matrix at once
+_COPY_BATCH = 8192
+
+
+def content_hash(text):
+    """ 128 bit hash (hex) of a text """
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def manifest_path(path):
+    """ <name>.manifest.json of <name>.npy """
+    path = Path(path)
+    return path.with_name(f"{path.stem}.manifest.json")
+
+
+def update_embeddings(path, texts, model_name, encode, reuse=True,
+                      batch_size=EMBEDDING_BATCH_SIZE, window=EMBEDDING_WINDOW):
+    """
+    Docstring for update_embeddings
+
+    :param path: of the .npy matrix (& its manifest), written if stale
+    :param texts: one text per row, in row order
+    :param model_name: the rows of another model are never reused
+    :param encode: encodes a list of texts to (no. of texts, dim) embeddings
+    :param reuse: False -> encodes every text (full rebuild)
+    :param batch_size: texts per encode() call
+    :param window: texts sorted by length & checkpointed together
+    :return: (embeddings memory-mapped read only,
+              {'encoded':, 'reused':, 'resumed':, 'seconds':, 'items_per_second':, 'peak_rss_mb':})
+    """
+    start_time = perf_counter()
+    path = Path(path)
+    hashes = [content_hash(text) for text in texts]
+    manifest, old_embeddings = _load(path, model_name) if reuse else (None, None)
+
+    if manifest is not None and manifest['hashes'] == hashes:
+        return old_embeddings, _report(0, len(hashes), 0, start_time)     # up to date
+
+    old_rows = {}
+    if manifest is not None:
+        old_rows = {digest: row for row, digest in enumerate(manifest['hashes'])}
+    missing = [i for i, digest in enumerate(hashes) if digest not in old_rows]
+
+    # written next to the old matrix (still mapped), then swapped in
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    job = content_hash(json.dumps([model_name, hashes, missing]))
+    embeddings, done = _resume(path, tmp_path, job, len(texts))
+
+    if embeddings is None and manifest is not None:
+        embeddings = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(len(texts), manifest['dim']))
+
+    if embeddings is not None:
+        reused = np.array([i for i, digest in enumerate(hashes) if digest in old_rows], dtype=np.int64)
+        for start in range(0, len(reused), _COPY_BATCH):
+            rows = reused[start:start + _COPY_BATCH]
+            embeddings[rows] = old_embeddings[[old_rows[hashes[i]] for i in rows]]
+
+    for window_start in range(done, len(missing), window):
+        # similar lengths in a batch -> little padding
+        rows = sorted(missing[window_start:window_start + window], key=lambda i: len(texts[i]))
+
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            batch_embeddings = np.asarray(encode([texts[i] for i in batch]), dtype=np.float32)
+
+            if embeddings is None:  # first batch of a new matrix -> dimension known
+                embeddings = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32,
+                                                       shape=(len(texts), batch_embeddings.shape[1]))
+            embeddings[batch] = batch_embeddings
+
+        embeddings.flush()
+        _write_json(_progress_path(path), {'job': job, 'done': window_start + len(rows)})
+
+    if embeddings is None:  # no texts at all
+        embeddings = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(0, 0))
+    dim = embeddings.shape[1]
+
+    embeddings.flush()
+    del embeddings
+
+    # the old manifest must not describe the new matrix (if interrupted
+    # before the new manifest is written -> full rebuild next time)
+    manifest_path(path).unlink(missing_ok=True)
+    os.replace(tmp_path, path)
+    _progress_path(path).unlink(missing_ok=True)
+
+    _write_json(manifest_path(path), {'model': model_name, 'dim': dim, 'hashes': hashes})
+
+    for derived in path.parent.glob(f"{path.stem}.*.npz"):
+        derived.unlink(missing_ok=True)
+
+    return np.load(path, mmap_mode='r'), _report(len(missing) - done, len(texts) - len(missing), done, start_time)
+
+
+def _load(path, model_name):
+    """ (manifest, memory-mapped matrix) if both exist & match model_name, else (None, None) """
+    try:
+        with open(manifest_path(path)) as f:
+            manifest = json.load(f)
+        embeddings = np.load(path, mmap_mode='r')
+    except (FileNotFoundError, ValueError):
+        return None, None
+
+    if manifest.get('model') != model_name or embeddings.shape != (len(manifest['hashes']), manifest['dim']):
+        return None, None
+
+    return manifest, embeddings
+
+
+def _resume(path, tmp_path, job, no_of_rows):
+    """ (partly written matrix, no. of missing texts encoded) of an interrupted
+        run of the same job, else (None, 0) """
+    try:
+        with open(_progress_path(path)) as f:
+            progress = json.load(f)
+        embeddings = np.load(tmp_path, mmap_mode='r+')
+    except (FileNotFoundError, ValueError):
+        return None, 0
+
+    if progress.get('job') != job or len(embeddings) != no_of_rows:
+        return None, 0      # another job (texts, model or reuse changed since)
+
+    return embeddings, progress['done']
+
+
+def _progress_path(path):
+    """ <name>.progress.json, checkpoint of an unfinished update of <name>.npy """
+    return path.with_name(f"{path.stem}.progress.json")
+
+
+def _report(no_of_encoded, no_of_reused, no_of_resumed, start_time):
+    seconds = perf_counter() - start_time
+    return {'encoded': no_of_encoded,
+            'reused': no_of_reused,
+            'resumed': no_of_resumed,
+            'seconds': seconds,
+            'items_per_second': no_of_encoded / seconds if seconds > 0 else 0.0,
+            'peak_rss_mb': profiling.peak_rss_mb()}
+
+
+def _write_json(path, data):
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,133 @@
+"""
+    hybrid_search
+
+        Keyword (BM25, lib/inverted_index.py) + semantic (embeddings,
+        lib/semantic_search.py) search fused into one ranking
+        {refer lib/rank_fusion.py}.
+
+        Both retrievers run concurrently in a thread pool: loading them
+        (index segments / embedding model & embeddings) and every query.
+        Encoding the query & the NumPy matrix products release the GIL,
+        so a hybrid query takes about as long as the slower retriever,
+        not the sum of both.
+
+        Each retriever only returns limit * HYBRID_CANDIDATE_FACTOR
+        candidates: a document ranked below that by both of them can't
+        make the fused top `limit` in practice.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from lib.preprocessing import GetData
+from lib.inverted_index import InvertedIndex
+from lib.semantic_search import SemanticSearch
+from lib.rank_fusion import fuse_rrf, fuse_weighted
+from parameters import (RRF_K, HYBRID_ALPHA, HYBRID_CANDIDATE_FACTOR,
+                        BM25_SEARCH_STRATEGY, ANN_NPROBE, EMBEDDING_STORAGE)
+
+
+class HybridSearch:
+    """
+    :param documents: movies (list[dict]) the embeddings are built for
+    :param ann: semantic search with the IVF index {refer lib/ann.py}
+    :param storage: embedding storage {refer lib/quantization.py}
+    :param inverted_index, semantic_search: already loaded retrievers
+                                            (search server), nothing is loaded
+    """
+    def __init__(self, documents=None, ann=False, storage=EMBEDDING_STORAGE, inverted_index=None, semantic_search=None):
+        self.executor = ThreadPoolExecutor(max_workers=2)
+
+        if inverted_index is None or semantic_search is None:
+            index_loaded = self.executor.submit(self._load_index)
+            semantic_loaded = self.executor.submit(self._load_semantic_search, documents, ann, storage)
+            inverted_index, semantic_search = index_loaded.result(), semantic_loaded.result()
+
+        self.inverted_index = inverted_index
+        self.semantic_search = semantic_search
+
+        # seconds taken by each retriever & in total, of the last search
+        self.timings = {}
+
+    def search(self, query, limit, method='rrf', k=RRF_K, alpha=HYBRID_ALPHA,
+               strategy=BM25_SEARCH_STRATEGY, nprobe=ANN_NPROBE):
+        """
+        Docstring for search
+
+        :param query: user query
+        :param limit: no. of results
+        :param method: 'rrf' (reciprocal rank fusion) or 'weighted'
+                       (min-max normalized scores)
+        :param k: of rrf
+        :param alpha: weighted -> alpha * bm25 + (1 - alpha) * semantic
+        :param strategy: BM25 top-k strategy {refer InvertedIndex.bm25_search}
+        :param nprobe: clusters scanned (semantic search with an ANN index)
+        :return: [{'id':, 'title':, 'description':, 'score':,
+                   'bm25_rank':, 'semantic_rank':}, ...] best first,
+                 a rank is None if that retriever did not return the movie
+        """
+        start = perf_counter()
+        depth = limit * HYBRID_CANDIDATE_FACTOR
+
+        bm25_done = self.executor.submit(self._timed, self.inverted_index.bm25_search, query, depth, strategy)
+        semantic_done = self.executor.submit(self._timed, self.semantic_search.search, query, depth, nprobe)
+        (bm25_results, bm25_seconds), (semantic_results, semantic_seconds) = bm25_done.result(), semantic_done.result()
+
+        semantic_scores = {res['id']: res['score'] for res in semantic_results}
+        if method == 'rrf':
+            fused = fuse_rrf([bm25_results, semantic_scores], limit, k)
+        elif method == 'weighted':
+            fused = fuse_weighted([bm25_results, semantic_scores], limit, [alpha, 1 - alpha])
+        else:
+            raise ValueError(f"Unknown fusion method: {method}")
+
+        bm25_ranks = {doc_id: rank for rank, doc_id in enumerate(bm25_results, start=1)}
+        semantic_ranks = {doc_id: rank for rank, doc_id in enumerate(semantic_scores, start=1)}
+
+        results = []
+        for doc_id, score in fused:
+            doc = self.semantic_search.document_map.get(doc_id) or self.inverted_index.get_document(doc_id)
+            results.append({'id': doc_id,
+                            'title': doc['title'],
+                            'description': doc['description'],
+                            'score': score,
+                            'bm25_rank': bm25_ranks.get(doc_id),
+                            'semantic_rank': semantic_ranks.get(doc_id)})
+
+        self.timings = {'bm25': bm25_seconds, 'semantic': semantic_seconds, 'total': perf_counter() - start}
+        return results
+
+    def close(self):
+        self.executor.shutdown()
+
+    @staticmethod
+    def _load_index():
+        inverted_index = InvertedIndex()
+        inverted_index.load_index()
+        return inverted_index
+
+    @staticmethod
+    def _load_semantic_search(documents, ann, storage):
+        semantic_search = SemanticSearch(storage=storage)
+        semantic_search.load_or_create_embeddings(documents)
+        if ann:
+            semantic_search.load_or_create_ann_index()
+        return semantic_search
+
+    @staticmethod
+    def _timed(fn, *args):
+        start = perf_counter()
+        result = fn(*args)
+        return result, perf_counter() - start
+
+
+def hybrid_search(query, limit, method='rrf', ann=False, storage=EMBEDDING_STORAGE, **options):
+    """ HybridSearch over data/movies.json, returns (results, timings) """
+    documents = GetData('movies.json').get_file_data_json()['movies']
+
+    searcher = HybridSearch(documents, ann, storage)
+    try:
+        results = searcher.search(query, limit, method, **options)
+    finally:
+        searcher.close()
+
+    return results, searcher.timings
@@ -1,55 +1,236 @@
 from pathlib import Path
 from math import log
-from operator import itemgetter
-from collections import defaultdict, Counter
-import pickle
+from collections import defaultdict, Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import chain, islice, repeat
+from time import perf_counter
+import heapq
+import json
+import os
+import uuid
 
-from lib.preprocessing import Preprocessing, GetData
-from parameters import BM25_K1, BM25_B
+from lib import profiling
+from lib.preprocessing import get_analyzer, GetData
+from lib.dynamic_pruning import PostingCursor, top_k, score_at_a_time
+from lib.boolean_query import parse_query, evaluate, query_terms, phrases_as_terms
+from lib.result_cache import get_result_cache, result_key
+from lib.segment import (Segment, DocumentSpool, TermReader, FIELDS, write_segment, write_deletions, read_deletions,
+                         load_manifest, save_manifest, new_manifest_entry)
+from parameters import (BM25_K1, BM25_B, BM25_BLOCK_SIZE, BM25_SEARCH_STRATEGY, BM25_IMPACT_LEVELS,
+                        BUILD_WORKERS, BUILD_SHARD_SIZE, INDEX_MAX_SEGMENTS, PROXIMITY_WEIGHT, PROXIMITY_CANDIDATES,
+                        BOOLEAN_DEFAULT_OPERATOR, BM25F_FIELDS)
 
 file_path = Path(__file__).resolve().parents[2]/'cache'
+manifest_filename = 'index_manifest.json'
+
+
+def document_text(movie):
+    """ the text of a movie that gets indexed """
+    return f"{movie['title']} {movie['description']}"
+
+
+def split_phrases(query):
+    """
+    Docstring for split_phrases
+
+        'toy "jurassic park" dinosaurs' -> (['jurassic park'], 'toy  jurassic park  dinosaurs')
+        An unbalanced quote is ignored (no phrase).
+
+    :return: ([phrase, ...], the query without the quotes)
+    """
+    parts = query.split('"')
+    if len(parts) % 2 == 0:
+        return [], query.replace('"', ' ')
+
+    return [phrase for phrase in parts[1::2] if phrase.strip()], " ".join(parts)
+
+
+def build_partial_index(movies, positions=False):
+    """
+    Docstring for build_partial_index:
+        * Tokenizes title + description of every movie
+        * for each token, stores the doc_id in index
+        * counts token frequencies & document length
+        * counts the title's token frequencies & length (BM25F, the
+          description's are the rest: its tokens follow the title's)
+        * optionally records the positions of every token
+
+    Runs inside the process-pool workers of InvertedIndex.build()
+
+    :param movies: contiguous shard of the movies list
+    :param positions: also return {doc_id: {token: [position, ...]}}
+    :return: (index, term_frequencies, doc_lengths, term_positions or None,
+              title_lengths, title_frequencies) of the shard
+    """
+    index = defaultdict(list)
+    term_frequencies = defaultdict(Counter)
+    doc_lengths = {}
+    term_positions = {} if positions else None
+    title_lengths = {}
+    title_frequencies = {}
+
+    analyzer = get_analyzer()
+    for movie in movies:
+        doc_id = movie['id']
+        if positions:
+            tokens, token_positions = analyzer.analyze_with_positions(document_text(movie))
+            term_positions[doc_id] = defaultdict(list)
+            for token, position in zip(tokens, token_positions):
+                term_positions[doc_id][token].append(position)
+        else:
+            tokens = analyzer.analyze(document_text(movie))
+
+        doc_lengths[doc_id] = len(tokens)
+        # count frequency of term in a given document object
+        term_frequencies[doc_id].update(tokens)
+
+        title_tokens = analyzer.analyze(movie['title'])
+        title_lengths[doc_id] = len(title_tokens)
+        if title_tokens:
+            title_frequencies[doc_id] = Counter(title_tokens)
+
+        for token in set(tokens):
+            # add list elements in index
+            # key=token is initilized, if not available
+            index[token].append(doc_id)
+
+    return index, term_frequencies, doc_lengths, term_positions, title_lengths, title_frequencies
+
+
+def _bounded_map(executor, fn, items, window):
+    """ executor.map() that keeps at most `window` items in flight, so
+        `items` (a stream) is consumed only as fast as results come back """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+class _SegmentPostings:
+    """ postings of one segment for lib/boolean_query.py evaluate() """
+    def __init__(self, inverted_index, segment):
+        self.inverted_index = inverted_index
+        self.segment = segment
+        self.no_of_docs = segment.no_of_docs
+
+    def live(self, docnums):
+        deleted = self.segment.deleted
+        return [docnum for docnum in docnums if docnum not in deleted]
+
+    def df(self, token):
+        term_id = self.segment.term_id(token)
+        return 0 if term_id is None else self.segment.df(term_id)
+
+    def postings(self, token):
+        term_id = self.segment.term_id(token)
+        if term_id is None:
+            return []
+        with profiling.span('boolean.postings'):
+            docnums, _ = self.segment.postings(term_id)
+        return self.live(docnums)
+
+    def contains(self, token):
+        term_id = self.segment.term_id(token)
+        if term_id is None:
+            return lambda docnum: False
+        reader = TermReader(self.segment, term_id)
+        return lambda docnum: reader.find(docnum) is not None
+
+    def phrase(self, offsets):
+        if not self.segment.has_positions:
+            raise ValueError("The index has no token positions, rebuild it with `build --positions`")
+        return self.inverted_index._phrase_docnums(self.segment, offsets)
 
 
 class InvertedIndex:
-    def __init__(self):
+    """
+    :param directory: of the index files, the manifest & the result cache
+                      (default: the repo's cache/)
+    """
+    def __init__(self, directory=None):
+        self.directory = Path(directory) if directory is not None else file_path
         # mapping tokens (strings) to sets of document IDs (integers)
         self.index = defaultdict(list)
         # mapping document IDs to their full document objects
-        self.docmap = {}
+        # (json-serialized, spooled to a temporary file until saved)
+        self.docmap = DocumentSpool()
         # mapping document IDs to Counter object i.e {doc_id: {token: frequency, ...},.... }
         self.term_frequencies = defaultdict(Counter)
         # maps document IDs to its Size (no. of tokens) i.e {doc_id: size,...}
         self.doc_lengths = {}
+        # maps tokens to their quantized BM25 score per document
+        # i.e {token: {doc_id: impact,...},...} (only built on request)
+        self.impacts = None
+        self.impact_meta = None
+        # maps document IDs to the positions of their tokens
+        # i.e {doc_id: {token: [position,...]},...} (only built on request)
+        self.term_positions = None
+        # title statistics (BM25F): {doc_id: no. of title tokens} &
+        # {doc_id: {token: tf in the title}} (docs with a title only)
+        self.title_lengths = {}
+        self.title_frequencies = {}
+
+        # memory-mapped index segments & the manifest listing them,
+        # opened by load_index()
+        self.segments = None
+        self.manifest = None
+        # corpus statistics, filled by load_index()
+        self.no_of_docs = 0
+        self.avg_doc_length = 0.0
+        # avg. length of every field {refer lib/segment.py FIELDS}
+        self.avg_field_lengths = (0.0, 0.0)
+        # maps tokens to their BM25 IDF score i.e {token: bm25_idf,...}
+        # (filled on first use of a token)
+        self.bm25_idfs = {}
 
-        # Getting Data (later we'll use vector databases)
-        movies_data = GetData('movies.json').get_file_data_json()
-        self.movies = movies_data['movies']     # is a list[dict{'id':, 'title':, 'description':}]
+        # corpus, an iterable of dict{'id':, 'title':, 'description':}
+        # None -> build() streams data/movies.json (read-only commands never touch it)
+        self.movies = None
 
-    def __add_document(self, doc_id, text):
+    def __shards(self, movies):
         """
-        Docstring for __add_document: 
-            * Tokenizes the text
-            * for each token, call get_document() and 
-              stores the result in index
-            * also insert doc_id {if not only present}
- 
-        :param doc_id: 'id' of movie which the text belong to
-        :param text: contain movie['title'] and movie['description'] as
-                     a single string
+        Docstring for __shards:
+            cuts the movies into lists of BUILD_SHARD_SIZE movies (lazily,
+            movies may be a stream) and creates their docmap entries
+
+        :param movies: iterable of movie objects
         """
-        tokens = Preprocessing(text).stemming()
-        
-        self.doc_lengths[doc_id] = len(tokens)
-        # count frequency of term in a given document object
-        self.term_frequencies[doc_id].update(tokens)
-        for token in set(tokens):
-            # add list elements in index
-            # key=token is initilized, if not available
-            self.index[token].append(doc_id)
+        movies = iter(movies)
+        while shard := list(islice(movies, BUILD_SHARD_SIZE)):
+            for movie in shard:
+                self.docmap[movie['id']] = json.dumps(movie).encode()
+            yield shard
+
+    def __add_shard(self, shard):
+        """
+        Docstring for __add_shard:
+            merges the partial index of a shard (see build_partial_index)
+            into the index. Shards are merged in corpus order, so postings
+            come out in the same order as a serial build.
+
+        :param shard: (index, term_frequencies, doc_lengths, term_positions,
+                       title_lengths, title_frequencies) of the shard
+        """
+        index, term_frequencies, doc_lengths, term_positions, title_lengths, title_frequencies = shard
+
+        for token, postings in index.items():
+            self.index[token].extend(postings)
+        for doc_id, frequencies in term_frequencies.items():
+            self.term_frequencies[doc_id].update(frequencies)
+        self.doc_lengths.update(doc_lengths)
+        if term_positions is not None:
+            self.term_positions.update(term_positions)
+        self.title_lengths.update(title_lengths)
+        self.title_frequencies.update(title_frequencies)
     
     def get_tf(self, doc_id, term):
 
-        term = Preprocessing(term).stemming()
+        term = get_analyzer().analyze(term)
 
         if len(term) > 1:
             raise Exception("InvertedIndex.get_tf(): More than 1 token")
@@ -58,20 +239,26 @@ class InvertedIndex:
                 token = term.pop()
             except IndexError:  # if term is empty (cann't pop empty list)
                 return 0
-        
-        term_frequency_cache = self.load('term_frequencies.pkl')
+
+        self._ensure_loaded()
+
+        segment, docnum = self._locate(doc_id)
+        term_id = None if segment is None else segment.term_id(token)
 
         # if term exist, return counter
         # else 0
-        return term_frequency_cache.get(doc_id, {}).get(token, 0)
+        if term_id is None:
+            return 0
+        return segment.tf(docnum, term_id)
 
     
     def get_idf(self, term):
 
-        term = Preprocessing(term).stemming().pop()
+        term = get_analyzer().analyze(term).pop()
 
         # Find total_doc, term_match_doc_count
-        no_of_docs = len(self.load('term_frequencies.pkl'))
+        self._ensure_loaded()
+        no_of_docs = self.no_of_docs
         term_match_doc_count = self._cal_df(term)
 
         # IDF = log ( N / df ) 
@@ -87,9 +274,13 @@ class InvertedIndex:
         tf = self.get_tf(doc_id, term)
         avg_doc_length = self._get_avg_doc_length()
 
-        doc_length = self.load('doc_lengths.pkl')[doc_id]
+        if tf == 0:
+            return 0
+
+        segment, docnum = self._locate(doc_id)
+        doc_length = segment.doc_lengths[docnum]
 
-        if tf == 0 or doc_length == 0:
+        if doc_length == 0:
             return 0    
         
         # length_norm = 1 - b + b * (doc_length / avg_doc_length)
@@ -112,7 +303,8 @@ class InvertedIndex:
             Note -> should be a single token
         """
         # Find total doc, term_match_doc_count
-        no_of_docs = len(self.load('docmap.pkl'))
+        self._ensure_loaded()
+        no_of_docs = self.no_of_docs
         term_match_doc_count = self._cal_df(term)
 
         # IDF = log( (N - df + 0.5)/(df + 0.5) + 1) 
@@ -124,6 +316,83 @@ class InvertedIndex:
 
         return bm25_idf
 
+    def get_document(self, doc_id):
+        """ returns the document (movie object) of doc_id """
+        self._ensure_loaded()
+
+        segment, docnum = self._locate(doc_id)
+        if segment is None:
+            raise KeyError(doc_id)
+        return segment.document(docnum)
+
+    def keyword_search(self, query, limit=5, rank=False):
+        """ movies matching the boolean query {refer boolean_search}, at most `limit` """
+        with profiling.span('keyword.search'):
+            doc_ids = self.boolean_search(query, limit, rank)
+
+            with profiling.span('index.documents'):
+                return [self.get_document(doc_id) for doc_id in doc_ids]
+
+    def boolean_search(self, query, limit=None, rank=False, default_operator=BOOLEAN_DEFAULT_OPERATOR,
+                       k1=BM25_K1, b=BM25_B):
+        """
+        Docstring for boolean_search
+
+            bear AND (jungle OR forest) NOT hunting, "quoted phrases"
+            {refer lib/boolean_query.py}. Evaluated segment by segment
+            over the sorted postings: AND only decodes its rarest operand,
+            the others are galloped / skipped through. Without positions
+            in the index a phrase matches the documents containing all of
+            its tokens.
+
+        :param query: raw query text
+        :param limit: no. of doc_ids to return (None -> every match)
+        :param rank: order the matches by their BM25 score (the tokens
+                     that aren't negated), otherwise by doc_id
+        :param default_operator: joins words without an operator between
+                                 them ('OR' -> any word, as before)
+        :return: doc_ids of the matching documents
+        :raises QueryError: malformed query (a ValueError)
+        """
+        self._ensure_loaded()
+
+        with profiling.span('boolean.parse'):
+            node = parse_query(query, get_analyzer(), default_operator)
+        if node is None:
+            return []
+        if not self.has_positions():
+            node = phrases_as_terms(node)
+
+        with profiling.span('boolean.evaluate'):
+            doc_ids = []
+            for segment in self.segments:
+                doc_ids.extend(segment.doc_ids[docnum] for docnum in evaluate(node, _SegmentPostings(self, segment)))
+        profiling.count('boolean.matches', len(doc_ids))
+
+        if not rank:
+            return sorted(doc_ids)[:limit]
+
+        with profiling.span('boolean.rank'):
+            tokens = query_terms(node)
+            scores = [(doc_id, self._bm25_document(tokens, doc_id, k1, b)) for doc_id in doc_ids]
+            scores.sort(key=lambda item: (-item[1], item[0]))
+            return [doc_id for doc_id, _ in scores[:limit]]
+
+    def get_postings(self, token):
+        """ returns the sorted doc_ids of the documents containing token """
+        self._ensure_loaded()
+
+        doc_ids = []
+        for segment in self.segments:
+            term_id = segment.term_id(token)
+            if term_id is None:
+                continue
+
+            docnums, _ = segment.postings(term_id)
+            doc_ids.extend(segment.doc_ids[docnum] for docnum in docnums if docnum not in segment.deleted)
+
+        return sorted(doc_ids)
+
     def bm25(self, doc_id, term):
         """
             Calculates BM25 score
@@ -132,131 +401,860 @@ class InvertedIndex:
 
         return bm25_score
     
-    def bm25_search(self, query, limit):
+    def bm25_search(self, query, limit, strategy=BM25_SEARCH_STRATEGY, k1=BM25_K1, b=BM25_B, proximity=False,
+                    use_cache=True, fields=None):
         """
-        Because of inefficiency of calling bm25 method
-        they are not called.
+        BM25 search over the postings of the query tokens only.
 
-        running time is reduced by 78 % (now ~55.5 mins search time)
+        N, avgdl & BM25 IDF come from load_index() (computed once per
+        instance). The exact strategies return the same results:
+            'exhaustive' -> term-at-a-time, scores every matching document
+            'wand'       -> WAND, skips documents whose max score bound
+                            can't enter the top `limit`
+            'bmw'        -> Block-Max WAND, also checks per-block bounds
+        and
+            'impact'     -> picks the top `limit` from the quantized impacts
+                            (build(impacts=True)), then scores them exactly.
+                            Quantization can swap documents near the cut-off.
+                            Falls back to 'bmw' if the index has no impacts
+                            or they were built with a different k1/b.
+
+        "Quoted" phrases restrict the results to the documents containing
+        every phrase {refer phrase_search} (every token of the phrases if
+        the index has no positions), these are scored exactly (BM25 of
+        every query token).
+
+        :param query: user query (raw text)
+        :param limit: no. of results to return
+        :param strategy: 'exhaustive', 'wand', 'bmw' or 'impact'
+        :param k1, b: BM25 parameters
+        :param proximity: reranks the best limit * PROXIMITY_CANDIDATES
+                          documents with a boost for query tokens that
+                          occur close together & in query order
+                          {refer _proximity_rerank}, needs positions
+        :param use_cache: look the results up in / save them to the
+                          result cache of the index {refer
+                          lib/result_cache.py} (phrase & proximity queries
+                          are never cached)
+        :param fields: None -> BM25 of the whole text, {field: {'boost':,
+                       'b':}, ...} -> BM25F over the title & description
+                       {refer _bm25f_score}, missing fields / values are
+                       taken from BM25F_FIELDS (k1 is shared, `b` unused)
+        :return: {doc_id: score} of the top `limit` documents, best first
         """
+        with profiling.span('bm25.search'):
+            phrases, text = split_phrases(query)
+            tokens = get_analyzer().analyze(text)
+            depth = limit * PROXIMITY_CANDIDATES if proximity else limit
+            fields = self._field_params(fields) if fields is not None else None
 
-        query = Preprocessing(query).stemming()
+            results = None
+            if use_cache and not phrases and not proximity:
+                self._ensure_loaded()
+                cache, tag = get_result_cache(self.directory), self.generation_tag()
+                key = result_key(tokens, limit, strategy, k1, b, fields)
+                results = cache.get(tag, key)
+                if results is not None:
+                    return dict(results)
 
-        docmap_cache = self.load('docmap.pkl')
-        tf_cache = self.load('term_frequencies.pkl')
-        doc_length_cache = self.load('doc_lengths.pkl')
-        no_of_docs = len(self.load('docmap.pkl'))
-        
-        # maps document IDs to their total BM25 score
-        scores = {}
- 
-        for doc_id in docmap_cache.keys():
-            total_bm25_score = 0
-            doc_length = doc_length_cache[doc_id]
-
-            for token in query:
-                # gets the document that contains the token
-                term_match_doc_count = self._cal_df(token)
-
-                # cal. BM25 IDF
-                bm25_idf = log( (no_of_docs - term_match_doc_count + 0.5) / (term_match_doc_count + 0.5) + 1 )
-                # cal. BM25 TF
-                tf = tf_cache.get(doc_id, {}).get(token, 0) # get term_frequency
-
-                if doc_length == 0 or tf == 0:
-                    ###if doc_length or tf == 0, don't cal rest of the math###
-                    
-                    # make bm25_tf = 0
-                    continue    # as product of 0 is 0
+            with profiling.span('bm25.top_k'):
+                if phrases:
+                    results, docs_scored = self._bm25_phrases(tokens, phrases, depth, k1, b, fields)
                 else:
-                    length_norm = 1 - BM25_B + BM25_B * (doc_length / self._get_avg_doc_length())
-                    bm25_tf = (tf * (BM25_K1 + 1)) / (tf + BM25_K1 * length_norm)
-                  
+                    results, docs_scored = self._bm25_top_k(tokens, depth, strategy, k1, b, fields)
+            profiling.count('bm25.docs_scored', docs_scored)
 
-                total_bm25_score += bm25_idf * bm25_tf
+            if use_cache and not phrases and not proximity:
+                cache.put(tag, key, results)
 
-            scores[doc_id] = round(total_bm25_score, 2)
-            
-        scores = dict(sorted(scores.items(), key=itemgetter(1), reverse=True))
-    
-        # results dictionary
-        res = {}
-        i = 1
-        for id, score in scores.items():
-            if i > limit:
-                break
-
-            res[id] = score
-            i += 1
+            if proximity:
+                with profiling.span('bm25.proximity'):
+                    results = self._proximity_rerank(text, results, limit)
 
         # return top limit (default 5) results
-        return res 
+        return dict(results)
+
+    def phrase_search(self, phrase):
+        """
+        Docstring for phrase_search
+
+            documents containing the phrase: its tokens at the same
+            relative positions (stop words count as positions, so "lord
+            of the rings" doesn't match "rings of the lord" or "lord
+            rings"). Intersects the postings of the phrase tokens, rarest
+            first, then matches positions, only the blocks holding the
+            candidates are decoded {refer lib/segment.py TermReader}.
+
+        :param phrase: raw text
+        :return: sorted doc_ids
+        """
+        self._ensure_loaded()
+        if not self.has_positions():
+            raise ValueError("The index has no token positions, rebuild it with `build --positions`")
+
+        tokens, positions = get_analyzer().analyze_with_positions(phrase)
+        if not tokens:
+            return []
+
+        # offsets of every token from the start of the phrase (a token can repeat)
+        offsets = defaultdict(list)
+        for token, position in zip(tokens, positions):
+            offsets[token].append(position - positions[0])
+
+        with profiling.span('phrase.search'):
+            doc_ids = []
+            for segment in self.segments:
+                doc_ids.extend(segment.doc_ids[docnum] for docnum in self._phrase_docnums(segment, offsets))
+
+        return sorted(doc_ids)
+
+    def generation_tag(self):
+        """ id of the loaded version of the index: build id & generation of
+            the manifest (a new one after every save, add, update, delete & merge) """
+        self._ensure_loaded()
+        return f"{self.manifest.get('build_id', '')}.{self.manifest['generation']}"
+
+    def has_fields(self):
+        """ True if the index stores per-field statistics (BM25F), i.e no segment predates them """
+        self._ensure_loaded()
+        return bool(self.segments) and all(segment.has_fields for segment in self.segments)
+
+    def has_positions(self):
+        """ True if the index stores token positions (build(positions=True)) """
+        self._ensure_loaded()
+        return bool(self.segments) and all(segment.has_positions for segment in self.segments)
+
+    def compare_strategies(self, query, limit, fields=None):
+        """
+        Docstring for compare_strategies
+
+            runs the query with every top-k strategy, used to confirm the
+            pruned results are identical to the exhaustive ones
+
+        :param fields: BM25F parameters {refer bm25_search}
+        :return: {strategy: {'results':, 'docs_scored':, 'seconds':}, ...}
+        """
+        tokens = get_analyzer().analyze(query)
+        self._ensure_loaded()
+        fields = self._field_params(fields) if fields is not None else None
+
+        strategies = ['exhaustive', 'wand', 'bmw']
+        if fields is None and self._has_impacts(BM25_K1, BM25_B):
+            strategies.append('impact')   # docs_scored -> postings read
+
+        report = {}
+        for strategy in strategies:
+            start = perf_counter()
+            results, docs_scored = self._bm25_top_k(tokens, limit, strategy, BM25_K1, BM25_B, fields)
+
+            report[strategy] = {'results': results,
+                                'docs_scored': docs_scored,
+                                'seconds': perf_counter() - start}
 
-    def build(self):
+        return report
+
+    def build(self, impacts=False, workers=BUILD_WORKERS, positions=False):
         """
         Builds the Inverted Index for faster 
         lookups.
 
         Builds index and docmap dictionaries
         then calls the save() method
+
+        The corpus is streamed and cut into contiguous shards of
+        BUILD_SHARD_SIZE movies. Tokenizing & stemming of the shards is
+        split across a process pool, every worker returns the partial
+        index of its shard and the shards are merged in corpus order.
+        The saved segment is byte-identical to a serial build. Only a few
+        shards of raw movies are in memory at a time.
+
+        :param impacts: also precompute quantized BM25 impacts (with the
+                        current BM25_K1 & BM25_B) for the 'impact' strategy
+        :param workers: no. of worker processes (None -> no. of CPUs,
+                        1 -> build serially in this process)
+        :param positions: also store token positions (phrase queries &
+                          the proximity boost of bm25_search)
         """
-        for movie in self.movies:
-            # create the docmap dictionary
-            self.docmap[movie['id']] = movie
+        movies = self.movies if self.movies is not None else GetData('movies.json').iter_documents()
+        if positions:
+            self.term_positions = {}
+        partial_index = partial(build_partial_index, positions=positions)
+
+        workers = workers or os.cpu_count() or 1
+        shards = self.__shards(movies)
+        head = list(islice(shards, 2))
 
-            input_text = f"{movie['title']} {movie['description']}"
-            # create the index dictionary
-            self.__add_document(movie['id'], input_text)
-            #print(self.index)
+        # create the index dictionary
+        if workers == 1 or len(head) == 1:
+            for shard in chain(head, shards):
+                self.__add_shard(partial_index(shard))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # results come back in shard order, 2 shards per worker in flight
+                for shard_index in _bounded_map(executor, partial_index, chain(head, shards), workers * 2):
+                    self.__add_shard(shard_index)
+
+        if impacts:
+            self.impacts, self.impact_meta = self._compute_impacts(BM25_K1, BM25_B)
         # Build Complete
 
     def save(self):
         """
-        Save index, docmap, term_frequency dictionaries &
-        saves them 
-            @ cache/index.pkl
-            @ cache/docmap.pkl
-            @ cache/term_frequencies.pkl
+        Save index, docmap, term_frequency & doc_lengths dictionaries
+        into a single memory-mapped segment
+            @ cache/index_<generation>.seg      {refer lib/segment.py}
+        and points the manifest (cache/index_manifest.json) at it, i.e
+        the saved index replaces every previous segment.
         """   
         # exist_ok=True (if dir already exist, don't raise error)
         # parents=True (create any necessary parent directories that don't exist)
-        file_path.mkdir(exist_ok=True, parents=False)
+        self.directory.mkdir(exist_ok=True, parents=False)
 
-        with open(file_path/'index.pkl', 'wb') as index_file:
-            pickle.dump(self.index, index_file)
+        manifest = load_manifest(self.directory, manifest_filename)
+        generation = (manifest['generation'] if manifest else 0) + 1
+        segment_file = f"index_{generation}.seg"
 
-        with open(file_path/'docmap.pkl', 'wb') as docmap_file:
-            pickle.dump(self.docmap, docmap_file)
+        write_segment(self.directory/segment_file,
+                      self.docmap,
+                      self.doc_lengths,
+                      self.index,
+                      self.term_frequencies,
+                      BM25_BLOCK_SIZE,
+                      self.impacts,
+                      self.impact_meta,
+                      self.term_positions,
+                      self.title_lengths,
+                      self.title_frequencies)
 
-        with open(file_path/'term_frequencies.pkl', 'wb') as tf_file:
-            pickle.dump(self.term_frequencies, tf_file)
+        # a new build id: generations restart at 1 if the cache directory is removed
+        self._commit({'generation': generation, 'build_id': uuid.uuid4().hex,
+                      'segments': [new_manifest_entry(segment_file)]})
 
-        with open(file_path/'doc_lengths.pkl', 'wb') as doc_lengths_file:
-            pickle.dump(self.doc_lengths, doc_lengths_file)
+    def load_index(self):
+        """
+        Docstring for load_index
 
-    def load(self, filename):
+            memory-maps the segments listed in the manifest & reads the
+            corpus statistics used by BM25 (N & avg. doc length, without
+            the deleted documents). Postings and documents are only
+            decoded when a query touches them.
         """
-        Docstring for load
+        with profiling.span('index.load'):
+            manifest = load_manifest(self.directory, manifest_filename)
+            if manifest is None:
+                raise Exception(f"Cached file: {manifest_filename} don't exist")
 
-            loads() the cached file for search using 
-            pickle.load() in read mode
-        
-        :param filenames: names of the cached file 
+            segments = []
+            for entry in manifest['segments']:
+                segment = Segment(self.directory/entry['file'])
+                if entry['deletions']:
+                    segment.set_deletions(read_deletions(self.directory/entry['deletions']))
+                segments.append(segment)
+                profiling.count('index.bytes_mapped', segment.size)
+
+        self.manifest = manifest
+        self.segments = segments
+
+        self.no_of_docs = sum(segment.no_of_docs - entry['deleted_docs']
+                              for segment, entry in zip(segments, manifest['segments']))
+        total_length = sum(segment.total_length - entry['deleted_length']
+                           for segment, entry in zip(segments, manifest['segments']))
+        self.avg_doc_length = total_length / self.no_of_docs if self.no_of_docs else 0.0
+        title_length = sum(segment.title_length - entry.get('deleted_title_length', 0)
+                           for segment, entry in zip(segments, manifest['segments']))
+        self.avg_field_lengths = ((title_length / self.no_of_docs, (total_length - title_length) / self.no_of_docs)
+                                  if self.no_of_docs else (0.0, 0.0))
+        self.bm25_idfs = {}
+
+    def add_documents(self, movies):
         """
-        try:
-            with open(file_path/filename, 'rb') as f:
-                return pickle.load(f)
-        except FileNotFoundError:
-            raise Exception(f"Cached file: {filename} don't exist")
-        
+        Docstring for add_documents
+
+            indexes new movies without rebuilding: they are written to a
+            new (small) segment. Segments are merged once there are more
+            than INDEX_MAX_SEGMENTS of them.
+
+        :param movies: list[dict{'id':, 'title':, 'description':}]
+        """
+        self._ensure_loaded()
+
+        for movie in movies:
+            if self._locate(movie['id'])[0] is not None:
+                raise ValueError(f"Document {movie['id']} is already indexed, use update_documents()")
+
+        self._apply_changes(movies, [])
+
+    def update_documents(self, movies):
+        """
+        Docstring for update_documents
+
+            replaces indexed movies: the old versions are marked deleted
+            & the new ones are written to a new segment.
+
+        :param movies: list[dict{'id':, 'title':, 'description':}]
+        """
+        self._ensure_loaded()
+
+        for movie in movies:
+            if self._locate(movie['id'])[0] is None:
+                raise KeyError(movie['id'])
+
+        self._apply_changes(movies, [movie['id'] for movie in movies])
+
+    def delete_documents(self, doc_ids):
+        """
+        Docstring for delete_documents
+
+            marks documents deleted (segments are never rewritten, the
+            postings are dropped by the next merge)
+
+        :param doc_ids: ids of the documents to delete
+        """
+        self._ensure_loaded()
+
+        for doc_id in doc_ids:
+            if self._locate(doc_id)[0] is None:
+                raise KeyError(doc_id)
+
+        self._apply_changes([], doc_ids)
+
+    def merge(self):
+        """
+        Docstring for merge
+
+            compacts every segment into a single one without the deleted
+            documents. The result is the same as a full build() of the
+            live documents (impacts are recomputed if the index had them).
+        """
+        self._ensure_loaded()
+
+        impact_meta = self.segments[0].impact_meta
+        has_positions = self.has_positions()
+        self.index = defaultdict(list)
+        self.docmap = DocumentSpool()
+        self.term_frequencies = defaultdict(Counter)
+        self.doc_lengths = {}
+        self.term_positions = defaultdict(dict) if has_positions else None
+        self.title_lengths = {}
+        self.title_frequencies = defaultdict(dict)
+
+        # documents are re-inserted in doc_id order (the order of a build)
+        live_docs = sorted((segment.doc_ids[docnum], i, docnum)
+                           for i, segment in enumerate(self.segments)
+                           for docnum in range(segment.no_of_docs)
+                           if docnum not in segment.deleted)
+        for doc_id, i, docnum in live_docs:
+            segment = self.segments[i]
+            self.docmap[doc_id] = segment.document_bytes(docnum)
+            self.doc_lengths[doc_id] = segment.doc_lengths[docnum]
+            if not segment.has_fields:
+                # written before fields existed: the title is analyzed again
+                title_tokens = get_analyzer().analyze(segment.document(docnum)['title'])
+                self.title_lengths[doc_id] = len(title_tokens)
+                self.title_frequencies[doc_id] = Counter(title_tokens)
+            else:
+                self.title_lengths[doc_id] = segment.title_lengths[docnum]
+
+        for segment in self.segments:
+            for term_id, term in enumerate(segment.terms()):
+                docnums, tfs = segment.postings(term_id)
+                term_positions = segment.term_positions(term_id) if has_positions else repeat(None)
+                title_tfs = segment.title_tfs(term_id) if segment.has_fields else repeat(0)
+                for docnum, tf, positions, title_tf in zip(docnums, tfs, term_positions, title_tfs):
+                    if docnum in segment.deleted:
+                        continue
+                    doc_id = segment.doc_ids[docnum]
+                    self.index[term].append(doc_id)
+                    self.term_frequencies[doc_id][term] = tf
+                    if has_positions:
+                        self.term_positions[doc_id][term] = positions
+                    if title_tf:
+                        self.title_frequencies[doc_id][term] = title_tf
+
+        for postings in self.index.values():
+            postings.sort()
+
+        if impact_meta is not None:
+            self.impacts, self.impact_meta = self._compute_impacts(impact_meta['k1'], impact_meta['b'])
+
+        self.save()
+        self.load_index()
+
     # Private Helper Methods
+    def _ensure_loaded(self):
+        """ loads the cached index on first use """
+        if self.segments is None:
+            self.load_index()
+
+    def _locate(self, doc_id):
+        """ (segment, docnum) of the live copy of doc_id, (None, None) if there is none """
+        for segment in self.segments:
+            docnum = segment.docnum(doc_id)
+            if docnum is not None and docnum not in segment.deleted:
+                return segment, docnum
+
+        return None, None
+
+    def _apply_changes(self, movies, deleted_doc_ids):
+        """
+        Docstring for _apply_changes
+
+            writes `movies` to a new segment and the deletion bitmaps of
+            the segments holding `deleted_doc_ids`, then swaps in the new
+            manifest. Files are never modified in place (readers holding
+            the previous manifest keep a consistent view).
+        """
+        ids = [movie['id'] for movie in movies]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate document ids")
+
+        generation = self.manifest['generation'] + 1
+        entries = [dict(entry, deleted_df=dict(entry['deleted_df'])) for entry in self.manifest['segments']]
+
+        for segment, entry in zip(self.segments, entries):
+            docnums = {segment.docnum(doc_id) for doc_id in deleted_doc_ids} - {None} - segment.deleted
+            if not docnums:
+                continue
+
+            # df & length of the deleted documents keep N, avgdl & df exact
+            # until the next merge (tokens are re-analysed from the text)
+            analyzer = get_analyzer()
+            for docnum in docnums:
+                tokens = analyzer.analyze(document_text(segment.document(docnum)))
+                entry['deleted_docs'] += 1
+                entry['deleted_length'] += segment.doc_lengths[docnum]
+                if segment.has_fields:
+                    entry['deleted_title_length'] = entry.get('deleted_title_length', 0) + segment.title_lengths[docnum]
+                for token in set(tokens):
+                    entry['deleted_df'][token] = entry['deleted_df'].get(token, 0) + 1
+
+            deletions_file = f"{Path(entry['file']).stem}_{generation}.del"
+            write_deletions(self.directory/deletions_file, segment.deleted | docnums, segment.no_of_docs)
+            entry['deletions'] = deletions_file
+
+        if movies:
+            index, term_frequencies, doc_lengths, term_positions, title_lengths, title_frequencies = \
+                build_partial_index(movies, self.has_positions())
+            segment_file = f"index_{generation}.seg"
+            write_segment(self.directory/segment_file,
+                          {movie['id']: movie for movie in movies},
+                          doc_lengths,
+                          index,
+                          term_frequencies,
+                          BM25_BLOCK_SIZE,
+                          positions=term_positions,
+                          title_lengths=title_lengths,
+                          title_frequencies=title_frequencies)
+            entries.append(new_manifest_entry(segment_file))
+
+        self._commit({'generation': generation, 'build_id': self.manifest.get('build_id'), 'segments': entries})
+        self.load_index()
+
+        if len(self.segments) > INDEX_MAX_SEGMENTS:
+            self.merge()
+
+    def _commit(self, manifest):
+        """ saves the manifest & removes the index files it no longer uses """
+        save_manifest(self.directory, manifest_filename, manifest)
+
+        in_use = {name for entry in manifest['segments'] for name in (entry['file'], entry['deletions'])}
+        directory = self.directory
+        for path in [*directory.glob('index_*.seg'), *directory.glob('index_*.del'), directory/'index.seg']:
+            if path.exists() and path.name not in in_use:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass    # still open elsewhere (Windows), removed next time
+
+    def _bm25_idf(self, token):
+        """ BM25 IDF of token, None if no (live) document contains it """
+        if token not in self.bm25_idfs:
+            with profiling.span('bm25.df'):
+                df = self._cal_df(token)
+                self.bm25_idfs[token] = self.get_bm25_idf(token) if df else None
+
+        return self.bm25_idfs[token]
+
+    def _bm25_score(self, tf, doc_length, bm25_idf, k1=BM25_K1, b=BM25_B):
+        """ BM25 score of a single token (BM25 TF * BM25 IDF) """
+        length_norm = 1 - b + b * (doc_length / self.avg_doc_length)
+        bm25_tf = (tf * (k1 + 1)) / (tf + k1 * length_norm)
+
+        return bm25_idf * bm25_tf
+
+    def _bm25f_score(self, tfs, lengths, bm25_idf, k1, fields):
+        """
+        Docstring for _bm25f_score
+
+            BM25F of a single token: the tf of every field, weighted by
+            the field's boost & normalized by the field's length
+                pseudo_tf = sum boost_f * tf_f / (1 - b_f + b_f * len_f / avg_len_f)
+            is saturated once, so hits in several fields don't add up
+            like separate terms
+                bm25f = idf * pseudo_tf * (k1 + 1) / (k1 + pseudo_tf)
+
+        :param tfs, lengths: (title, description)
+        :param fields: ((boost, b) of the title, of the description)
+        """
+        pseudo_tf = 0.0
+        for tf, length, avg_length, (boost, b) in zip(tfs, lengths, self.avg_field_lengths, fields):
+            if tf:
+                pseudo_tf += boost * tf / (1 - b + b * length / avg_length)
+
+        return bm25_idf * pseudo_tf * (k1 + 1) / (pseudo_tf + k1)
+
+    def _field_params(self, fields):
+        """ ((boost, b) of every field, in FIELDS order) of {field: {'boost':, 'b':}},
+            missing values from BM25F_FIELDS """
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {sorted(unknown)}, expected some of {FIELDS}")
+        if not self.has_fields():
+            raise ValueError("The index has no per-field statistics, rebuild it with `build`")
+
+        return tuple((float(fields.get(field, {}).get('boost', BM25F_FIELDS[field]['boost'])),
+                      float(fields.get(field, {}).get('b', BM25F_FIELDS[field]['b'])))
+                     for field in FIELDS)
+
+    def _compute_impacts(self, k1, b):
+        """
+        Docstring for _compute_impacts
+
+            BM25 score of every (token, document) pair, quantized to
+            1..BM25_IMPACT_LEVELS with one global scale so that impacts of
+            different tokens can be added up.
+
+        :return: ({token: {doc_id: impact}}, {'k1':, 'b':, 'scale':})
+        """
+        self.no_of_docs = len(self.docmap)
+        self.avg_doc_length = sum(self.doc_lengths.values()) / self.no_of_docs if self.no_of_docs else 0.0
+
+        scores = {}
+        for token, postings in self.index.items():
+            df = len(postings)
+            bm25_idf = log( (self.no_of_docs - df + 0.5) / (df + 0.5) + 1 )
+            scores[token] = {doc_id: self._bm25_score(self.term_frequencies[doc_id][token],
+                                                      self.doc_lengths[doc_id],
+                                                      bm25_idf, k1, b)
+                             for doc_id in postings}
+
+        max_score = max((score for token_scores in scores.values() for score in token_scores.values()),
+                        default=0.0)
+        scale = max_score / BM25_IMPACT_LEVELS if max_score else 1.0
+
+        impacts = {token: {doc_id: max(1, round(score / scale)) for doc_id, score in token_scores.items()}
+                   for token, token_scores in scores.items()}
+
+        return impacts, {'k1': k1, 'b': b, 'scale': scale}
+
+    def _has_impacts(self, k1, b):
+        """ True if the index is a single segment (no deletions) with
+            impacts built with the same k1 & b """
+        if len(self.segments) != 1 or self.segments[0].deleted:
+            return False    # impacts would miss the other segments (merge() rebuilds them)
+
+        impact_meta = self.segments[0].impact_meta
+        return impact_meta is not None and impact_meta['k1'] == k1 and impact_meta['b'] == b
+
+    def _bm25_top_k(self, tokens, limit, strategy, k1=BM25_K1, b=BM25_B, fields=None):
+        """
+        :param tokens: stemmed query tokens
+        :param fields: ((boost, b) of every field) -> BM25F {refer _field_params}
+        :return: ([(doc_id, score), ...] best first, no. of documents scored)
+        """
+        self._ensure_loaded()
+
+        if strategy == 'impact':
+            if fields is None and self._has_impacts(k1, b):
+                return self._bm25_impact(tokens, limit, k1, b)
+            strategy = 'bmw'    # impacts don't match the query's k1/b (or are single-field), score exactly
+
+        if strategy == 'exhaustive':
+            return self._bm25_exhaustive(tokens, limit, k1, b, fields)
+        if strategy in ('wand', 'bmw'):
+            return self._bm25_pruned(tokens, limit, k1, b, block_max=(strategy == 'bmw'), fields=fields)
+
+        raise ValueError(f"Unknown BM25 search strategy: {strategy}")
+
+    def _phrase_docnums(self, segment, offsets):
+        """ live docnums of segment with every token at start + one of its offsets
+            (offsets -> {token: [offset from the phrase start, ...]}) """
+        term_ids = {token: segment.term_id(token) for token in offsets}
+        if None in term_ids.values():
+            return []
+
+        by_df = sorted(offsets, key=lambda token: segment.df(term_ids[token]))
+        docnums, _ = segment.postings(term_ids[by_df[0]])
+        readers = {token: TermReader(segment, term_ids[token]) for token in by_df}
+
+        # document at a time (docnums only increase, so every reader moves
+        # forward through its blocks): every token present, then positions
+        matches = []
+        for docnum in docnums:
+            if docnum in segment.deleted or any(readers[token].find(docnum) is None for token in by_df[1:]):
+                continue
+
+            # phrase starts consistent with every token
+            starts = None
+            for token in by_df:
+                token_starts = {position - offset for position in readers[token].positions(docnum)
+                                for offset in offsets[token]}
+                starts = token_starts if starts is None else starts & token_starts
+                if not starts:
+                    break
+            if starts:
+                matches.append(docnum)
+
+        return matches
+
+    def _bm25_phrases(self, tokens, phrases, limit, k1, b, fields=None):
+        """ top `limit` of the documents containing every phrase (every
+            token of the phrases without positions), scored exactly
+            -> ([(doc_id, score), ...] best first, no. of documents scored) """
+        doc_ids = None
+        for phrase in phrases:
+            if self.has_positions():
+                matches = set(self.phrase_search(phrase))
+            else:
+                analyzed = get_analyzer().analyze(phrase)
+                matches = set.intersection(*(set(self.get_postings(token)) for token in analyzed)) if analyzed else set()
+            doc_ids = matches if doc_ids is None else doc_ids & matches
+
+        scores = [(doc_id, self._bm25_document(tokens, doc_id, k1, b, fields)) for doc_id in doc_ids]
+        return heapq.nsmallest(limit, scores, key=lambda item: (-item[1], item[0])), len(scores)
+
+    def _bm25_document(self, tokens, doc_id, k1, b, fields=None):
+        """ BM25 (BM25F with fields) score of one document (rounded, the
+            tokens summed in query order as _bm25_exhaustive does) """
+        segment, docnum = self._locate(doc_id)
+        doc_length = segment.doc_lengths[docnum]
+        if fields is not None:
+            title_length = segment.title_lengths[docnum]
+            lengths = (title_length, doc_length - title_length)
+
+        score = 0.0
+        for token in tokens:
+            bm25_idf = self._bm25_idf(token)
+            term_id = segment.term_id(token)
+            if bm25_idf is None or term_id is None:
+                continue
+
+            if fields is not None:
+                tfs = segment.field_tfs(docnum, term_id)
+                if any(tfs):
+                    score += self._bm25f_score(tfs, lengths, bm25_idf, k1, fields)
+                continue
+
+            tf = segment.tf(docnum, term_id)
+            if tf and doc_length:
+                score += self._bm25_score(tf, doc_length, bm25_idf, k1, b)
+
+        return round(score, 2)
+
+    def _proximity_rerank(self, text, results, limit):
+        """
+        Docstring for _proximity_rerank
+
+            adds PROXIMITY_WEIGHT * sum over the consecutive query token
+            pairs (a, b) of 1 / span, span -> 1 + how far the closest
+            occurrences of a & b are from their distance in the query:
+            "jurassic park" in the text -> 1, "park jurassic" -> 3,
+            missing -> no boost.
+
+        :param text: the query (without quotes)
+        :param results: [(doc_id, score), ...] BM25 candidates
+        :return: the best `limit` of results, rescored
+        """
+        if not self.has_positions():
+            raise ValueError("The index has no token positions, rebuild it with `build --positions`")
+
+        tokens, positions = get_analyzer().analyze_with_positions(text)
+        pairs = [(tokens[i], tokens[i + 1], positions[i + 1] - positions[i])
+                 for i in range(len(tokens) - 1) if tokens[i] != tokens[i + 1]]
+
+        reranked = []
+        for doc_id, score in results:
+            segment, docnum = self._locate(doc_id)
+            token_positions = {}
+            for token in {token for pair in pairs for token in pair[:2]}:
+                term_id = segment.term_id(token)
+                token_positions[token] = segment.positions(docnum, term_id) if term_id is not None else []
+
+            boost = 0.0
+            for first, second, distance in pairs:
+                if token_positions[first] and token_positions[second]:
+                    span = 1 + min(abs(q - p - distance) for p in token_positions[first] for q in token_positions[second])
+                    boost += 1 / span
+
+            reranked.append((doc_id, round(score + PROXIMITY_WEIGHT * boost, 2)))
+
+        reranked.sort(key=lambda item: (-item[1], item[0]))
+        return reranked[:limit]
+
+    def _bm25_exhaustive(self, tokens, limit, k1, b, fields=None):
+        """ Term-at-a-time: walks every posting of every query token """
+        # maps doc_ids to their total BM25 score
+        # (accumulator: only documents containing a query token get one)
+        scores = defaultdict(float)
+
+        # tokens are walked in query order (repeats included), so every
+        # document sums its per-token scores in the same order as before
+        for token in tokens:
+            bm25_idf = self._bm25_idf(token)
+            if bm25_idf is None:
+                continue    # token isn't in any document
+
+            for segment in self.segments:
+                term_id = segment.term_id(token)
+                if term_id is None:
+                    continue
+
+                docnums, tfs = segment.postings(term_id)
+                if fields is not None:
+                    for docnum, tf, title_tf in zip(docnums, tfs, segment.title_tfs(term_id)):
+                        if tf == 0 or docnum in segment.deleted:
+                            continue
+
+                        doc_length, title_length = segment.doc_lengths[docnum], segment.title_lengths[docnum]
+                        scores[segment.doc_ids[docnum]] += self._bm25f_score((title_tf, tf - title_tf),
+                                                                             (title_length, doc_length - title_length),
+                                                                             bm25_idf, k1, fields)
+                    continue
+
+                for docnum, tf in zip(docnums, tfs):
+                    doc_length = segment.doc_lengths[docnum]
+
+                    if doc_length == 0 or tf == 0 or docnum in segment.deleted:
+                        continue
+
+                    scores[segment.doc_ids[docnum]] += self._bm25_score(tf, doc_length, bm25_idf, k1, b)
+
+        # scores are rounded before ranking (ties -> lower doc_id first)
+        rounded_scores = ((doc_id, round(score, 2)) for doc_id, score in scores.items())
+        top_k = heapq.nsmallest(limit, rounded_scores, key=lambda item: (-item[1], item[0]))
+
+        return top_k, len(scores)
+
+    def _bm25_pruned(self, tokens, limit, k1, b, block_max, fields=None):
+        """ Document-at-a-time with WAND / Block-Max WAND pruning,
+            one cursor per (token, segment) walking doc_ids. With fields
+            (BM25F) the cursors' tfs & lengths are (title, description)
+            pairs, bounded per block by the field maxima / minima. """
+        # {token: [cursor of every segment holding it]}
+        cursors = {}
+        for token, weight in Counter(tokens).items():
+            bm25_idf = self._bm25_idf(token)
+            if bm25_idf is None:
+                continue    # token isn't in any document
+
+            if fields is not None:
+                def score_fn(tfs, lengths, bm25_idf=bm25_idf):
+                    return self._bm25f_score(tfs, lengths, bm25_idf, k1, fields)
+
+                # monotone: more tf & shorter fields never score less
+                bound_fn = score_fn
+            else:
+                def score_fn(tf, doc_length, bm25_idf=bm25_idf):
+                    return self._bm25_score(tf, doc_length, bm25_idf, k1, b)
+
+                def bound_fn(max_tf, min_doc_length, bm25_idf=bm25_idf):
+                    return self._bm25_score(max_tf, min_doc_length, bm25_idf, k1, b)
+
+            cursors[token] = []
+            for segment in self.segments:
+                term_id = segment.term_id(token)
+                if term_id is None:
+                    continue
+
+                blocks = segment.blocks(term_id)
+
+                def read_block(i, segment=segment, first_block=blocks.start):
+                    return self._read_live_block(segment, first_block + i, fields is not None)
+
+                # block bounds stay valid after deletions (they can only get looser)
+                bounds = []
+                for block in blocks:
+                    last_docnum, max_tf, min_doc_length = segment.block_bounds(block)
+                    if fields is not None:
+                        max_tf, min_doc_length = segment.block_field_bounds(block)
+                    bounds.append( (segment.doc_ids[last_docnum], max_tf, min_doc_length) )
+
+                cursors[token].append(PostingCursor(bounds, read_block, score_fn, bound_fn, weight))
+
+        score_order = [cursor for token in tokens if token in cursors for cursor in cursors[token]]
+        all_cursors = [cursor for token_cursors in cursors.values() for cursor in token_cursors]
+
+        return top_k(all_cursors, score_order, limit, block_max)
+
+    def _read_live_block(self, segment, block, fields=False):
+        """ (doc_ids, tfs, doc_lengths) of the live postings of a block,
+            fields -> tfs & doc_lengths are (title, description) pairs """
+        docnums, tfs = segment.read_block(block)
+        doc_ids, doc_lengths = segment.doc_ids, segment.doc_lengths
+        if fields:
+            tfs = [(title_tf, tf - title_tf) for tf, title_tf in zip(tfs, segment.read_block_title_tfs(block))]
+
+        if segment.deleted:
+            live = [i for i, docnum in enumerate(docnums) if docnum not in segment.deleted]
+            docnums = [docnums[i] for i in live]
+            tfs = [tfs[i] for i in live]
+
+        if fields:
+            title_lengths = segment.title_lengths
+            return ([doc_ids[docnum] for docnum in docnums],
+                    tfs,
+                    [(title_lengths[docnum], doc_lengths[docnum] - title_lengths[docnum]) for docnum in docnums])
+
+        return ([doc_ids[docnum] for docnum in docnums],
+                tfs,
+                [doc_lengths[docnum] for docnum in docnums])
+
+    def _bm25_impact(self, tokens, limit, k1, b):
+        """
+        Score-at-a-time over the impact-ordered postings (integer
+        accumulation with early termination), the selected documents
+        are then rescored exactly so the printed scores are true BM25.
+        """
+        segment = self.segments[0]
+
+        impact_postings = []
+        term_ids = {}
+        for token, weight in Counter(tokens).items():
+            if self._bm25_idf(token) is None:
+                continue    # token isn't in any document
+
+            term_ids[token] = segment.term_id(token)
+            impact_postings.append( (segment.impact_groups(term_ids[token]), weight) )
+
+        candidates, postings_read = score_at_a_time(impact_postings, limit)
+
+        rescored = []
+        for docnum in candidates:
+            doc_length = segment.doc_lengths[docnum]
+            score = 0.0
+            for token in tokens:
+                if token in term_ids:
+                    tf = segment.tf(docnum, term_ids[token])
+                    if tf:
+                        score += self._bm25_score(tf, doc_length, self.bm25_idfs[token], k1, b)
+            rescored.append( (docnum, round(score, 2)) )
+
+        rescored.sort(key=lambda item: (-item[1], item[0]))
+
+        return [(segment.doc_ids[docnum], score) for docnum, score in rescored], postings_read
+
     def _cal_df(self, term):
         """ Finds total_documents & term_match_doc_count """
 
-        index_cache = self.load('index.pkl')
+        self._ensure_loaded()
 
-        # Finds MATCHing Document COUNT
-        term_match_doc_count = len(index_cache[term])
+        # Finds MATCHing Document COUNT (summed over the segments,
+        # without the deleted documents)
+        term_match_doc_count = 0
+        for segment, entry in zip(self.segments, self.manifest['segments']):
+            term_id = segment.term_id(term)
+            if term_id is not None:
+                term_match_doc_count += segment.df(term_id) - entry['deleted_df'].get(term, 0)
 
         return term_match_doc_count
         
@@ -270,14 +1268,6 @@ class InvertedIndex:
         :return avg_doc_length: avg. doc length of all 
                  document across dataset
         """
-        doc_lengths_cache = self.load('doc_lengths.pkl')
-        no_of_docs = len(self.load('docmap.pkl'))
-
-        total_length_of_docs = 0
-        for length in doc_lengths_cache.values():
-            total_length_of_docs += length  # total size of all document included
-        
-        avg_doc_length = total_length_of_docs / no_of_docs
-        #print(f"Avg. Doc Length: {avg_doc_length}")
+        self._ensure_loaded()
 
-        return avg_doc_length
+        return self.avg_doc_length
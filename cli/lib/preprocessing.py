@@ -49,20 +49,122 @@
             :params high_value_tokens: (private) List
             :params stemmed_tokens: (private) List
 
+    preprocessing.Analyzer
+
+        Long-lived version of the Preprocessing pipeline (same tokens),
+        everything that doesn't depend on the text is prepared once:
+            stop words          -> frozenset (loaded from disk once)
+            punctuation         -> translation table
+            PorterStemmer       -> one instance + LRU memo of stemmed tokens
+
+        analyze(text)           -> stemmed tokens of one text
+        analyze_many(texts)     -> stemmed tokens of every text (batch)
+        analyze_with_positions(text)
+                                -> stemmed tokens & their positions in the
+                                   text (stop words count, so "lord of the
+                                   rings" keeps lord & ring 3 apart)
+
+        get_analyzer() returns the shared (per process) instance used by
+        Preprocessing, the index build & every query path.
+
 """
 from pathlib import Path    # common imports of classes
 
 # class specific imports are above the classes
 import string
-from nltk.stem import PorterStemmer
+from functools import lru_cache
+# nltk (PorterStemmer) is imported by Analyzer(), importing it takes ~0.3 s
+
+from lib import profiling
+from parameters import ANALYZER_STEM_CACHE_SIZE
+
+stopwords_path = Path(__file__).resolve().parents[2]/'data'/'stopwords.txt'    # for multi-OS support
+
+
+class Analyzer:
+    """
+    Lowercase -> remove punctuation -> split -> drop stop words -> stem
+
+    :param stopwords_file: one stop word per line
+    :param stem_cache_size: no. of distinct tokens whose stem is memoized
+    """
+    def __init__(self, stopwords_file=stopwords_path, stem_cache_size=ANALYZER_STEM_CACHE_SIZE):
+        self.stop_words = frozenset(self.__load_stop_words(stopwords_file))
+        self.translator = str.maketrans('', '', string.punctuation)
+
+        from nltk.stem import PorterStemmer
+        # a corpus has far fewer distinct tokens than tokens, the Porter
+        # algorithm only runs once per distinct token
+        self.stem = lru_cache(maxsize=stem_cache_size)(PorterStemmer().stem)
+
+    def analyze(self, text):
+        """ stemmed high-value tokens of text """
+        if profiling.enabled:
+            return self._analyze_profiled(text)
+        stop_words, stem = self.stop_words, self.stem
+
+        return [stem(token) for token in text.lower().translate(self.translator).split()
+                if token not in stop_words]
+
+    def analyze_many(self, texts):
+        """ analyze() of every text, i.e [[token, ...], ...] """
+        return [self.analyze(text) for text in texts]
+
+    def analyze_with_positions(self, text):
+        """ (analyze(text), [position of every token among all the words of text]) """
+        stop_words, stem = self.stop_words, self.stem
+
+        tokens, positions = [], []
+        for position, token in enumerate(text.lower().translate(self.translator).split()):
+            if token not in stop_words:
+                tokens.append(stem(token))
+                positions.append(position)
+
+        return tokens, positions
+
+    def _analyze_profiled(self, text):
+        """ analyze() (--profile), with the stem memo hits & misses """
+        stop_words, stem = self.stop_words, self.stem
+        before = stem.cache_info()
+
+        with profiling.span('analyze'):
+            tokens = [stem(token) for token in text.lower().translate(self.translator).split()
+                      if token not in stop_words]
+
+        after = stem.cache_info()
+        profiling.count('analyze.tokens', len(tokens))
+        profiling.count('analyze.stem_cache_hits', after.hits - before.hits)
+        profiling.count('analyze.stem_cache_misses', after.misses - before.misses)
+        return tokens
+
+    @staticmethod
+    def __load_stop_words(stopwords_file):
+        try:
+            with open(stopwords_file) as f:
+                return [line.strip() for line in f if line.strip()]
+        except FileNotFoundError:
+            print("File: stopwords.txt not found")
+            return []
+
+
+_analyzer = None
+
+def get_analyzer():
+    """ the shared Analyzer (created on first use, once per process) """
+    global _analyzer
+    if _analyzer is None:
+        with profiling.span('analyzer.init'):     # nltk import & stop words
+            _analyzer = Analyzer()
+    return _analyzer
+
 
 class Preprocessing:
     def __init__(self, text):
         self.text = text.lower()    # Case Insensitivity: make the text lowercase
+        self.analyzer = get_analyzer()
 
     def remove_punctuation(self) -> str:
-        translator = str.maketrans('', '', string.punctuation)
-        punctuated_text = self.text.translate(translator)
+        punctuated_text = self.text.translate(self.analyzer.translator)
 
         return punctuated_text
         
@@ -75,21 +177,11 @@ class Preprocessing:
     
     def stop_words(self):
         tokens = self.tokenization()
-        stop_words = []     # words which don't have much sematic meaning
-
-        filepath = Path(__file__).resolve().parents[2]/'data'/'stopwords.txt'    # for multi-OS support
-        #print(filepath)
-        try:
-            with open(filepath) as f:
-                for line in f:
-                    stop_words.append(line.strip())
+        stop_words = self.analyzer.stop_words     # words which don't have much sematic meaning
 
-        except FileNotFoundError:
-            print("File: stopwords.txt not found")
-
-        for token in tokens:    # takes individual token from query
-            if token in stop_words:    # checks if the token is a stop_word (low-value token)
-                tokens.remove(token)    # Low-value tokens are removed
+        # Low-value tokens are removed (a new list, removing while
+        # iterating skipped the token after every stop word)
+        tokens = [token for token in tokens if token not in stop_words]
      
         return tokens
     
@@ -98,10 +190,11 @@ class Preprocessing:
             Reduce tokens to their root form. 
             This helps match different variations of the same word
         """
-        stemmer = PorterStemmer()
+        stem = self.analyzer.stem     # memoized PorterStemmer().stem
         high_value_tokens = self.stop_words()
 
-        stemmed_tokens = [ stemmer.stem(token) for token in high_value_tokens ]
+        with profiling.span('preprocessing.stemming'):
+            stemmed_tokens = [ stem(token) for token in high_value_tokens ]
 
         return stemmed_tokens
 
@@ -131,11 +224,106 @@ class GetData:
             return None - if file not found
         """
         try:
-            with open(self.filepath, 'r') as f:
+            with profiling.span('data.load_json'), open(self.filepath, 'r') as f:
                 return json.load(f)
         except FileNotFoundError:
                 return None
     
+    def iter_documents(self, key='movies'):
+        """ yields the documents one at a time, the file is never loaded
+            as a whole (memory ~ one document + one read chunk)
+                .jsonl -> one json document per line
+                .json  -> the array under `key` ({"movies": [...]})
+                          or a top-level array
+        """
+        with open(self.filepath, 'r') as f:
+            if self.filepath.suffix == '.jsonl':
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            else:
+                yield from _iter_json_array(f, key)
+
     def get_file_data_txt(self):
         """ uses .read() method to read the file """
-        pass
\ No newline at end of file
+        pass
+
+
+def _iter_json_array(f, key, chunk_size=1 << 16):
+    """
+    Docstring for _iter_json_array
+
+        incremental parser: reads `f` in chunks and decodes one array
+        element at a time with JSONDecoder.raw_decode
+
+    :param f: file object (text mode)
+    :param key: the array is looked up under this key if the top-level
+                value is an object
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+
+    def read_more():
+        nonlocal buffer, position, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        # drop what was already decoded
+        buffer = buffer[position:] + chunk
+        position = 0
+        return True
+
+    def next_char():
+        """ skips whitespace, '' at the end of the file """
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not read_more():
+                return ''
+
+    def expect(char):
+        nonlocal position
+        if next_char() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", buffer, position)
+        position += 1
+
+    def decode_value():
+        nonlocal position
+        next_char()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # a value not followed by a delimiter (i.e a number) may continue in the next chunk
+                if eof or (end < len(buffer) and buffer[end] in ' \t\r\n,]}'):
+                    position = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            read_more()
+
+    if next_char() == '{':
+        expect('{')
+        while True:
+            if next_char() == '}':
+                return      # no `key`, no documents
+            name = decode_value()
+            expect(':')
+            if name == key:
+                break
+            decode_value()  # some other key, skipped
+            if next_char() == ',':
+                expect(',')
+
+    expect('[')
+    if next_char() == ']':
+        return
+    while True:
+        yield decode_value()
+        if next_char() == ']':
+            return
+        expect(',')
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+    profiling
+
+        Stage timings & counters of the build / query paths, printed by
+        the CLIs' --profile option.
+
+        span(name)          times a stage: `with span('bm25.top_k'): ...`
+                            (calls & total seconds, spans can nest)
+        count(name, n)      adds n to a counter (postings decoded, bytes
+                            mapped, cache hits, ...)
+        report()            every span & counter since enable()
+        peak_rss_mb()       peak memory of this process (or of its
+                            finished children), whether enabled or not
+
+        Disabled (the default) span() returns a shared no-op context and
+        count() returns at once. Hot loops check `profiling.enabled`
+        before counting, so a disabled profile costs one attribute lookup.
+
+        Only this process is profiled: the workers of a parallel build or
+        of `batch` are not.
+"""
+from contextlib import nullcontext
+from time import perf_counter
+import json
+import sys
+import threading
+try:
+    import resource     # Unix only, peak RSS is not reported without it
+except ImportError:
+    resource = None
+
+enabled = False
+
+_lock = threading.Lock()
+# name -> [calls, seconds, nesting depth of its first call], in first-call order
+_spans = {}
+_counters = {}
+_local = threading.local()
+_started = None
+
+_disabled_span = nullcontext()
+
+
+def enable():
+    """ starts recording (clears what was recorded) """
+    global enabled, _started
+    reset()
+    _started = perf_counter()
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def span(name):
+    """ context manager timing the stage `name` """
+    if not enabled:
+        return _disabled_span
+    return _Span(name)
+
+
+def count(name, n=1):
+    """ adds n to the counter `name` """
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+class _Span:
+    __slots__ = ('name', 'start', 'depth')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.depth = getattr(_local, 'depth', 0)
+        _local.depth = self.depth + 1
+        with _lock:
+            _spans.setdefault(self.name, [0, 0.0, self.depth])     # listed in first-call order
+
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = perf_counter() - self.start
+        _local.depth = self.depth
+
+        with _lock:
+            stats = _spans[self.name]
+            stats[0] += 1
+            stats[1] += seconds
+
+
+def report():
+    """
+    Docstring for report
+
+    :return: {'seconds': since enable(),
+              'spans': [{'name':, 'calls':, 'seconds':, 'depth':}, ...] in first-call order,
+              'counters': {name: value}} (JSON serializable)
+    """
+    with _lock:
+        return {'seconds': perf_counter() - _started if _started is not None else 0.0,
+                'spans': [{'name': name, 'calls': calls, 'seconds': seconds, 'depth': depth}
+                          for name, (calls, seconds, depth) in _spans.items()],
+                'counters': dict(_counters)}
+
+
+def peak_rss_mb(children=False):
+    """ peak resident set size (MB) of this process (or of its finished children), None if unknown """
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux, in bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss / divisor
+
+
+def print_report(output_format='text', file=sys.stderr):
+    """
+    Docstring for print_report
+
+        prints report() to file (stderr: stdout is the command's output)
+
+    :param output_format: 'text' -> a stage breakdown (nested stages
+                          indented, % of the profiled time),
+                          'json' -> a single JSON line (metrics pipelines)
+    """
+    profile = report()
+
+    if output_format == 'json':
+        print(json.dumps(profile), file=file)
+        return
+
+    total = profile['seconds']
+    print(f"profile: {total * 1000:.1f} ms", file=file)
+    for stage in profile['spans']:
+        name = "  " * stage['depth'] + stage['name']
+        share = stage['seconds'] / total if total else 0.0
+        print(f"  {name:<32} {stage['seconds'] * 1000:>10.2f} ms {share:>6.1%}  {stage['calls']:>8} calls", file=file)
+    for name, value in sorted(profile['counters'].items()):
+        print(f"  {name:<32} {value:>10}", file=file)
@@ -0,0 +1,279 @@
+"""
+    quantization
+
+        Compressed storage of unit-length embeddings. A codec turns float32
+        vectors into smaller codes and scores queries directly against
+        the codes (without decoding the whole matrix):
+
+            float16 -> 2 bytes / dim                            (2x)
+            int8    -> 1 byte / dim, per-dimension min & step   (4x)
+            pq      -> product quantization: the vector is cut into
+                       `subspaces` pieces, each stored as the id (1 byte)
+                       of its closest of 256 trained centroids
+                       (384 dims, 48 subspaces -> 48 bytes, 32x)
+
+        CompressedVectors keeps the codes and searches them: the best
+        `limit * rescore_factor` rows by approximate score are rescored
+        with the full-precision vectors (memory-mapped, only those rows
+        are read), so little of the recall is lost.
+"""
+import os
+
+import numpy as np
+
+from lib.vectors import l2_normalize, top_k, fingerprint
+from parameters import EMBEDDING_PQ_SUBSPACES, EMBEDDING_RESCORE_FACTOR, ANN_TRAIN_SIZE
+
+# rows decoded / scored at once (bounds the float32 temporaries)
+_BATCH = 16384
+
+
+class Float16Codec:
+    name = 'float16'
+
+    def train(self, unit_vectors):
+        pass
+
+    def encode(self, unit_vectors):
+        return unit_vectors.astype(np.float16)
+
+    def scores(self, unit_queries, codes):
+        """ (no. of queries, no. of codes) approximate dot products """
+        scores = np.empty((len(unit_queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), _BATCH):
+            scores[:, start:start + _BATCH] = unit_queries @ codes[start:start + _BATCH].astype(np.float32).T
+        return scores
+
+    def state(self):
+        return {}
+
+    def load_state(self, state):
+        pass
+
+
+class Int8Codec:
+    """ x ~ low + (code + 128) * step, per dimension """
+    name = 'int8'
+
+    def __init__(self):
+        self.low = None
+        self.step = None
+
+    def train(self, unit_vectors):
+        self.low = unit_vectors.min(axis=0)
+        self.step = np.maximum(unit_vectors.max(axis=0) - self.low, 1e-12) / 255
+
+    def encode(self, unit_vectors):
+        codes = np.rint((unit_vectors - self.low) / self.step) - 128
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def scores(self, unit_queries, codes):
+        # q . x = q . (low + 128 * step) + (q * step) . code
+        offsets = unit_queries @ (self.low + 128 * self.step)
+        scaled_queries = (unit_queries * self.step).astype(np.float32)
+
+        scores = np.empty((len(unit_queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), _BATCH):
+            scores[:, start:start + _BATCH] = scaled_queries @ codes[start:start + _BATCH].astype(np.float32).T
+        return scores + offsets[:, np.newaxis]
+
+    def state(self):
+        return {'low': self.low, 'step': self.step}
+
+    def load_state(self, state):
+        self.low, self.step = state['low'], state['step']
+
+
+class PQCodec:
+    """
+    :param subspaces: no. of pieces a vector is cut into (must divide
+                      its dimension, else the closest divisor below is used)
+    :param iterations: k-means iterations per subspace
+    """
+    name = 'pq'
+    no_of_centroids = 256   # -> 1 byte per subspace
+
+    def __init__(self, subspaces=EMBEDDING_PQ_SUBSPACES, iterations=10, seed=0):
+        self.subspaces = subspaces
+        self.iterations = iterations
+        self.seed = seed
+        # (subspaces, 256, dim / subspaces)
+        self.centroids = None
+
+    def train(self, unit_vectors):
+        dim = unit_vectors.shape[1]
+        self.subspaces = max(s for s in range(1, min(self.subspaces, dim) + 1) if dim % s == 0)
+        rng = np.random.default_rng(self.seed)
+
+        pieces = self._split(unit_vectors)
+        self.centroids = np.stack([_kmeans(piece, self.no_of_centroids, self.iterations, rng) for piece in pieces])
+
+    def encode(self, unit_vectors):
+        codes = np.empty((len(unit_vectors), self.subspaces), dtype=np.uint8)
+        for j, piece in enumerate(self._split(unit_vectors)):
+            codes[:, j] = _closest(piece, self.centroids[j])
+        return codes
+
+    def scores(self, unit_queries, codes):
+        """ asymmetric distance: dot product of every query piece with
+            every centroid (a small table), summed over the codes """
+        scores = np.zeros((len(unit_queries), len(codes)), dtype=np.float32)
+
+        for i, query_pieces in enumerate(self._split(unit_queries, axis=1)):
+            # (subspaces, 256) table of piece . centroid
+            table = np.einsum('sd,scd->sc', query_pieces, self.centroids)
+            # one gather per subspace (a single (n, subspaces) gather is ~2x slower)
+            for j in range(self.subspaces):
+                scores[i] += np.take(table[j], codes[:, j])
+        return scores
+
+    def state(self):
+        return {'centroids': self.centroids}
+
+    def load_state(self, state):
+        self.centroids = state['centroids']
+        self.subspaces = len(self.centroids)
+
+    def _split(self, vectors, axis=0):
+        """ axis=0: the subspace pieces of all vectors, [(n, piece dim), ...]
+            axis=1: the pieces of every vector, [(subspaces, piece dim), ...] """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        pieces = vectors.reshape(len(vectors), self.subspaces, -1)
+        return pieces.transpose(1, 0, 2) if axis == 0 else pieces
+
+
+CODECS = {codec.name: codec for codec in (Float16Codec, Int8Codec, PQCodec)}
+
+
+class CompressedVectors:
+    """
+    :param codec: trained Float16Codec, Int8Codec or PQCodec
+    :param codes: codes of the unit-length vectors, one row per vector
+    :param fingerprint: of the vectors the codes were built from
+    """
+    def __init__(self, codec, codes, fingerprint):
+        self.codec = codec
+        self.codes = codes
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, vectors, storage, seed=0):
+        """
+        Docstring for build
+
+        :param vectors: (n, dim) embeddings (normalized here, batch by batch)
+        :param storage: 'float16', 'int8' or 'pq'
+        """
+        codec = CODECS[storage]()
+        rng = np.random.default_rng(seed)
+
+        sample = np.sort(rng.choice(len(vectors), min(len(vectors), ANN_TRAIN_SIZE), replace=False))
+        codec.train(l2_normalize(vectors[sample]))
+
+        codes = np.concatenate([codec.encode(l2_normalize(vectors[start:start + _BATCH]))
+                                for start in range(0, len(vectors), _BATCH)])
+
+        return cls(codec, codes, fingerprint(vectors))
+
+    @property
+    def bytes_per_vector(self):
+        return self.codes.itemsize * self.codes.shape[1]
+
+    def search(self, unit_queries, limit, full_vectors=None, rescore_factor=EMBEDDING_RESCORE_FACTOR):
+        """
+        Docstring for search
+
+        :param unit_queries: (no. of queries, dim) L2-normalized queries
+        :param limit: no. of results per query
+        :param full_vectors: full-precision embeddings (not normalized) the
+                             shortlist is rescored with, None -> scores
+                             on the codes only
+        :param rescore_factor: shortlist = limit * rescore_factor rows
+        :return: [(row numbers, scores), ...] one per query, best first
+        """
+        unit_queries = np.atleast_2d(unit_queries)
+        approximate = self.codec.scores(unit_queries, self.codes)
+
+        if full_vectors is None:
+            return [(rows, scores[rows]) for scores, rows in zip(approximate, top_k(approximate, limit))]
+
+        results = []
+        for query, shortlist in zip(unit_queries, top_k(approximate, limit * rescore_factor)):
+            rows = np.sort(shortlist)   # read the memory-mapped rows in file order
+            exact = l2_normalize(full_vectors[rows]) @ query
+
+            best = top_k(exact, limit)[0]
+            results.append( (rows[best], exact[best]) )
+
+        return results
+
+    def save(self, path):
+        """ writes codec state & codes to `path` (.npz) atomically """
+        state = {f"codec_{name}": value for name, value in self.codec.state().items()}
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, storage=np.array(self.codec.name), codes=self.codes,
+                     fingerprint=np.frombuffer(self.fingerprint, dtype=np.uint8), **state)
+
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, vectors, storage):
+        """ the saved codes of `vectors`, None if missing, of another storage
+            mode or built from other vectors """
+        try:
+            with np.load(path) as data:
+                if str(data['storage']) != storage:
+                    return None
+                codec = CODECS[storage]()
+                codec.load_state({name[len('codec_'):]: data[name] for name in data.files if name.startswith('codec_')})
+                compressed = cls(codec, data['codes'], data['fingerprint'].tobytes())
+        except FileNotFoundError:
+            return None
+
+        if compressed.fingerprint != fingerprint(vectors):
+            return None     # embeddings changed since
+
+        return compressed
+
+
+def load_or_build_compressed(path, vectors, storage):
+    """ loads the compressed embeddings saved at `path`, (re)builds & saves them if missing or stale """
+    compressed = CompressedVectors.load(path, vectors, storage)
+    if compressed is None:
+        compressed = CompressedVectors.build(vectors, storage)
+        compressed.save(path)
+
+    return compressed
+
+
+def _kmeans(vectors, k, iterations, rng):
+    """ Euclidean k-means, returns (k, dim) centroids """
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = _closest(vectors, centroids)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.stack([np.bincount(assignment, weights=column, minlength=k) for column in vectors.T], axis=1)
+
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, np.newaxis]
+
+    if k < PQCodec.no_of_centroids:
+        # fewer vectors than centroids (tiny corpora), pad with unused centroids
+        centroids = np.concatenate([centroids, np.repeat(centroids[:1], PQCodec.no_of_centroids - k, axis=0)])
+    return centroids
+
+
+def _closest(vectors, centroids):
+    """ index of the closest (Euclidean) centroid of every vector """
+    closest = np.empty(len(vectors), dtype=np.int64)
+    squared_norms = (centroids ** 2).sum(axis=1)
+
+    for start in range(0, len(vectors), _BATCH):
+        batch = vectors[start:start + _BATCH]
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, |x|^2 is the same for every c
+        closest[start:start + _BATCH] = np.argmin(squared_norms - 2 * batch @ centroids.T, axis=1)
+    return closest
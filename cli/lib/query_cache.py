@@ -0,0 +1,147 @@
+"""
+    query_cache
+
+        Query embeddings are cached, so a repeated query does not run the
+        embedding model again.
+
+        QueryEmbeddingCache (one per model, get_query_cache())
+            memory  -> LRU of the last `capacity` query embeddings
+            disk    -> optional SQLite store under
+                       cache/query_embeddings/<model>/embeddings.sqlite
+                       {refer lib/sqlite_store.py} that survives restarts
+                       & is shared by every process (CLI runs, batch
+                       workers, the search server): one row per query
+                       (float32 embedding), at most `disk_capacity` rows,
+                       least recently used evicted first.
+
+        Queries are keyed by their whitespace-normalized text ("  the  bear"
+        and "the bear" are the same query). The model tokenizer ignores
+        whitespace, so both would get the same embedding anyway.
+
+        hits / disk_hits / misses count lookups since the cache was created.
+        A cache can be shared by threads (search server), the model runs
+        outside of its lock. Errors of the disk store (locked, read-only or
+        corrupt file) are misses: the cache never fails a search.
+"""
+from collections import OrderedDict
+from pathlib import Path
+import re
+import threading
+
+import numpy as np
+
+from lib import profiling
+from lib.sqlite_store import SQLiteLRUStore
+from parameters import QUERY_CACHE_SIZE, QUERY_CACHE_DISK_SIZE
+
+cache_path = Path(__file__).resolve().parents[2]/'cache'/'query_embeddings'
+disk_filename = 'embeddings.sqlite'
+
+
+def normalize_query(text):
+    """ the cache key of a query: stripped, runs of whitespace -> one space """
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache:
+    """
+    :param capacity: no. of embeddings kept in memory
+    :param directory: of the on-disk store, None -> memory only
+    :param disk_capacity: no. of embeddings kept on disk
+    """
+    def __init__(self, capacity=QUERY_CACHE_SIZE, directory=None, disk_capacity=QUERY_CACHE_DISK_SIZE):
+        self.capacity = capacity
+        self.memory = OrderedDict()     # query -> embedding, least recently used first
+        self.store = SQLiteLRUStore(Path(directory)/disk_filename, disk_capacity) if directory and disk_capacity else None
+
+        self.lock = threading.Lock()
+        self.hits = 0           # found in memory
+        self.disk_hits = 0      # found on disk
+        self.misses = 0         # encoded
+
+    def get(self, text, encode):
+        """ embedding of a single query {refer get_many} """
+        return self.get_many([text], encode)[0]
+
+    def get_many(self, texts, encode):
+        """
+        Docstring for get_many
+
+        :param texts: queries
+        :param encode: encodes a list of texts to (no. of texts, dim)
+                       embeddings, called once with every cache miss
+        :return: (no. of texts, dim) embeddings
+        """
+        keys = [normalize_query(text) for text in texts]
+        embeddings = {}
+
+        with self.lock:
+            for key in keys:
+                if key not in embeddings:
+                    embedding = self._lookup(key)
+                    if embedding is not None:
+                        embeddings[key] = embedding
+
+        missing = [key for key in dict.fromkeys(keys) if key not in embeddings]
+        if missing:
+            new_embeddings = np.asarray(encode(missing), dtype=np.float32)
+
+            with self.lock:
+                self.misses += len(missing)
+                profiling.count('query_cache.misses', len(missing))
+                for key, embedding in zip(missing, new_embeddings):
+                    embeddings[key] = self._remember(key, embedding)
+
+                if self.store is not None:
+                    self.store.put_many([(key, np.asarray(embeddings[key], dtype=np.float32).tobytes())
+                                         for key in missing])
+
+        return np.stack([embeddings[key] for key in keys])
+
+    def stats(self):
+        """ {'hits':, 'disk_hits':, 'misses':, 'size':, 'disk_size':} """
+        return {'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'size': len(self.memory),
+                'disk_size': len(self.store) if self.store is not None else 0}
+
+    def _lookup(self, key):
+        embedding = self.memory.get(key)
+        if embedding is not None:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            profiling.count('query_cache.hits')
+            return embedding
+
+        if self.store is not None:
+            embedding = self.store.get(key)
+            if embedding is not None:
+                embedding = np.frombuffer(embedding, dtype=np.float32).copy()
+                self.disk_hits += 1
+                profiling.count('query_cache.disk_hits')
+                return self._remember(key, embedding)
+
+        return None
+
+    def _remember(self, key, embedding):
+        embedding.flags.writeable = False   # shared by every caller
+        self.memory[key] = embedding
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+        return embedding
+
+
+_query_caches = {}
+
+def get_query_cache(model_name, directory=None):
+    """ the shared (per process) cache of a model's query embeddings,
+        backed by <directory>/<model name>/ (directory: default
+        cache/query_embeddings) """
+    directory = Path(directory) if directory is not None else cache_path
+    key = (model_name, directory)
+    if key not in _query_caches:
+        _query_caches[key] = QueryEmbeddingCache(directory=directory/re.sub(r'[^\w.-]', '_', model_name))
+    return _query_caches[key]
@@ -0,0 +1,52 @@
+"""
+    rank_fusion
+
+        Merges the ranked results of several retrievers (BM25 & semantic
+        search) into one ranking. Their scores are on different scales, so
+
+        fuse_rrf        reciprocal rank fusion, only the ranks count:
+                            score(d) = sum over rankings of 1 / (k + rank of d)
+        fuse_weighted   min-max normalizes every ranking's scores to [0, 1],
+                            score(d) = sum over rankings of weight * normalized score
+                        (0 for a ranking that did not return d)
+"""
+from parameters import RRF_K
+
+
+def fuse_rrf(rankings, limit, k=RRF_K):
+    """
+    Docstring for fuse_rrf
+
+    :param rankings: [{doc_id: score}, ...] every dict best first
+    :param limit: no. of results to return
+    :param k: damps the weight of the top ranks (60 is the usual value)
+    :return: [(doc_id, fused score), ...] best first (equal scores -> first seen)
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1 / (k + rank)
+
+    return sorted(fused.items(), key=lambda item: -item[1])[:limit]
+
+
+def fuse_weighted(rankings, limit, weights):
+    """
+    Docstring for fuse_weighted
+
+    :param rankings: [{doc_id: score}, ...]
+    :param limit: no. of results to return
+    :param weights: one weight per ranking (e.g. alpha, 1 - alpha)
+    :return: [(doc_id, fused score), ...] best first (equal scores -> first seen)
+    """
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        if not ranking:
+            continue
+        low, high = min(ranking.values()), max(ranking.values())
+        for doc_id, score in ranking.items():
+            # a ranking whose scores are all equal -> 1.0 each
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * normalized
+
+    return sorted(fused.items(), key=lambda item: -item[1])[:limit]
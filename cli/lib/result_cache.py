@@ -0,0 +1,141 @@
+"""
+    result_cache
+
+        BM25 results are cached, so a repeated query is not scored again.
+
+        ResultCache (one per index directory, get_result_cache())
+            memory  -> LRU of results, at most `capacity_bytes` (estimated)
+            disk    -> optional SQLite store next to the index
+                       (cache/bm25_results.sqlite {refer
+                       lib/sqlite_store.py}) shared by every process using
+                       the index: short-lived CLI runs, batch workers & the
+                       search server hit each other's results. At most
+                       `disk_capacity` results, least recently used
+                       evicted first.
+
+        Keys {refer result_key} -> the analyzed query tokens (sorted, so
+        word order & stop words don't matter), limit, k1, b, the BM25F
+        field parameters and whether the results are exact or quantized
+        (impact strategy): every exact strategy returns the same results.
+
+        Every entry is tagged with the index it was computed on {refer
+        InvertedIndex.generation_tag}: the build id & generation of the
+        manifest, both change when the index is rebuilt, updated or
+        merged. Lookups with another tag miss, so a cache never has to be
+        cleared by hand. On disk, entries of other tags are left alone (a
+        process still on an older generation shares the store with one
+        on the newer), stale ones age out through the LRU trim.
+
+        Errors of the disk store (locked, read-only or corrupt file) are
+        misses: the cache never fails a search.
+"""
+from collections import OrderedDict
+from pathlib import Path
+import json
+import threading
+
+from lib import profiling
+from lib.sqlite_store import SQLiteLRUStore
+from parameters import RESULT_CACHE_MEMORY_BYTES, RESULT_CACHE_DISK_SIZE
+
+disk_filename = 'bm25_results.sqlite'
+
+
+def result_key(tokens, limit, strategy, k1, b, fields=None):
+    """ the cache key (a string) of a BM25 (BM25F with fields) query {refer module docstring} """
+    exact = 'impact' if strategy == 'impact' and fields is None else 'exact'
+    return json.dumps([sorted(tokens), limit, exact, k1, b] + ([fields] if fields is not None else []))
+
+
+def _entry_bytes(key, results):
+    """ rough size of a cached entry: the key string, the list & a (doc_id, score) tuple per result """
+    return 150 + len(key) + 120 * len(results)
+
+
+class ResultCache:
+    """
+    :param capacity_bytes: estimated memory of the results kept in memory
+    :param path: of the SQLite store, None -> memory only
+    :param disk_capacity: no. of results kept on disk
+    """
+    def __init__(self, capacity_bytes=RESULT_CACHE_MEMORY_BYTES, path=None, disk_capacity=RESULT_CACHE_DISK_SIZE):
+        self.capacity_bytes = capacity_bytes
+        self.memory = OrderedDict()     # key -> results, least recently used first
+        self.memory_bytes = 0
+        self.tag = None                 # of the index the memory entries come from
+        self.store = SQLiteLRUStore(path, disk_capacity) if path and disk_capacity else None
+
+        self.lock = threading.Lock()
+        self.hits = 0           # found in memory
+        self.disk_hits = 0      # found on disk
+        self.misses = 0         # computed
+
+    def get(self, tag, key):
+        """ the cached results of key on the index `tag`, None if there are none """
+        with self.lock:
+            if tag != self.tag:
+                self._clear(tag)
+
+            results = self.memory.get(key)
+            if results is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                profiling.count('result_cache.hits')
+                return results
+
+            if self.store is not None:
+                results = self.store.get(key, tag)
+                if results is not None:
+                    results = [tuple(result) for result in json.loads(results)]
+                    self.disk_hits += 1
+                    profiling.count('result_cache.disk_hits')
+                    self._remember(key, results)
+                    return results
+
+            self.misses += 1
+            profiling.count('result_cache.misses')
+            return None
+
+    def put(self, tag, key, results):
+        """ caches results ([(doc_id, score), ...]) of key on the index `tag` """
+        results = [tuple(result) for result in results]
+        with self.lock:
+            if tag != self.tag:
+                self._clear(tag)
+            self._remember(key, results)
+            if self.store is not None:
+                self.store.put_many([(key, json.dumps(results))], tag)
+
+    def stats(self):
+        """ {'hits':, 'disk_hits':, 'misses':, 'size':, 'bytes':} """
+        return {'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'size': len(self.memory),
+                'bytes': self.memory_bytes}
+
+    def _clear(self, tag):
+        self.memory.clear()
+        self.memory_bytes = 0
+        self.tag = tag
+
+    def _remember(self, key, results):
+        if key in self.memory:
+            self.memory_bytes -= _entry_bytes(key, self.memory.pop(key))
+
+        self.memory[key] = results
+        self.memory_bytes += _entry_bytes(key, results)
+        while self.memory_bytes > self.capacity_bytes and self.memory:
+            evicted_key, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= _entry_bytes(evicted_key, evicted)
+
+
+_result_caches = {}
+
+def get_result_cache(directory):
+    """ the shared (per process) result cache of the index in directory,
+        backed by directory/bm25_results.sqlite """
+    directory = Path(directory)
+    if directory not in _result_caches:
+        _result_caches[directory] = ResultCache(path=directory/disk_filename)
+    return _result_caches[directory]
@@ -0,0 +1,279 @@
+"""
+    search_server
+
+        A long-running local search server: the inverted index, the
+        embedding model & the embeddings are loaded once and stay in
+        memory, so a query skips the imports, the model load & the index
+        load a CLI invocation pays.
+
+        serve()         localhost HTTP server (one thread per request)
+                            POST /search  {"kind": ..., "query": ..., options}
+                                kind -> 'keyword', 'bm25', 'semantic',
+                                        'chunks' or 'hybrid'
+                            GET  /stats
+        query_server()  the client, used by the CLIs' --server option.
+                        Only uses the standard library, so a thin client
+                        never imports torch / sentence-transformers.
+
+        SearchService loads every searcher on its first use and reloads it
+        when the files it was loaded from change (checked per request, a
+        stat() per file): `build` / `add` / `merge` of the index or new
+        embeddings are picked up without restarting the server.
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from time import perf_counter
+import json
+import threading
+import urllib.request
+import urllib.error
+
+from parameters import SERVER_ADDRESS, EMBEDDING_STORAGE
+
+cache_path = Path(__file__).resolve().parents[2]/'cache'
+data_path = Path(__file__).resolve().parents[2]/'data'
+
+search_kinds = ('keyword', 'bm25', 'semantic', 'chunks', 'hybrid')
+
+
+class SearchService:
+    """
+    :param ann: semantic & chunk searches use the IVF indexes
+    :param storage: embedding storage {refer lib/quantization.py}
+    """
+    def __init__(self, ann=False, storage=EMBEDDING_STORAGE):
+        self.ann = ann
+        self.storage = storage
+
+        # name -> (signature of its files when loaded, searcher)
+        self.loaded = {}
+        self.locks = {name: threading.Lock() for name in ('index', 'semantic', 'chunks', 'hybrid')}
+        # HybridSearch over the loaded retrievers (one thread pool for every request)
+        self.hybrid = None
+
+        # requests are served by concurrent threads
+        self.counters_lock = threading.Lock()
+        self.requests = 0
+        self.reloads = 0
+
+    def search(self, kind, query, limit=5, **options):
+        """
+        Docstring for search
+
+        :param kind: 'keyword', 'bm25', 'semantic', 'chunks' or 'hybrid'
+        :param options: of the search method of that kind, an unknown
+                        option raises TypeError (a 400 from the server)
+        :return: list of results (JSON serializable dicts)
+        """
+        with self.counters_lock:
+            self.requests += 1
+
+        match kind:
+            case 'keyword':
+                return self.inverted_index().keyword_search(query, limit, **options)
+
+            case 'bm25':
+                inverted_index = self.inverted_index()
+                results = inverted_index.bm25_search(query, limit, **options)
+                return [{'id': doc_id, 'title': inverted_index.get_document(doc_id)['title'], 'score': score}
+                        for doc_id, score in results.items()]
+
+            case 'semantic':
+                return self.semantic_search().search(query, limit, **options)
+
+            case 'chunks':
+                return self.chunked_search().search_chunks(query, limit, **options)
+
+            case 'hybrid':
+                return self.hybrid_search().search(query, limit, **options)
+
+        raise ValueError(f"Unknown search kind: {kind}, expected one of {search_kinds}")
+
+    def stats(self):
+        """ requests served, reloads & what is loaded """
+        stats = {'requests': self.requests, 'reloads': self.reloads, 'loaded': sorted(self.loaded)}
+
+        if 'index' in self.loaded:
+            from lib.result_cache import get_result_cache
+            stats['index_generation'] = self.loaded['index'][1].manifest['generation']
+            stats['result_cache'] = get_result_cache(cache_path).stats()
+        if 'semantic' in self.loaded:
+            stats['query_cache'] = self.loaded['semantic'][1].query_cache.stats()
+        return stats
+
+    def inverted_index(self):
+        return self._get('index', [cache_path/'index_manifest.json'], self._load_index)
+
+    def semantic_search(self):
+        return self._get('semantic', [data_path/'movies.json', cache_path/'movie_embeddings.npy'],
+                         self._load_semantic_search)
+
+    def chunked_search(self):
+        return self._get('chunks', [data_path/'movies.json', cache_path/'chunk_embeddings.npy'],
+                         self._load_chunked_search)
+
+    def hybrid_search(self):
+        """ the HybridSearch of the loaded retrievers, rebuilt when either of them was reloaded """
+        from lib.hybrid_search import HybridSearch
+
+        with self.locks['hybrid']:
+            inverted_index, semantic_search = self.inverted_index(), self.semantic_search()
+            if (self.hybrid is None or self.hybrid.inverted_index is not inverted_index
+                    or self.hybrid.semantic_search is not semantic_search):
+                # the previous one may still serve a request: not shut down,
+                # its idle threads exit once it is garbage collected
+                self.hybrid = HybridSearch(inverted_index=inverted_index, semantic_search=semantic_search)
+
+            return self.hybrid
+
+    def _get(self, name, files, load):
+        """ the loaded searcher `name`, (re)loaded if missing or any of its files changed """
+        with self.locks[name]:
+            signature, searcher = self.loaded.get(name, (None, None))
+            if searcher is None or signature != _signature(files):
+                if searcher is not None:
+                    with self.counters_lock:
+                        self.reloads += 1
+                searcher = load()
+                # after load(): loading may (re)write the files (e.g. new embeddings)
+                self.loaded[name] = (_signature(files), searcher)
+
+            return searcher
+
+    @staticmethod
+    def _load_index():
+        from lib.inverted_index import InvertedIndex
+
+        inverted_index = InvertedIndex()
+        inverted_index.load_index()
+        return inverted_index
+
+    def _load_semantic_search(self):
+        from lib.preprocessing import GetData
+        from lib.semantic_search import SemanticSearch
+
+        semantic_search = SemanticSearch(storage=self.storage)
+        semantic_search.load_or_create_embeddings(GetData('movies.json').get_file_data_json()['movies'])
+        if self.ann:
+            semantic_search.load_or_create_ann_index()
+        return semantic_search
+
+    def _load_chunked_search(self):
+        from lib.preprocessing import GetData
+        from lib.semantic_search import ChunkedSemanticSearch
+
+        chunked_search = ChunkedSemanticSearch(storage=self.storage)
+        chunked_search.load_or_create_chunk_embeddings(GetData('movies.json').get_file_data_json()['movies'])
+        if self.ann:
+            chunked_search.load_or_create_chunk_ann_index()
+        return chunked_search
+
+
+def _signature(files):
+    """ (mtime, size) of every file (None if missing), changes when any is rewritten """
+    signature = []
+    for file in files:
+        try:
+            stat = file.stat()
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+
+    return tuple(signature)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # set by serve()
+    service = None
+
+    def do_POST(self):
+        if self.path != '/search':
+            return self._reply(404, {'error': f"Unknown path: {self.path}"})
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            start = perf_counter()
+            results = self.service.search(**request)
+        except (ValueError, TypeError, KeyError) as e:
+            return self._reply(400, {'error': f"{type(e).__name__}: {e}"})
+        except Exception as e:
+            return self._reply(500, {'error': f"{type(e).__name__}: {e}"})
+
+        self._reply(200, {'results': results, 'seconds': perf_counter() - start})
+
+    def do_GET(self):
+        if self.path != '/stats':
+            return self._reply(404, {'error': f"Unknown path: {self.path}"})
+        self._reply(200, self.service.stats())
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass    # no line per request
+
+
+def serve(address=SERVER_ADDRESS, service=None, preload=True):
+    """
+    Docstring for serve
+
+        serves `service` on address ("host:port") until interrupted
+
+    :param preload: loads the index & the semantic searcher before serving
+                    (else on their first query)
+    """
+    service = service or SearchService()
+    if preload:
+        service.inverted_index()
+        service.semantic_search()
+
+    server = make_server(address, service)
+    print(f"Serving on http://{address} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def make_server(address, service):
+    """ the (not yet started) HTTP server of service on address ("host:port", port 0 -> any free port) """
+    host, port = address.rsplit(':', 1)
+    handler = type('Handler', (_Handler,), {'service': service})
+
+    return ThreadingHTTPServer((host, int(port)), handler)
+
+
+def query_server(address, kind, **params):
+    """
+    Docstring for query_server
+
+        runs a search on the server at address ("host:port")
+
+    :param kind: 'keyword', 'bm25', 'semantic', 'chunks' or 'hybrid'
+    :param params: query, limit & options of that search
+    :return: the results
+    """
+    request = urllib.request.Request(f"http://{address}/search",
+                                     data=json.dumps({'kind': kind, **params}).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)['results']
+    except urllib.error.HTTPError as e:
+        raise ValueError(json.load(e).get('error', str(e))) from None
+    except urllib.error.URLError as e:
+        raise ConnectionError(f"No search server at {address} ({e.reason}), "
+                              f"start one with `python cli/search_server_cli.py serve`") from None
+
+
+def server_stats(address):
+    """ the /stats of the server at address """
+    with urllib.request.urlopen(f"http://{address}/stats") as response:
+        return json.load(response)
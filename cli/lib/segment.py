@@ -0,0 +1,727 @@
+"""
+    segment
+
+        Binary, memory-mapped on-disk format of the inverted index
+        (replaces index.pkl, docmap.pkl, term_frequencies.pkl &
+        doc_lengths.pkl).
+
+        Documents are numbered 0..N-1 in increasing doc_id order
+        (`docnum`), postings store docnums so deltas stay small.
+
+        Layout
+            b'RSEG' | version (u32) | toc length (u32) | toc (json)
+            sections, each 8-byte aligned:
+
+            doc_ids         u32[N]      docnum -> doc_id (sorted)
+            doc_lengths     u32[N]      docnum -> no. of tokens
+            doc_offsets     u64[N+1]    docnum -> byte range in `documents`
+            documents       json of every document, back to back
+            vocab_offsets   u64[V+1]    term -> byte range in `vocab`
+            vocab           utf-8 terms, sorted by their bytes
+            term_df         u32[V]      no. of documents containing the term
+            term_blocks     u32[V+1]    term -> range of its blocks
+            block_last      u32[B]      last docnum of every block
+            block_max_tf    u32[B]      max tf in the block
+            block_min_len   u32[B]      min doc length in the block
+            block_offsets   u64[B+1]    block -> byte range in `postings`
+            postings        varint (docnum delta, tf) pairs, the delta
+                            restarts at every block so a block decodes
+                            on its own
+
+            optional token positions (see write_segment positions=)
+            position_offsets u64[B+1]   block -> byte range in `positions`
+            positions       per posting of the block (in block order), its
+                            tf varint position gaps (the first from -1)
+
+            optional fields (see write_segment title_lengths=), the text of a
+            document is its title then its description: description
+            tf & length are the totals minus the title's
+            title_lengths   u32[N]      docnum -> no. of title tokens
+            title_tf_offsets u64[B+1]   block -> byte range in `title_tfs`
+            title_tfs       varint title tf of every posting of the block
+            block_fields    u32[4B]     per block: max title tf, min title
+                                        length, max description tf, min
+                                        description length (min lengths
+                                        over the postings with a tf > 0
+                                        in that field)
+
+            optional impact-ordered postings (see write_segment impacts=)
+            impact_offsets  u64[V+1]    term -> byte range in `impacts`
+            impacts         per term, groups in decreasing impact order:
+                            varint impact | varint count | count varint
+                            docnum deltas (restarting at every group)
+
+        The file is opened with mmap, so opening is near-instant, only
+        the postings/documents touched by a query are decoded and the OS
+        page cache is shared between processes reading the same file.
+
+        Segments are never modified. An index is a list of segments plus,
+        per segment, an optional deletion bitmap (1 bit per docnum),
+        all listed in a json manifest (see load_manifest).
+"""
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from collections.abc import Mapping
+from itertools import accumulate, islice
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from lib import profiling
+
+MAGIC = b'RSEG'
+VERSION = 1
+# fields of a document, in the order of its text {refer lib/inverted_index.py document_text}
+FIELDS = ('title', 'description')
+
+_HEADER = struct.Struct('<4sII')
+
+
+def encode_varint(value, out):
+    """ appends `value` (unsigned int) to the bytearray `out`, 7 bits per byte """
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varints(data):
+    """ decodes every varint in `data` (bytes), returns list[int] """
+    values = []
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = 0
+            shift = 0
+
+    return values
+
+
+def iter_varints(data):
+    """ lazily decodes the varints in `data` (bytes), one at a time """
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            yield value
+            value = 0
+            shift = 0
+
+
+def write_segment(path, documents, doc_lengths, index, term_frequencies, block_size,
+                  impacts=None, impact_meta=None, positions=None, title_lengths=None, title_frequencies=None):
+    """
+    Docstring for write_segment
+
+        writes the index into a single segment file. The file is written
+        next to `path` and renamed over it, so processes that have the old
+        segment mapped keep reading a consistent file.
+
+    :param path: where the segment is written
+    :param documents: {doc_id: document (or its json-serialized bytes)}
+                      or a DocumentSpool
+    :param doc_lengths: {doc_id: no. of tokens}
+    :param index: {token: [doc_id, ...]}
+    :param term_frequencies: {doc_id: {token: tf}}
+    :param block_size: no. of postings per block
+    :param impacts: {token: {doc_id: quantized score}} to also write the
+                    impact-ordered postings (optional)
+    :param impact_meta: parameters the impacts were computed with,
+                        stored in the header as meta['impacts']
+    :param positions: {doc_id: {token: [position, ...]}} to also write the
+                      token positions (phrase & proximity queries, optional)
+    :param title_lengths: {doc_id: no. of title tokens} to also write the
+                          per-field statistics (BM25F, optional)
+    :param title_frequencies: {doc_id: {token: tf in the title}} (tokens
+                              missing from the title may be left out)
+    """
+    doc_ids = sorted(documents)
+    docnums = {doc_id: docnum for docnum, doc_id in enumerate(doc_ids)}
+
+    sections = {}
+
+    sections['doc_ids'] = array('I', doc_ids)
+    sections['doc_lengths'] = array('I', (doc_lengths[doc_id] for doc_id in doc_ids))
+
+    doc_offsets = array('Q', [0])
+    if isinstance(documents, DocumentSpool):
+        # copied from the spool while the file is written, never all in memory
+        for doc_id in doc_ids:
+            doc_offsets.append(doc_offsets[-1] + documents.size(doc_id))
+        documents_blob = _StreamedSection(doc_offsets[-1], (documents[doc_id] for doc_id in doc_ids))
+    else:
+        documents_blob = bytearray()
+        for doc_id in doc_ids:
+            document = documents[doc_id]
+            documents_blob += document if isinstance(document, bytes) else json.dumps(document).encode()
+            doc_offsets.append(len(documents_blob))
+    sections['doc_offsets'] = doc_offsets
+    sections['documents'] = documents_blob
+
+    terms = sorted(index, key=str.encode)
+    vocab = bytearray()
+    vocab_offsets = array('Q', [0])
+    term_df = array('I')
+    term_blocks = array('I', [0])
+    block_last = array('I')
+    block_max_tf = array('I')
+    block_min_len = array('I')
+    block_offsets = array('Q', [0])
+    postings = bytearray()
+    position_offsets = array('Q', [0])
+    position_gaps = bytearray()
+    title_tf_offsets = array('Q', [0])
+    title_tfs = bytearray()
+    block_fields = array('I')
+    if title_lengths is not None:
+        sections['title_lengths'] = array('I', (title_lengths[doc_id] for doc_id in doc_ids))
+
+    for term in terms:
+        vocab += term.encode()
+        vocab_offsets.append(len(vocab))
+
+        term_docnums = sorted(docnums[doc_id] for doc_id in index[term])
+        term_df.append(len(term_docnums))
+
+        for start in range(0, len(term_docnums), block_size):
+            block = term_docnums[start:start + block_size]
+            tfs = [term_frequencies[doc_ids[docnum]][term] for docnum in block]
+
+            previous = -1
+            for docnum, tf in zip(block, tfs):
+                encode_varint(docnum - previous, postings)
+                encode_varint(tf, postings)
+                previous = docnum
+
+            block_last.append(block[-1])
+            block_max_tf.append(max(tfs))
+            block_min_len.append(min(sections['doc_lengths'][docnum] for docnum in block))
+            block_offsets.append(len(postings))
+
+            if positions is not None:
+                for docnum in block:
+                    previous = -1
+                    for position in positions[doc_ids[docnum]][term]:
+                        encode_varint(position - previous, position_gaps)
+                        previous = position
+                position_offsets.append(len(position_gaps))
+
+            if title_lengths is not None:
+                # max tf & min length (0 -> no posting yet) over the postings with a tf > 0 in a field
+                bounds = [0, 0, 0, 0]
+                for docnum, tf in zip(block, tfs):
+                    doc_id = doc_ids[docnum]
+                    title_tf = title_frequencies.get(doc_id, {}).get(term, 0)
+                    encode_varint(title_tf, title_tfs)
+
+                    title_length = title_lengths[doc_id]
+                    for i, (field_tf, field_length) in enumerate(((title_tf, title_length),
+                                                                  (tf - title_tf, doc_lengths[doc_id] - title_length))):
+                        if field_tf:
+                            bounds[2 * i] = max(bounds[2 * i], field_tf)
+                            bounds[2 * i + 1] = min(bounds[2 * i + 1] or field_length, field_length)
+                block_fields.extend(bounds)
+                title_tf_offsets.append(len(title_tfs))
+
+        term_blocks.append(len(block_last))
+
+    sections['vocab_offsets'] = vocab_offsets
+    sections['vocab'] = vocab
+    sections['term_df'] = term_df
+    sections['term_blocks'] = term_blocks
+    sections['block_last'] = block_last
+    sections['block_max_tf'] = block_max_tf
+    sections['block_min_len'] = block_min_len
+    sections['block_offsets'] = block_offsets
+    sections['postings'] = postings
+
+    if positions is not None:
+        sections['position_offsets'] = position_offsets
+        sections['positions'] = position_gaps
+
+    if title_lengths is not None:
+        sections['title_tf_offsets'] = title_tf_offsets
+        sections['title_tfs'] = title_tfs
+        sections['block_fields'] = block_fields
+
+    if impacts is not None:
+        impact_offsets = array('Q', [0])
+        impact_postings = bytearray()
+
+        for term in terms:
+            groups = defaultdict(list)
+            for doc_id, impact in impacts[term].items():
+                groups[impact].append(docnums[doc_id])
+
+            for impact in sorted(groups, reverse=True):
+                encode_varint(impact, impact_postings)
+                encode_varint(len(groups[impact]), impact_postings)
+
+                previous = -1
+                for docnum in sorted(groups[impact]):
+                    encode_varint(docnum - previous, impact_postings)
+                    previous = docnum
+
+            impact_offsets.append(len(impact_postings))
+
+        sections['impact_offsets'] = impact_offsets
+        sections['impacts'] = impact_postings
+
+    meta = {
+        'no_of_docs': len(doc_ids),
+        'no_of_terms': len(terms),
+        'total_length': sum(sections['doc_lengths']),
+        'block_size': block_size,
+        'byteorder': sys.byteorder,
+        'impacts': impact_meta if impacts is not None else None,
+        'positions': positions is not None,
+        'fields': list(FIELDS) if title_lengths is not None else None,
+        'title_length': sum(sections['title_lengths']) if title_lengths is not None else 0,
+    }
+
+    _write_sections(path, meta, sections)
+
+
+class DocumentSpool(Mapping):
+    """
+    {doc_id: json-serialized document} kept in a temporary file instead
+    of memory (only the offsets are in memory), used while building.
+    """
+    def __init__(self):
+        self._file = None   # created on the first document
+        self._offsets = {}  # {doc_id: (offset, size)}
+        self._end = 0
+
+    def __setitem__(self, doc_id, data):
+        if self._file is None:
+            self._file = tempfile.TemporaryFile()
+        self._file.seek(self._end)
+        self._file.write(data)
+        self._offsets[doc_id] = (self._end, len(data))
+        self._end += len(data)
+
+    def __getitem__(self, doc_id):
+        offset, size = self._offsets[doc_id]
+        self._file.seek(offset)
+        return self._file.read(size)
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def size(self, doc_id):
+        return self._offsets[doc_id][1]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class _StreamedSection:
+    """ section written chunk by chunk (its size must be known upfront) """
+    def __init__(self, size, chunks):
+        self.size = size
+        self.chunks = chunks
+
+    def __len__(self):
+        return self.size
+
+
+def _write_sections(path, meta, sections):
+    """ writes header, table of contents & 8-byte aligned sections """
+    blobs = {name: (data.tobytes() if isinstance(data, array) else
+                    data if isinstance(data, _StreamedSection) else bytes(data))
+             for name, data in sections.items()}
+
+    # the toc holds absolute offsets, which depend on the toc's own size:
+    # size it with placeholder offsets first (fixed width), then fill in
+    toc = {'meta': meta, 'sections': {name: [0, len(blob)] for name, blob in blobs.items()}}
+    toc_size = len(json.dumps(toc).encode()) + 20 * 2 * len(blobs)
+    offset = _align(_HEADER.size + toc_size)
+
+    for name, blob in blobs.items():
+        toc['sections'][name] = [offset, len(blob)]
+        offset = _align(offset + len(blob))
+
+    toc_bytes = json.dumps(toc).encode().ljust(toc_size)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, toc_size))
+        f.write(toc_bytes)
+
+        for name, blob in blobs.items():
+            f.seek(toc['sections'][name][0])
+            if isinstance(blob, _StreamedSection):
+                for chunk in blob.chunks:
+                    f.write(chunk)
+            else:
+                f.write(blob)
+
+        # pad the file up to the end of the last (aligned) section
+        f.truncate(offset)
+
+    os.replace(tmp_path, path)
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def write_deletions(path, docnums, no_of_docs):
+    """ writes the deletion bitmap (bit `docnum` set -> deleted) of a segment """
+    bitmap = bytearray((no_of_docs + 7) // 8)
+    for docnum in docnums:
+        bitmap[docnum >> 3] |= 1 << (docnum & 7)
+
+    _write_file(path, bitmap)
+
+
+def read_deletions(path):
+    """ set of the deleted docnums stored in a deletion bitmap """
+    with open(path, 'rb') as f:
+        bitmap = f.read()
+
+    return {i * 8 + bit for i, byte in enumerate(bitmap) if byte for bit in range(8) if byte >> bit & 1}
+
+
+def load_manifest(directory, filename):
+    """
+    Docstring for load_manifest
+
+        the manifest lists the live segments of an index:
+            {'generation': int,
+             'build_id': str,                 # new on every full save
+             'segments': [{'file': 'index_1.seg',
+                           'deletions': None | 'index_1_2.del',
+                           'deleted_docs': int,       # no. of deleted docs
+                           'deleted_length': int,     # their total length
+                           'deleted_title_length': int,   # & title length
+                           'deleted_df': {term: int}  # their df per term
+                          }, ...]}
+
+    :return: the manifest (None if the index was never saved)
+    """
+    try:
+        with open(directory/filename, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+
+    # single segment written before manifests existed
+    if (directory/'index.seg').exists():
+        return {'generation': 0, 'segments': [new_manifest_entry('index.seg')]}
+
+    return None
+
+
+def save_manifest(directory, filename, manifest):
+    """ atomically replaces the manifest (readers see the old or the new one) """
+    _write_file(directory/filename, json.dumps(manifest, indent=1).encode())
+
+
+def new_manifest_entry(segment_file):
+    return {'file': segment_file, 'deletions': None,
+            'deleted_docs': 0, 'deleted_length': 0, 'deleted_title_length': 0, 'deleted_df': {}}
+
+
+def _write_file(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+
+    os.replace(tmp_path, path)
+
+
+class Segment:
+    """
+    Read-only view over a segment file.
+
+    Every array is a memoryview cast over the mmap, nothing is copied
+    until a block, a term or a document is actually decoded.
+    """
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, toc_size = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} index segment")
+
+        toc = json.loads(self._mmap[_HEADER.size:_HEADER.size + toc_size])
+        self.meta = toc['meta']
+        self._sections = toc['sections']
+
+        if self.meta['byteorder'] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {self.meta['byteorder']}-endian machine")
+
+        self._view = memoryview(self._mmap)
+
+        self.doc_ids = self._array('doc_ids', 'I')
+        self.doc_lengths = self._array('doc_lengths', 'I')
+        self._doc_offsets = self._array('doc_offsets', 'Q')
+        self._vocab_offsets = self._array('vocab_offsets', 'Q')
+        self._term_df = self._array('term_df', 'I')
+        self._term_blocks = self._array('term_blocks', 'I')
+        self._block_last = self._array('block_last', 'I')
+        self._block_max_tf = self._array('block_max_tf', 'I')
+        self._block_min_len = self._array('block_min_len', 'I')
+        self._block_offsets = self._array('block_offsets', 'Q')
+        if self.meta['impacts'] is not None:
+            self._impact_offsets = self._array('impact_offsets', 'Q')
+        # segments written before positions existed have no 'positions' meta
+        self.has_positions = self.meta.get('positions', False)
+        if self.has_positions:
+            self._position_offsets = self._array('position_offsets', 'Q')
+        # per-field statistics (BM25F), segments written before fields existed have none
+        self.has_fields = self.meta.get('fields') is not None
+        if self.has_fields:
+            self.title_lengths = self._array('title_lengths', 'I')
+            self._title_tf_offsets = self._array('title_tf_offsets', 'Q')
+            self._block_fields = self._array('block_fields', 'I')
+
+        self.no_of_docs = self.meta['no_of_docs']
+        self.no_of_terms = self.meta['no_of_terms']
+        self.total_length = self.meta['total_length']
+        self.title_length = self.meta.get('title_length', 0)
+        self.block_size = self.meta['block_size']
+        # bytes of the segment file (memory-mapped, read on demand)
+        self.size = len(self._mmap)
+        # docnums deleted since the segment was written (see set_deletions)
+        self.deleted = frozenset()
+        # {'k1':, 'b':, 'scale':} the impacts were built with (None if not built)
+        self.impact_meta = self.meta['impacts']
+
+    def set_deletions(self, docnums):
+        self.deleted = frozenset(docnums)
+
+    def close(self):
+        for name in list(vars(self)):
+            if isinstance(getattr(self, name), memoryview):
+                getattr(self, name).release()
+        self._mmap.close()
+
+    # Documents
+    def docnum(self, doc_id):
+        """ docnum of doc_id (None if doc_id isn't in the segment) """
+        docnum = bisect_left(self.doc_ids, doc_id)
+        if docnum < self.no_of_docs and self.doc_ids[docnum] == doc_id:
+            return docnum
+        return None
+
+    def document(self, docnum):
+        """ decodes the stored document (movie object) of docnum """
+        data = self.document_bytes(docnum)
+        if profiling.enabled:
+            profiling.count('index.documents_decoded')
+            profiling.count('index.document_bytes', len(data))
+        return json.loads(data)
+
+    def document_bytes(self, docnum):
+        """ the stored document of docnum, still json-serialized """
+        start, _ = self._sections['documents']
+        return self._mmap[start + self._doc_offsets[docnum]:start + self._doc_offsets[docnum + 1]]
+
+    # Terms
+    def term_id(self, term):
+        """ position of term in the sorted vocabulary (None if missing) """
+        key = term.encode()
+        lo, hi = 0, self.no_of_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < self.no_of_terms and self._term(lo) == key:
+            return lo
+        return None
+
+    def terms(self):
+        """ yields every term of the vocabulary, in sorted order """
+        for term_id in range(self.no_of_terms):
+            yield self._term(term_id).decode()
+
+    def df(self, term_id):
+        return self._term_df[term_id]
+
+    def blocks(self, term_id):
+        """ range of the global block numbers holding term_id's postings """
+        return range(self._term_blocks[term_id], self._term_blocks[term_id + 1])
+
+    def block_bounds(self, block):
+        """ (last docnum, max tf, min doc length) of a block """
+        return self._block_last[block], self._block_max_tf[block], self._block_min_len[block]
+
+    def read_block(self, block):
+        """ decodes a block, returns (docnums, tfs) """
+        start, _ = self._sections['postings']
+        data = self._mmap[start + self._block_offsets[block]:start + self._block_offsets[block + 1]]
+        if profiling.enabled:
+            profiling.count('index.blocks_decoded')
+            profiling.count('index.posting_bytes', len(data))
+        values = decode_varints(data)
+
+        docnums = list(accumulate(values[0::2], initial=-1))[1:]
+        return docnums, values[1::2]
+
+    def block_field_bounds(self, block):
+        """ ((max title tf, max description tf), (min title length, min description length)) of a block,
+            the min lengths are over the postings with a tf > 0 in that field """
+        max_title_tf, min_title_length, max_description_tf, min_description_length = self._block_fields[4 * block:4 * block + 4]
+        return (max_title_tf, max_description_tf), (min_title_length, min_description_length)
+
+    def read_block_title_tfs(self, block):
+        """ decodes the title tfs of a block (in block order) """
+        start, _ = self._sections['title_tfs']
+        return decode_varints(self._mmap[start + self._title_tf_offsets[block]:start + self._title_tf_offsets[block + 1]])
+
+    def title_tfs(self, term_id):
+        """ title tf of every posting of term_id (in postings() order) """
+        return [title_tf for block in self.blocks(term_id) for title_tf in self.read_block_title_tfs(block)]
+
+    def field_tfs(self, docnum, term_id):
+        """ (tf in the title, tf in the description) of term_id in docnum, decodes a single block """
+        block = self.find_block(term_id, docnum)
+        if block is None:
+            return 0, 0
+
+        docnums, tfs = self.read_block(block)
+        i = bisect_left(docnums, docnum)
+        if i < len(docnums) and docnums[i] == docnum:
+            title_tf = self.read_block_title_tfs(block)[i]
+            return title_tf, tfs[i] - title_tf
+        return 0, 0
+
+    def read_block_positions(self, block, tfs=None):
+        """ decodes the positions of a block, [[position, ...] of every posting] in block order
+            (tfs -> of the block if already decoded) """
+        if tfs is None:
+            _, tfs = self.read_block(block)
+        start, _ = self._sections['positions']
+        gaps = decode_varints(self._mmap[start + self._position_offsets[block]:start + self._position_offsets[block + 1]])
+
+        positions, i = [], 0
+        for tf in tfs:
+            positions.append(list(accumulate(gaps[i:i + tf], initial=-1))[1:])
+            i += tf
+        return positions
+
+    def positions(self, docnum, term_id):
+        """ positions of term_id in docnum ([] if it doesn't occur), decodes a single block """
+        block = self.find_block(term_id, docnum)
+        if block is None:
+            return []
+
+        docnums, tfs = self.read_block(block)
+        i = bisect_left(docnums, docnum)
+        if i < len(docnums) and docnums[i] == docnum:
+            return self.read_block_positions(block, tfs)[i]
+        return []
+
+    def term_positions(self, term_id):
+        """ positions of every posting of term_id (in postings() order) """
+        return [positions for block in self.blocks(term_id) for positions in self.read_block_positions(block)]
+
+    def postings(self, term_id):
+        """ decodes every block of term_id, returns (docnums, tfs) """
+        docnums, tfs = [], []
+        for block in self.blocks(term_id):
+            block_docnums, block_tfs = self.read_block(block)
+            docnums.extend(block_docnums)
+            tfs.extend(block_tfs)
+
+        return docnums, tfs
+
+    def find_block(self, term_id, docnum, first_block=None):
+        """ the block of term_id that holds docnum if any term_id posting does
+            (the first block whose last docnum >= docnum), None past the last block.
+            first_block -> search from there on (blocks before it were passed) """
+        blocks = self.blocks(term_id)
+        block = bisect_left(self._block_last, docnum, blocks.start if first_block is None else first_block, blocks.stop)
+        return block if block < blocks.stop else None
+
+    def tf(self, docnum, term_id):
+        """ frequency of term_id in docnum, decodes a single block """
+        block = self.find_block(term_id, docnum)
+        if block is None:
+            return 0
+
+        docnums, tfs = self.read_block(block)
+        i = bisect_left(docnums, docnum)
+        if i < len(docnums) and docnums[i] == docnum:
+            return tfs[i]
+        return 0
+
+    def impact_groups(self, term_id):
+        """
+        yields (impact, docnums) of term_id, highest impact first.
+        Groups are decoded one at a time, so stopping early skips the rest.
+        """
+        start, _ = self._sections['impacts']
+        values = iter_varints(self._mmap[start + self._impact_offsets[term_id]:start + self._impact_offsets[term_id + 1]])
+
+        for impact in values:
+            count = next(values)
+            yield impact, list(accumulate(islice(values, count), initial=-1))[1:]
+
+    # Private Helper Methods
+    def _array(self, name, typecode):
+        start, length = self._sections[name]
+        return self._view[start:start + length].cast(typecode)
+
+    def _term(self, term_id):
+        start, _ = self._sections['vocab']
+        return self._mmap[start + self._vocab_offsets[term_id]:start + self._vocab_offsets[term_id + 1]]
+
+
+class TermReader:
+    """
+    Looks up the postings (& positions) of one term for increasing
+    docnums: blocks are found with find_block() from the current one on
+    & decoded at most once, blocks between lookups are never decoded.
+    """
+    def __init__(self, segment, term_id):
+        self.segment = segment
+        self.term_id = term_id
+        self.block = None       # current block & its decoded postings
+        self.docnums = self.tfs = self._positions = None
+
+    def find(self, docnum):
+        """ index of docnum in the current block (loaded if needed), None if the term isn't in docnum """
+        if self.block is None or docnum > self.docnums[-1]:
+            block = self.segment.find_block(self.term_id, docnum, self.block)
+            if block is None:
+                return None
+            self.block = block
+            self.docnums, self.tfs = self.segment.read_block(block)
+            self._positions = None
+
+        i = bisect_left(self.docnums, docnum)
+        return i if i < len(self.docnums) and self.docnums[i] == docnum else None
+
+    def positions(self, docnum):
+        """ positions of the term in docnum ([] if it doesn't occur) """
+        i = self.find(docnum)
+        if i is None:
+            return []
+        if self._positions is None:
+            self._positions = self.segment.read_block_positions(self.block, self.tfs)
+        return self._positions[i]
@@ -1,18 +1,26 @@
 # Standard Libraries
 from pathlib import Path
-from operator import itemgetter
-import re
 import json
+import os
 
 # External Dependencies
 import numpy as np
-from sentence_transformers import SentenceTransformer
+# sentence_transformers (& torch) is imported by SemanticSearch.model, on first use
 
 # Internal Dependencies
+from lib import profiling
 from lib.preprocessing import GetData
+from lib.chunking import semantic_chunk
+from lib.vectors import l2_normalize, top_k, aggregate_by_group
+from lib.ann import load_or_build_ivf
+from lib.quantization import load_or_build_compressed
+from lib.query_cache import get_query_cache
+from lib.embedding_store import update_embeddings, content_hash
+from parameters import ANN_LISTS, ANN_NPROBE, EMBEDDING_STORAGE, CHUNK_TOP_M, CHUNK_CANDIDATES
 
 file_path = Path(__file__).resolve().parents[2]/'cache'
-embeddings_file_path = file_path/'movie_embeddings.npy'
+# sentences per chunk & sentences shared by consecutive chunks
+chunk_size, chunk_overlap = 4, 1
 
 def verify_model():
 
@@ -43,6 +51,7 @@ def verify_embeddings():
 
     print(f"Number of docs: {len(documents)}")
     print(f"Embeddings shape: {embeddings.shape[0]} vectors in {embeddings.shape[1]} dimensions")
+    print_embedding_report(sem_search.embedding_report)
 
     
 def embed_query_text(query):
@@ -56,121 +65,219 @@ def embed_query_text(query):
 
 
 
-def search(query, limit):
+def print_embedding_report(report):
+    """ prints what load_or_create_(chunk_)embeddings encoded & how fast """
+    print(f"Encoded (new or edited): {report['encoded']}, reused: {report['reused']}, "
+          f"resumed: {report['resumed']}")
+    if report['encoded']:
+        peak_rss = f", peak RSS {report['peak_rss_mb']:.0f} MB" if report['peak_rss_mb'] is not None else ""
+        print(f"{report['items_per_second']:.1f} items/sec ({report['seconds']:.1f} s){peak_rss}")
+
+
+def search(query, limit, ann=False, nprobe=ANN_NPROBE, storage=EMBEDDING_STORAGE):
 
     movies_data = GetData('movies.json').get_file_data_json()
     documents = movies_data['movies']
 
-    sem_search = SemanticSearch()
+    sem_search = SemanticSearch(storage=storage)
     sem_search.load_or_create_embeddings(documents)
-    result = sem_search.search(query, limit)
+    if ann:
+        sem_search.load_or_create_ann_index()
+    result = sem_search.search(query, limit, nprobe)
 
     return result
 
-def semantic_chunk(text, chunk_size, overlap):
-    """
-    Implements Semantic Chunk bases on grouping
-    text into sentences.
+def search_chunked(query, limit, top_m=CHUNK_TOP_M, ann=False, nprobe=ANN_NPROBE, storage=EMBEDDING_STORAGE):
+    """ search_chunks() over the chunks of every movie description """
+    movies_data = GetData('movies.json').get_file_data_json()
+    documents = movies_data['movies']
 
-    :param text:    text to be chunked
-    :param chunk_size: size of each chunk
-    :param overlap: overlapping between two chunks
-    """
-    if overlap >= chunk_size:
-        raise ValueError("Overlap cann't be bigger than chunk size")
-            
-    # split text based on sentences
-    sentences = re.split(r"(?<=[.!?])\s+", text)
+    chunked_search = ChunkedSemanticSearch(storage=storage)
+    chunked_search.load_or_create_chunk_embeddings(documents)
+    if ann:
+        chunked_search.load_or_create_chunk_ann_index()
 
-    res = []
-    for i in range(0, len(sentences), chunk_size-overlap):
-        chunk = sentences[i:i+chunk_size]
-                
-        if len(chunk) <= overlap:
-            break
-                
-        res.append(" ".join(chunk))
+    return chunked_search.search_chunks(query, limit, top_m, nprobe)
 
-    return res
+def query_cache_stats(model_name='all-MiniLM-L6-v2'):
+    """ hit / miss counters & sizes of the model's query embedding cache (this process) """
+    return get_query_cache(model_name).stats()
 
 class SemanticSearch:
-
-    def __init__(self, model_name='all-MiniLM-L6-v2'):
-        self.model = SentenceTransformer(model_name)
+    """
+    :param directory: of the embeddings, their indexes & the query cache
+                      (default: the repo's cache/)
+    """
+    def __init__(self, model_name='all-MiniLM-L6-v2', storage=EMBEDDING_STORAGE, model=None, directory=None):
+        self.model_name = model_name
+        self.directory = Path(directory) if directory is not None else file_path
+        # loaded on first encode {refer model}: cached query embeddings &
+        # up to date document embeddings never load it. An already loaded
+        # model (anything with encode(texts)) can be passed instead, e.g. the
+        # stand-in embedder of the benchmarks {refer lib/synthetic_corpus.py}
+        self._model = model
+        # query embeddings of this model, shared by every instance {refer lib/query_cache.py}
+        self.query_cache = get_query_cache(model_name, None if directory is None else self.directory/'query_embeddings')
+        # 'float32', or how the embeddings are compressed for search
+        # ('float16', 'int8', 'pq' {refer lib/quantization.py})
+        self.storage = storage
 
         self.embeddings = None
+        # self.embeddings scaled to unit length (set with the embeddings),
+        # cosine similarity -> dot product. Only with float32 storage
+        self.unit_embeddings = None
+        # compressed self.embeddings (other storage modes), searched on the
+        # codes & rescored with self.embeddings (memory-mapped)
+        self.compressed = None
+        # optional IVF index of unit_embeddings (load_or_create_ann_index),
+        # searches are exact without it
+        self.ann_index = None
         self.documents = None
         self.document_map = {}
+        # what the last load / build encoded & how fast {refer lib/embedding_store.py}
+        self.embedding_report = None
+
 
+    @property
+    def model(self):
+        """ the SentenceTransformer, loaded (& torch imported) on first use """
+        if self._model is None:
+            with profiling.span('semantic.model_load'):
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+        return self._model
 
     def generate_embedding(self, text):
         
         if not text or not text.strip():
             raise ValueError("Text is either all spaces or empty")
         
-        text = text.strip()
-
-        return self.model.encode([text])[0]
+        return self.query_cache.get(text, self._encode)
     
     def build_embeddings(self, documents):
-        # documents is a list[dict], where dict is a movie object
-        self.documents = documents
-        self.document_map = {}
+        """ encodes every document (full rebuild) {refer load_or_create_embeddings} """
+        return self._update_embeddings(documents, reuse=False)
 
-        movie_strings = []
-        for doc in self.documents:
-            self.document_map[doc['id']] = doc
+    def load_or_create_embeddings(self, documents):
+        """
+        Docstring for load_or_create_embeddings
 
-            movie_strings.append(f"{doc['title']}:{doc['description']}")
+            embeddings of the documents (cache/movie_embeddings.npy), only
+            the new or edited documents are encoded, the other rows are
+            reused {refer lib/embedding_store.py}
 
-        self.embeddings = self.model.encode(movie_strings, show_progress_bar=True)
-        
-        # save array to binary file
-        np.save(embeddings_file_path, self.embeddings)
+        :param documents: list[dict], where dict is a movie object
+        """
+        return self._update_embeddings(documents)
 
-        return self.embeddings
-    
-    def load_or_create_embeddings(self, documents):
+    def _update_embeddings(self, documents, reuse=True):
         self.documents = documents
+        self.document_map = {doc['id']: doc for doc in documents}
 
-        for doc in self.documents:
-            self.document_map[doc['id']] = doc
-
-        if embeddings_file_path.exists():
-            self.embeddings = np.load(embeddings_file_path, 'r')
+        movie_strings = [f"{doc['title']}:{doc['description']}" for doc in documents]
+        with profiling.span('semantic.load_embeddings'):
+            embeddings, self.embedding_report = update_embeddings(self.directory/'movie_embeddings.npy', movie_strings,
+                                                                  self.model_name, self._encode, reuse)
+            self._set_embeddings(embeddings)
+        profiling.count('semantic.embedding_bytes', embeddings.nbytes)
 
-            if len(self.embeddings) == len(self.documents):
-                return self.embeddings
-                
-        else:
-            self.embeddings = self.build_embeddings(documents)
-            return self.embeddings
+        return self.embeddings
     
-    def search(self, query, limit):
-        if self.embeddings.all() == None:
+    def load_or_create_ann_index(self, n_lists=ANN_LISTS):
+        """
+        Docstring for load_or_create_ann_index
+
+            loads the IVF index of the embeddings (cache/movie_embeddings.ivf.npz),
+            builds it if missing or built from other embeddings.
+            Searches then scan only the `nprobe` closest clusters.
+        """
+        if self.embeddings is None:
             raise ValueError("No embeddings loaded. Call `load_or_create_embeddings` first.")
 
-        query_embedding = self.generate_embedding(query)
+        unit_embeddings = self.unit_embeddings if self.unit_embeddings is not None else l2_normalize(self.embeddings)
+        self.ann_index = load_or_build_ivf(self.directory/'movie_embeddings.ivf.npz', unit_embeddings, n_lists)
+        return self.ann_index
 
-        similarity_score = []
-        for doc, doc_embedding in zip(self.documents , self.embeddings):
-            _similarity = self._cosine_similarity(doc_embedding, query_embedding)
-            
-            similarity_score.append( (_similarity, doc) )
+    def search(self, query, limit, nprobe=ANN_NPROBE):
+        with profiling.span('semantic.search'):
+            query_embedding = self.generate_embedding(query)
 
-        similarity_score.sort(key=itemgetter(0), reverse=True)
-        #print(sem_search)
-        res = []
-        for i, value in enumerate(similarity_score):
-            if i >= limit:
-                break
+            return self._search_embeddings(query_embedding[np.newaxis], limit, nprobe)[0]
 
-            item = {'score': value[0], 
-                    'title': value[1]['title'],
-                    'description': value[1]['description'] }
-            res.append(item)
+    def search_many(self, queries, limit, nprobe=ANN_NPROBE):
+        """
+        Docstring for search_many
 
-        return res
+            searches a batch of queries: one encode() call for all of
+            them (the ones not cached) and one matrix product for all the scores
+
+        :param queries: list of query strings
+        :param limit: no. of results per query
+        :param nprobe: clusters scanned per query (only with an ANN index)
+        :return: one result list (as returned by search) per query
+        """
+        if not queries:
+            return []
+        if any(not query or not query.strip() for query in queries):
+            raise ValueError("Text is either all spaces or empty")
+
+        with profiling.span('semantic.search_many'):
+            query_embeddings = self.query_cache.get_many(queries, self._encode)
+
+            return self._search_embeddings(query_embeddings, limit, nprobe)
+
+    def _search_embeddings(self, query_embeddings, limit, nprobe=ANN_NPROBE):
+        """ cosine similarity of the documents with every query -> top `limit` per query
+            (every document, the nprobe closest clusters with an ANN index or
+            the compressed embeddings, rescored) """
+        if self.embeddings is None:
+            raise ValueError("No embeddings loaded. Call `load_or_create_embeddings` first.")
+
+        unit_queries = l2_normalize(query_embeddings)
+
+        with profiling.span('semantic.similarity'):
+            if self.ann_index is not None:
+                matches = self.ann_index.search(unit_queries, limit, nprobe)
+            elif self.compressed is not None:
+                matches = self.compressed.search(unit_queries, limit, self.embeddings)
+            else:
+                # (no. of queries, no. of docs) cosine similarities
+                similarity_scores = unit_queries @ self.unit_embeddings.T
+                matches = [(indices, scores[indices])
+                           for scores, indices in zip(similarity_scores, top_k(similarity_scores, limit))]
+
+        results = []
+        for indices, scores in matches:
+            res = []
+            for i, score in zip(indices, scores):
+                doc = self.documents[i]
+                res.append({'id': doc['id'],
+                            'score': float(score),
+                            'title': doc['title'],
+                            'description': doc['description']})
+            results.append(res)
+
+        return results
+
+    def _encode(self, texts):
+        """ embeddings of texts (loads the model if not yet loaded) """
+        model = self.model
+        profiling.count('semantic.texts_encoded', len(texts))
+        with profiling.span('semantic.encode'):
+            return model.encode(texts)
+
+    def _set_embeddings(self, embeddings):
+        """ sets the embeddings & normalizes (float32) or compresses them once (not per query) """
+        self.embeddings = embeddings
+        self.compressed = self._compress(embeddings, 'movie_embeddings')
+        self.unit_embeddings = l2_normalize(embeddings) if self.compressed is None else None
+        self.ann_index = None   # built from the previous embeddings
+
+    def _compress(self, embeddings, name):
+        """ compressed embeddings (cache/<name>.<storage>.npz), None with float32 storage """
+        if self.storage == 'float32':
+            return None
+        return load_or_build_compressed(self.directory/f"{name}.{self.storage}.npz", embeddings, self.storage)
 
     def _cosine_similarity(self, vec1, vec2):
         dot_product = np.dot(vec1, vec2)
@@ -199,61 +306,191 @@ class SemanticSearch:
 
 class ChunkedSemanticSearch(SemanticSearch):
 
-    def __init__(self, model_name = "all-MiniLM-L6-v2") -> None:
-        super().__init__(model_name)
+    def __init__(self, model_name = "all-MiniLM-L6-v2", storage=EMBEDDING_STORAGE, model=None, directory=None) -> None:
+        super().__init__(model_name, storage, model, directory)
         self.chunk_embeddings = None
+        # chunk embeddings scaled to unit length (float32 storage only)
+        self.unit_chunk_embeddings = None
+        # text of every chunk (row of chunk_embeddings)
+        self.chunks = None
+        # {'movie_ids', 'chunk_idx', 'total_chunks'} one entry per chunk,
+        # saved with the chunks & offsets as cache/chunk_metadata.npz
         self.chunk_metadata = None
+        # chunks of self.documents[i] are rows chunk_offsets[i]:chunk_offsets[i + 1]
+        self.chunk_offsets = None
+        # compressed chunk embeddings (storage other than float32)
+        self.compressed_chunk_embeddings = None
+        # optional IVF index of the (normalized) chunk embeddings
+        self.chunk_ann_index = None
 
     def build_chunk_embeddings(self, documents):
+        """ encodes every chunk (full rebuild) {refer load_or_create_chunk_embeddings} """
+        return self._update_chunk_embeddings(documents, reuse=False)
+
+    def load_or_create_chunk_embeddings(self, documents: list[dict]) -> np.ndarray:
+        """ embeddings of the chunks of every description (cache/chunk_embeddings.npy),
+            only new or edited chunks are encoded {refer lib/embedding_store.py} """
+        return self._update_chunk_embeddings(documents)
+
+    def search_chunks(self, query, limit, top_m=CHUNK_TOP_M, nprobe=ANN_NPROBE):
+        """
+        Docstring for search_chunks
+
+            scores every chunk against the query (one matrix product),
+            then every movie by its chunks (np.maximum.reduceat over
+            chunk_offsets {refer lib/vectors.py aggregate_by_group}).
+            With an ANN index or compressed embeddings only the best
+            limit * CHUNK_CANDIDATES chunks are scored.
+
+        :param query: user query
+        :param limit: no. of movies
+        :param top_m: a movie scores the mean of its best top_m chunks (1 -> max)
+        :param nprobe: clusters scanned (only with an ANN index)
+        :return: [{'id':, 'title':, 'description':, 'score':, 'chunk':, 'chunk_idx':}, ...]
+                 best first, 'chunk' is the best matching chunk of the movie
+        """
+        if self.chunk_embeddings is None:
+            raise ValueError("No chunk embeddings loaded. Call `load_or_create_chunk_embeddings` first.")
+
+        with profiling.span('chunks.search'):
+            return self._search_chunks(query, limit, top_m, nprobe)
+
+    def _search_chunks(self, query, limit, top_m, nprobe):
+        unit_query = l2_normalize(self.generate_embedding(query))
+
+        with profiling.span('chunks.similarity'):
+            if self.chunk_ann_index is not None:
+                rows, scores = self.chunk_ann_index.search(unit_query, limit * CHUNK_CANDIDATES, nprobe)[0]
+            elif self.compressed_chunk_embeddings is not None:
+                rows, scores = self.compressed_chunk_embeddings.search(unit_query, limit * CHUNK_CANDIDATES,
+                                                                       self.chunk_embeddings)[0]
+            else:
+                rows, scores = None, self.unit_chunk_embeddings @ unit_query
+
+        with profiling.span('chunks.aggregate'):
+            if rows is None:
+                offsets = self.chunk_offsets
+            else:
+                # the candidates grouped by movie (rows are in movie order)
+                order = np.argsort(rows, kind='stable')
+                rows, scores = rows[order], scores[order]
+                offsets = np.searchsorted(rows, self.chunk_offsets)
+
+            movie_scores, best_chunks = aggregate_by_group(scores, offsets, top_m)
+            if rows is not None:
+                best_chunks = np.where(best_chunks >= 0, rows[best_chunks], -1)
+
+        results = []
+        for i in top_k(movie_scores, limit)[0]:
+            if best_chunks[i] < 0:
+                break   # no chunk of this movie (or any later one) scored
+            doc, chunk = self.documents[i], best_chunks[i]
+            results.append({'id': doc['id'],
+                            'title': doc['title'],
+                            'description': doc['description'],
+                            'score': float(movie_scores[i]),
+                            'chunk': self.chunks[chunk],
+                            'chunk_idx': int(self.chunk_metadata['chunk_idx'][chunk])})
+
+        return results
+
+    def load_or_create_chunk_ann_index(self, n_lists=ANN_LISTS):
+        """ IVF index of the chunk embeddings (cache/chunk_embeddings.ivf.npz),
+            built if missing or built from other chunk embeddings """
+        if self.chunk_embeddings is None:
+            raise ValueError("No chunk embeddings loaded. Call `load_or_create_chunk_embeddings` first.")
+
+        unit_chunk_embeddings = self.unit_chunk_embeddings
+        if unit_chunk_embeddings is None:
+            unit_chunk_embeddings = l2_normalize(self.chunk_embeddings)
+
+        self.chunk_ann_index = load_or_build_ivf(self.directory/'chunk_embeddings.ivf.npz', unit_chunk_embeddings, n_lists)
+        return self.chunk_ann_index
+
+    def _update_chunk_embeddings(self, documents, reuse=True):
         # populate self.documents & self.docmap
         self.documents = documents
         self.document_map = { doc['id']: doc for doc in self.documents }
-        
-        all_chunks = []
-        chunk_metadata = [] # is a list[dict]
-        for doc in self.documents:
-            if doc['description'] is None:
-                continue
 
-            chunks = semantic_chunk(doc['description'], chunk_size=4, overlap=1)
-            all_chunks.extend(chunks)
+        metadata_path = self.directory/'chunk_metadata.npz'
+        documents_hash = content_hash(json.dumps([chunk_size, chunk_overlap,
+                                                  [[doc['id'], doc['description']] for doc in self.documents]]))
+        with profiling.span('chunks.metadata'):
+            if not (reuse and self._load_chunk_metadata(metadata_path, documents_hash)):
+                self._chunk_documents()
+                self._save_chunk_metadata(metadata_path, documents_hash)
 
-            for chunk in chunks:
-               #d = {'movie_idx': doc['id'], 'chunk_idx': all_chunks.index[chunk], 'total_chunks': len(chunks)}
-               chunk_metadata.append(   {
-                                        'movie_idx': doc['id'],
-                                        'chunk_idx': all_chunks.index(chunk),
-                                        'total_chunks': len(chunks)
-                                        }
-                                    )
-
-        self.chunk_embeddings = self.model.encode(all_chunks)
-        self.chunk_metadata = chunk_metadata
-
-        np.save(file_path/'chunk_embeddings.npy', self.chunk_embeddings)
-        with open(file_path/'chunk_metadata.json', 'w') as f:
-            json.dump({"chunks": chunk_metadata, "total_chunks": len(all_chunks)}, f, indent=2)
+        with profiling.span('chunks.load_embeddings'):
+            chunk_embeddings, self.embedding_report = update_embeddings(self.directory/'chunk_embeddings.npy', self.chunks,
+                                                                        self.model_name, self._encode, reuse)
+            self._set_chunk_embeddings(chunk_embeddings)
+        profiling.count('chunks.embedding_bytes', chunk_embeddings.nbytes)
 
         return self.chunk_embeddings
-    
-    def load_or_create_chunk_embeddings(self, documents: list[dict]) -> np.ndarray:
-        # populate self.documents & self.docmap
-        self.documents = documents
-        self.document_map = { doc['id']: doc for doc in self.documents}
-    
-        # File path variables
-        file_chunk_embeddings = file_path/'chunk_embeddings.npy'
-        file_chunk_metadata = file_path/'chunk_metadata.json'
-        
-        if file_chunk_embeddings.exists() and file_chunk_metadata.exists():
-            self.chunk_embeddings = np.load(file_chunk_embeddings, 'r')
 
-            with open(file_chunk_metadata, 'r') as f:
-                self.chunk_metadata = json.load(f)
+    def _chunk_documents(self):
+        """ splits every description into chunks & sets chunks, chunk_offsets & chunk_metadata """
+        all_chunks = []
+        chunk_counts = []
+        for doc in self.documents:
+            chunks = semantic_chunk(doc['description'], chunk_size, chunk_overlap) if doc['description'] else []
+            all_chunks.extend(chunks)
+            chunk_counts.append(len(chunks))
+
+        chunk_counts = np.array(chunk_counts, dtype=np.int64)
+        self.chunk_offsets = np.zeros(len(chunk_counts) + 1, dtype=np.int64)
+        np.cumsum(chunk_counts, out=self.chunk_offsets[1:])
+
+        # chunk_idx -> position of the chunk within its movie
+        self.chunk_metadata = {
+            'movie_ids': np.repeat([doc['id'] for doc in self.documents], chunk_counts).astype(np.int64),
+            'chunk_idx': (np.arange(len(all_chunks)) - np.repeat(self.chunk_offsets[:-1], chunk_counts)).astype(np.int32),
+            'total_chunks': np.repeat(chunk_counts, chunk_counts).astype(np.int32),
+        }
+        self.chunks = all_chunks
+
+    def _set_chunk_embeddings(self, chunk_embeddings):
+        """ sets the chunk embeddings & normalizes (float32) or compresses them once {refer _set_embeddings} """
+        self.chunk_embeddings = chunk_embeddings
+        self.compressed_chunk_embeddings = self._compress(chunk_embeddings, 'chunk_embeddings')
+        self.unit_chunk_embeddings = l2_normalize(chunk_embeddings) if self.compressed_chunk_embeddings is None else None
+        self.chunk_ann_index = None     # built from the previous chunk embeddings
+
+    def _load_chunk_metadata(self, path, documents_hash):
+        """
+        Docstring for _load_chunk_metadata
 
-            return self.chunk_embeddings
-        
-        else:
-            # self.embeddings & self.chunk_metadata will be populated
-            # by the function itself
-            return self.build_chunk_embeddings(documents)
+            sets chunks, chunk_offsets & chunk_metadata from the saved
+            file if it was written for the same documents (ids &
+            descriptions), so they aren't chunked again
+
+        :return: True if loaded, False if missing, unreadable or stale
+        """
+        try:
+            with np.load(path) as saved:
+                if str(saved['documents_hash']) != documents_hash:
+                    return False
+                metadata = {name: saved[name] for name in ('movie_ids', 'chunk_idx', 'total_chunks')}
+                chunk_offsets = saved['chunk_offsets']
+                # utf-8 text of every chunk, chunk i is text[text_offsets[i]:text_offsets[i + 1]]
+                text, text_offsets = saved['chunk_text'].tobytes(), saved['chunk_text_offsets'].tolist()
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            return False
+
+        self.chunk_metadata = metadata
+        self.chunk_offsets = chunk_offsets
+        self.chunks = [text[start:end].decode() for start, end in zip(text_offsets, text_offsets[1:])]
+        return True
+
+    def _save_chunk_metadata(self, path, documents_hash):
+        """ chunks, chunk_offsets & chunk_metadata of the documents {refer _load_chunk_metadata} """
+        encoded = [chunk.encode() for chunk in self.chunks]
+        text_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(chunk) for chunk in encoded], out=text_offsets[1:])
+
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, documents_hash=np.array(documents_hash), chunk_offsets=self.chunk_offsets,
+                     chunk_text=np.frombuffer(b''.join(encoded), dtype=np.uint8), chunk_text_offsets=text_offsets,
+                     **self.chunk_metadata)
+        os.replace(tmp_path, path)
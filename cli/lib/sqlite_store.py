@@ -0,0 +1,90 @@
+"""
+    sqlite_store
+
+        SQLiteLRUStore, the on-disk tier of the caches {refer
+        lib/result_cache.py, lib/query_cache.py}: key -> value (str or
+        bytes) in a SQLite file shared by every process using it
+        (short-lived CLI runs, batch workers & the search server).
+
+            entries (key, tag, value, used)
+                key     -> cache key
+                tag     -> what the value was computed on (e.g. the index
+                           generation), a lookup only matches its own tag
+                used    -> last time the entry was read or written, at
+                           most `capacity` entries are kept, least
+                           recently used evicted first
+
+        A key & its value are one row, written in one transaction:
+        concurrent writers can't pair a key with another key's value.
+
+        Opened on first use & once per process (a connection isn't
+        fork-safe). Errors (locked, read-only or corrupt file) are
+        misses: a cache never fails a search.
+"""
+from pathlib import Path
+import os
+import time
+
+
+class SQLiteLRUStore:
+    """
+    :param path: of the SQLite file (created on first use)
+    :param capacity: no. of entries kept
+    """
+    def __init__(self, path, capacity):
+        self.path = Path(path)
+        self.capacity = capacity
+        self.connection = None
+        self.pid = None
+
+    def __len__(self):
+        try:
+            return self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except self.errors:
+            return 0
+
+    def get(self, key, tag=''):
+        """ the value of key computed on `tag`, None if there is none """
+        try:
+            connection = self._connect()
+            row = connection.execute("SELECT value FROM entries WHERE key = ? AND tag = ?", (key, tag)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE entries SET used = ? WHERE key = ? AND tag = ?", (time.time(), key, tag))
+            connection.commit()
+            return row[0]
+        except self.errors:
+            return None
+
+    def put_many(self, items, tag=''):
+        """ saves [(key, value), ...] computed on `tag`, evicting the least recently used entries once full """
+        try:
+            connection = self._connect()
+            now = time.time()
+            connection.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                                   [(key, tag, value, now) for key, value in items])
+            connection.execute("DELETE FROM entries WHERE rowid IN "
+                               "(SELECT rowid FROM entries ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.capacity,))
+            connection.commit()
+        except self.errors:
+            pass
+
+    def _connect(self):
+        if self.connection is None or self.pid != os.getpid():
+            import sqlite3      # only when a disk store is used
+            self.errors = (sqlite3.Error, OSError)
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=1.0, check_same_thread=False)
+            # a cache: losing the last writes on a crash is fine, waiting for fsync isn't
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = OFF")
+            connection.execute("CREATE TABLE IF NOT EXISTS entries "
+                               "(key TEXT, tag TEXT, value BLOB, used REAL, PRIMARY KEY (key, tag))")
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+            self.connection, self.pid = connection, os.getpid()
+
+        return self.connection
+
+    # + sqlite3.Error once sqlite3 is imported
+    errors = (OSError,)
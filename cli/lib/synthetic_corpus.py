@@ -0,0 +1,156 @@
+"""
+    synthetic_corpus
+
+        Deterministic synthetic movies & queries for the benchmark suite
+        {refer lib/benchmark.py benchmark_suite}, any corpus size without
+        shipping data.
+
+        Words are drawn from a Zipfian vocabulary (frequency of the word
+        of rank r ~ 1 / r**ZIPF_EXPONENT): the most frequent ranks are
+        English function words (mostly stop words), the rest are made-up
+        words built from syllables. Posting list lengths, stop-word share
+        & document lengths (log-normal) resemble a real description corpus.
+
+        synthetic_movies()      generator of {'id':, 'title':, 'description':}
+        synthetic_queries()     short queries of content words
+        StandInEmbedder         deterministic offline replacement of the
+                                SentenceTransformer: a text is the sum of
+                                the (seeded random) vectors of its words,
+                                so texts sharing words are similar
+"""
+from functools import lru_cache
+from itertools import islice
+import hashlib
+
+import numpy as np
+
+# most frequent ranks of the vocabulary
+FUNCTION_WORDS = ['the', 'a', 'of', 'and', 'to', 'in', 'is', 'his', 'her', 'with',
+                  'for', 'on', 'by', 'an', 'as', 'at', 'from', 'that', 'their', 'who']
+SYLLABLES = ['ka', 'ro', 'mi', 'ta', 'ne', 'lo', 'bar', 'ven', 'dra', 'sil', 'tor', 'qua',
+             'ex', 'um', 'pel', 'zor', 'in', 'ar', 'est', 'gor', 'ed', 'al', 'ship', 'mon']
+ZIPF_EXPONENT = 1.0
+VOCABULARY_SIZE = 50_000
+# log-normal description length (words), median ~ exp(mu)
+DESCRIPTION_LENGTH_MU, DESCRIPTION_LENGTH_SIGMA = 4.0, 0.5
+# movies generated at a time
+_BATCH = 1000
+
+
+@lru_cache(maxsize=4)
+def vocabulary(size=VOCABULARY_SIZE, seed=0):
+    """ (words by rank, cumulative Zipf probabilities) """
+    rng = np.random.default_rng(seed)
+    words, seen = list(FUNCTION_WORDS), set(FUNCTION_WORDS)
+    while len(words) < size:
+        word = "".join(SYLLABLES[i] for i in rng.integers(len(SYLLABLES), size=rng.integers(2, 5)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+
+    weights = 1 / np.arange(1, size + 1) ** ZIPF_EXPONENT
+    return words, np.cumsum(weights / weights.sum())
+
+
+def _sample_words(rng, no_of_words, vocab_size=VOCABULARY_SIZE, lowest_rank=0):
+    """ word ranks drawn from the Zipf distribution (ranks < lowest_rank excluded) """
+    _, cumulative = vocabulary(vocab_size)
+    low = cumulative[lowest_rank - 1] if lowest_rank else 0.0
+    return np.searchsorted(cumulative, rng.uniform(low, 1.0, size=no_of_words)).clip(0, vocab_size - 1)
+
+
+def synthetic_movies(no_of_docs, seed=0, vocab_size=VOCABULARY_SIZE):
+    """
+    Docstring for synthetic_movies
+
+        the same seed -> the same movies, generated lazily (a 1M movie
+        corpus is never in memory)
+
+    :param no_of_docs: no. of movies, ids 1..no_of_docs
+    :return: generator of {'id':, 'title':, 'description':}
+    """
+    words, _ = vocabulary(vocab_size)
+    rng = np.random.default_rng(seed)
+
+    for first_id in range(1, no_of_docs + 1, _BATCH):
+        # always whole batches: a smaller corpus is a prefix of a larger one
+        title_lengths = rng.integers(1, 5, size=_BATCH)
+        description_lengths = np.maximum(3, rng.lognormal(DESCRIPTION_LENGTH_MU, DESCRIPTION_LENGTH_SIGMA, size=_BATCH)).astype(int)
+        batch_words = [words[r] for r in _sample_words(rng, int(title_lengths.sum() + description_lengths.sum()),
+                                                      vocab_size).tolist()]
+
+        position = 0
+        lengths = zip(title_lengths.tolist(), description_lengths.tolist())
+        for i, (title_length, description_length) in enumerate(islice(lengths, no_of_docs + 1 - first_id)):
+            title = batch_words[position:position + title_length]
+            position += title_length
+            description = batch_words[position:position + description_length]
+            position += description_length
+
+            # sentences of ~12 words
+            sentences = [" ".join(description[start:start + 12]).capitalize() for start in range(0, len(description), 12)]
+            yield {'id': first_id + i,
+                   'title': " ".join(title).title(),
+                   'description': ". ".join(sentences) + "."}
+
+
+def synthetic_queries(no_of_queries, seed=0, vocab_size=VOCABULARY_SIZE):
+    """ 1 to 4 content words (no function words) each, Zipf distributed like the corpus """
+    words, _ = vocabulary(vocab_size)
+    rng = np.random.default_rng(seed + 1)     # not the corpus' random stream
+
+    lengths = rng.integers(1, 5, size=no_of_queries)
+    ranks = _sample_words(rng, int(lengths.sum()), vocab_size, lowest_rank=len(FUNCTION_WORDS))
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+    ranks = ranks.tolist()
+    return [" ".join(words[r] for r in ranks[start:end]) for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+class StandInEmbedder:
+    """
+    :param dim: no. of dimensions of the embeddings
+
+    encode() has the signature SemanticSearch uses, so it can be passed
+    as SemanticSearch(model=StandInEmbedder()). Deterministic across runs
+    & processes (word vectors are seeded by a hash of the word).
+    """
+    def __init__(self, dim=384):
+        self.dim = dim
+        self.word_ids = {}
+        self.word_vectors = np.empty((0, dim), dtype=np.float32)
+        self.max_seq_length = 256
+
+    def encode(self, texts, **kwargs):
+        """ (no. of texts, dim) float32, the sum of the word vectors of every text """
+        new_words = []
+        ids, lengths = [], []
+        for text in texts:
+            tokens = text.lower().replace('.', ' ').split()
+            for token in tokens:
+                word_id = self.word_ids.get(token)
+                if word_id is None:
+                    word_id = self.word_ids[token] = len(self.word_ids)
+                    new_words.append(token)
+                ids.append(word_id)
+            lengths.append(len(tokens))
+
+        if new_words:
+            first = len(self.word_ids) - len(new_words)
+            if len(self.word_ids) > len(self.word_vectors):     # grows by doubling, not per batch
+                word_vectors = np.empty((max(len(self.word_ids), 2 * len(self.word_vectors)), self.dim), dtype=np.float32)
+                word_vectors[:first] = self.word_vectors[:first]
+                self.word_vectors = word_vectors
+            self.word_vectors[first:len(self.word_ids)] = [self._word_vector(word) for word in new_words]
+
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        non_empty = np.flatnonzero(lengths)
+        if len(non_empty):
+            starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])[non_empty]
+            embeddings[non_empty] = np.add.reduceat(self.word_vectors[ids], starts)
+
+        return embeddings
+
+    def _word_vector(self, word):
+        seed = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), 'little')
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
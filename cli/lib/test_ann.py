@@ -0,0 +1,51 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from ann import IVFIndex, load_or_build_ivf, recall_report
+from vectors import l2_normalize, top_k
+
+
+class TestIVFIndex(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = l2_normalize(rng.normal(size=(500, 16)))
+        self.queries = l2_normalize(rng.normal(size=(10, 16)))
+        self.index = IVFIndex.build(self.vectors, n_lists=10)
+
+    def test_lists_cover_every_vector(self):
+        self.assertEqual(sorted(self.index.ids.tolist()), list(range(500)))
+        self.assertEqual(self.index.list_offsets[-1], 500)
+
+    def test_all_lists_is_exact(self):
+        exact = top_k(self.queries @ self.vectors.T, 5)
+        for (ids, scores), expected in zip(self.index.search(self.queries, 5, nprobe=10), exact):
+            self.assertEqual(sorted(ids.tolist()), sorted(expected.tolist()))
+            self.assertTrue(np.all(np.diff(scores) <= 0))
+
+    def test_recall_grows_with_nprobe(self):
+        report = recall_report(self.vectors, self.queries, 5, [1, 10], self.index)
+        self.assertEqual(report[-1]['recall'], 1.0)
+        self.assertLessEqual(report[1]['recall'], report[2]['recall'])
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory)/'vectors.ivf.npz'
+            self.index.save(path)
+
+            loaded = IVFIndex.load(path, self.vectors)
+            self.assertEqual(loaded.ids.tolist(), self.index.ids.tolist())
+            np.testing.assert_array_equal(loaded.vectors, self.index.vectors)
+
+            # other vectors -> stale index, rebuilt
+            changed = self.vectors.copy()
+            changed[0] = changed[1]
+            self.assertIsNone(IVFIndex.load(path, changed))
+            self.assertEqual(load_or_build_ivf(path, changed, 10).fingerprint, IVFIndex.load(path, changed).fingerprint)
+
+
+if __name__ == '__main__':
+    unittest.main()
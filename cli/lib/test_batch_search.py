@@ -0,0 +1,75 @@
+import unittest
+import io
+import json
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import lib.inverted_index
+from lib.inverted_index import InvertedIndex
+from batch_search import _parse_queries, batch_bm25_search, latency_report, write_results
+
+
+MOVIES = [
+    {'id': 1, 'title': 'Jungle Bears', 'description': 'A family of bears lives in the jungle.'},
+    {'id': 2, 'title': 'Bear Hunting', 'description': 'A guide for beginners on bear hunting.'},
+    {'id': 3, 'title': 'Future Cyborg', 'description': 'A cyborg travels from the future.'},
+    {'id': 4, 'title': 'The Terminator', 'description': 'A cyborg from the future hunts John Connor.'},
+]
+
+
+class TestBatchSearch(unittest.TestCase):
+
+    def test_parse_queries(self):
+        lines = ["bear hunting\n", "\n", '{"query": "cyborg", "id": "q7", "relevant": [3]}\n', "future"]
+
+        self.assertEqual(_parse_queries(lines), [{'id': 1, 'query': 'bear hunting'},
+                                                 {'id': 'q7', 'query': 'cyborg', 'relevant': [3]},
+                                                 {'id': 4, 'query': 'future'}])
+        with self.assertRaises(ValueError):
+            _parse_queries(['{"text": "bear"}'])
+
+    def test_latency_report(self):
+        report = latency_report([i / 1000 for i in range(1, 101)], 2.0)
+
+        self.assertEqual(report['queries'], 100)
+        self.assertEqual(report['queries_per_second'], 50.0)
+        self.assertAlmostEqual(report['p50_ms'], 50.0)
+        self.assertAlmostEqual(report['p99_ms'], 99.0)
+        self.assertAlmostEqual(report['max_ms'], 100.0)
+        self.assertEqual(latency_report([], 0.0)['p90_ms'], 0.0)
+
+    def test_batch_bm25_search(self):
+        with tempfile.TemporaryDirectory() as cache_dir, \
+             mock.patch.object(lib.inverted_index, 'file_path', Path(cache_dir)):
+            builder = InvertedIndex()
+            builder.movies = MOVIES
+            builder.build(workers=1)
+            builder.save()
+
+            inverted_index = InvertedIndex()
+            inverted_index.load_index()
+
+            queries = [{'id': i, 'query': query} for i, query in enumerate(['bear', 'cyborg future', 'jungle', 'zzz'])]
+            serial = list(batch_bm25_search(queries, 2, workers=1))
+            # forked workers see the patched cache directory
+            pooled = list(batch_bm25_search(queries, 2, workers=2))
+
+            for query, results, seconds in serial:
+                expected = inverted_index.bm25_search(query['query'], 2)
+                self.assertEqual([(res['id'], res['score']) for res in results], list(expected.items()))
+                self.assertGreaterEqual(seconds, 0)
+
+            self.assertEqual([(query, results) for query, results, _ in pooled],
+                             [(query, results) for query, results, _ in serial])
+
+            output = io.StringIO()
+            report = write_results(iter(serial), output)
+            lines = [json.loads(line) for line in output.getvalue().splitlines()]
+            self.assertEqual([line['id'] for line in lines], [0, 1, 2, 3])
+            self.assertEqual(lines[3]['results'], [])
+            self.assertEqual(report['queries'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from benchmark import _parse_importtime, compare_reports
+
+
+class TestParseImporttime(unittest.TestCase):
+
+    def test_parse_importtime(self):
+        stderr = ("import time: self [us] | cumulative | imported package\n"
+                  "import time:       120 |        120 |     _io\n"
+                  "import time:      1500 |       2000 |   json.decoder\n"
+                  "import time:       500 |       2500 | json\n"
+                  "usage: cli.py [-h]\n")
+
+        self.assertEqual(_parse_importtime(stderr),
+                         [('_io', 0.12, 0.12, 2), ('json.decoder', 2.0, 1.5, 1), ('json', 2.5, 0.5, 0)])
+
+
+class TestCompareReports(unittest.TestCase):
+
+    def test_compare_reports(self):
+        baseline = {'corpora': [{'docs': 1000,
+                                 'build': {'build_seconds': 2.0, 'docs_per_second': 500.0},
+                                 'query': {'bm25': {'queries': 100, 'p95_ms': 0.2, 'p99_ms': 10.0}}}]}
+        report = {'corpora': [{'docs': 1000,
+                               'build': {'build_seconds': 2.1, 'docs_per_second': 300.0},
+                               'query': {'bm25': {'queries': 100, 'p95_ms': 0.4, 'p99_ms': 20.0}}},
+                              {'docs': 5000, 'build': {'build_seconds': 9.0}}]}
+
+        rows = {row['metric']: row for row in compare_reports(baseline, report, tolerance=0.25)}
+
+        self.assertEqual(set(rows), {'build.build_seconds', 'build.docs_per_second',
+                                     'query.bm25.p95_ms', 'query.bm25.p99_ms'})
+        self.assertFalse(rows['build.build_seconds']['regression'])     # +5%
+        self.assertTrue(rows['build.docs_per_second']['regression'])    # throughput -40%
+        self.assertFalse(rows['query.bm25.p95_ms']['regression'])       # +100%, but below the noise floor
+        self.assertTrue(rows['query.bm25.p99_ms']['regression'])
+        self.assertAlmostEqual(rows['query.bm25.p99_ms']['change'], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
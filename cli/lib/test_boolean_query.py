@@ -0,0 +1,114 @@
+import unittest
+import random
+
+from boolean_query import (QueryError, parse_query, evaluate, query_terms, phrases_as_terms, gallop, intersect,
+                           difference)
+from preprocessing import Analyzer
+
+
+class ListPostings:
+    """ evaluate() source over in-memory postings """
+    def __init__(self, postings, no_of_docs, deleted=()):
+        self.index = postings
+        self.no_of_docs = no_of_docs
+        self.deleted = set(deleted)
+
+    def live(self, docnums):
+        return [docnum for docnum in docnums if docnum not in self.deleted]
+
+    def df(self, token):
+        return len(self.index.get(token, []))
+
+    def postings(self, token):
+        return self.live(self.index.get(token, []))
+
+    def contains(self, token):
+        return set(self.index.get(token, [])).__contains__
+
+    def phrase(self, offsets):
+        raise NotImplementedError
+
+
+class TestParseQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.analyzer = Analyzer()
+
+    def parse(self, query, default_operator='OR'):
+        return parse_query(query, self.analyzer, default_operator)
+
+    def test_precedence(self):
+        self.assertEqual(self.parse('bears AND jungle OR cyborg'),
+                         ('or', [('and', [('term', 'bear'), ('term', 'jungl')]), ('term', 'cyborg')]))
+        self.assertEqual(self.parse('bears AND (jungle OR cyborg)'),
+                         ('and', [('term', 'bear'), ('or', [('term', 'jungl'), ('term', 'cyborg')])]))
+        self.assertEqual(self.parse('NOT NOT bears'), ('not', ('not', ('term', 'bear'))))
+
+    def test_default_operator(self):
+        self.assertEqual(self.parse('bears jungle'), ('or', [('term', 'bear'), ('term', 'jungl')]))
+        self.assertEqual(self.parse('bears jungle', 'AND'), ('and', [('term', 'bear'), ('term', 'jungl')]))
+        # `a NOT b` is `a AND NOT b` whatever the default
+        self.assertEqual(self.parse('bears NOT jungle'), ('and', [('term', 'bear'), ('not', ('term', 'jungl'))]))
+
+    def test_stop_words_and_phrases(self):
+        self.assertEqual(self.parse('the AND bears'), ('term', 'bear'))
+        self.assertIsNone(self.parse('the OR (a)'))
+        self.assertEqual(self.parse('"lord of the rings"'), ('phrase', {'lord': [0], 'ring': [3]}))
+        self.assertEqual(query_terms(self.parse('"lord of the rings" NOT bears OR cyborg')), ['lord', 'ring', 'cyborg'])
+
+    def test_errors(self):
+        for query in ['bears AND', '(bears', 'bears)', 'OR bears', 'bears AND OR cyborg']:
+            with self.assertRaises(QueryError):
+                self.parse(query)
+
+    def test_phrases_as_terms(self):
+        self.assertEqual(phrases_as_terms(self.parse('"lord of the rings" NOT "bear hunting" OR cyborg')),
+                         ('or', [('and', [('term', 'lord'), ('term', 'ring'),
+                                          ('not', ('and', [('term', 'bear'), ('term', 'hunt')]))]),
+                                 ('term', 'cyborg')]))
+
+
+class TestEvaluate(unittest.TestCase):
+
+    def test_gallop(self):
+        values = [1, 3, 5, 7, 9, 11, 13]
+        for target in range(15):
+            for low in range(len(values)):
+                expected = next((i for i in range(low, len(values)) if values[i] >= target), len(values))
+                self.assertEqual(gallop(values, target, low), expected)
+
+    def test_intersect_and_difference(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            a = sorted(rng.sample(range(300), rng.randint(0, 50)))
+            b = sorted(rng.sample(range(300), rng.randint(0, 250)))
+            self.assertEqual(intersect(a, b), sorted(set(a) & set(b)))
+            self.assertEqual(difference(a, b), sorted(set(a) - set(b)))
+            self.assertEqual(difference(b, a), sorted(set(b) - set(a)))
+
+    def test_matches_sets(self):
+        rng = random.Random(1)
+        postings = {token: sorted(rng.sample(range(500), size))
+                    for token, size in [('a', 400), ('b', 250), ('c', 30), ('d', 5)]}
+        deleted = rng.sample(range(500), 40)
+        source = ListPostings(postings, 500, deleted)
+        live = set(range(500)) - set(deleted)
+        sets = {token: set(docnums) & live for token, docnums in postings.items()}
+
+        queries = [
+            (('and', [('term', 'a'), ('term', 'b')]), sets['a'] & sets['b']),
+            (('and', [('term', 'a'), ('term', 'b'), ('term', 'c')]), sets['a'] & sets['b'] & sets['c']),
+            (('or', [('term', 'c'), ('term', 'd')]), sets['c'] | sets['d']),
+            (('and', [('term', 'a'), ('not', ('term', 'b'))]), sets['a'] - sets['b']),
+            (('not', ('term', 'a')), live - sets['a']),
+            (('and', [('not', ('term', 'a')), ('not', ('term', 'c'))]), live - sets['a'] - sets['c']),
+            (('and', [('term', 'a'), ('or', [('term', 'c'), ('and', [('term', 'b'), ('not', ('term', 'd'))])])]),
+             sets['a'] & (sets['c'] | (sets['b'] - sets['d']))),
+            (('and', [('term', 'a'), ('term', 'zebra')]), set()),
+        ]
+        for node, expected in queries:
+            self.assertEqual(evaluate(node, source), sorted(expected), node)
+
+
+if __name__ == '__main__':
+    unittest.main()
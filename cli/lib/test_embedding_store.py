@@ -0,0 +1,93 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from embedding_store import update_embeddings, manifest_path
+
+
+class FakeModel:
+    """ deterministic 'embeddings', counts the texts it encodes """
+    def __init__(self, dim=3):
+        self.dim = dim
+        self.encoded = []
+
+    def encode(self, texts):
+        self.encoded.extend(texts)
+        return np.array([[len(text), sum(map(ord, text))] + [1.0] * (self.dim - 2) for text in texts])
+
+
+class TestUpdateEmbeddings(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)/'movie_embeddings.npy'
+        self.model = FakeModel()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def update(self, texts, model_name='model', reuse=True):
+        embeddings, report = update_embeddings(self.path, texts, model_name, self.model.encode, reuse,
+                                               batch_size=2, window=3)
+        np.testing.assert_array_equal(embeddings, FakeModel().encode(texts))
+        return report['encoded']
+
+    def test_only_changed_texts_are_encoded(self):
+        self.assertEqual(self.update(["bear", "cyborg", "future"]), 3)
+        self.assertEqual(self.update(["bear", "cyborg", "future"]), 0)
+
+        # edited, moved, removed & new rows
+        self.model.encoded.clear()
+        self.assertEqual(self.update(["future", "bear hunting", "bear", "terminator"]), 2)
+        self.assertEqual(sorted(self.model.encoded), ["bear hunting", "terminator"])
+
+    def test_full_rebuilds(self):
+        self.update(["bear", "cyborg"])
+        self.assertEqual(self.update(["bear", "cyborg"], reuse=False), 2)
+        self.assertEqual(self.update(["bear", "cyborg"], model_name='other model'), 2)
+
+        # a matrix without manifest is not trusted
+        manifest_path(self.path).unlink()
+        self.assertEqual(self.update(["bear", "cyborg"]), 2)
+
+    def test_derived_files_are_deleted(self):
+        self.update(["bear"])
+        derived = self.path.with_name('movie_embeddings.ivf.npz')
+        derived.touch()
+
+        self.update(["bear"])
+        self.assertTrue(derived.exists())
+        self.update(["cyborg"])
+        self.assertFalse(derived.exists())
+
+    def test_interrupted_update_resumes(self):
+        texts = [f"movie {'x' * i}" for i in range(10)]
+
+        class Interrupt(Exception):
+            pass
+
+        def failing_encode(batch):
+            if len(self.model.encoded) >= 6:
+                raise Interrupt()
+            return self.model.encode(batch)
+
+        # windows of 3 texts: 2 windows checkpointed before the failure
+        with self.assertRaises(Interrupt):
+            update_embeddings(self.path, texts, 'model', failing_encode, batch_size=2, window=3)
+        self.assertFalse(self.path.exists())
+
+        self.model.encoded.clear()
+        embeddings, report = update_embeddings(self.path, texts, 'model', self.model.encode, batch_size=2, window=3)
+        self.assertEqual((report['resumed'], report['encoded']), (6, 4))
+        self.assertEqual(self.model.encoded, texts[6:])
+        np.testing.assert_array_equal(embeddings, FakeModel().encode(texts))
+        self.assertFalse(self.path.with_name('movie_embeddings.progress.json').exists())
+
+    def test_no_texts(self):
+        self.assertEqual(update_embeddings(self.path, [], 'model', self.model.encode)[0].shape, (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,20 @@
 import unittest
+import tempfile
+from pathlib import Path
+from unittest import mock
 
+import inverted_index
 from inverted_index import InvertedIndex
+from lib.boolean_query import QueryError
+
+
+MOVIES = [
+    {'id': 1, 'title': 'Jungle Bears', 'description': 'A family of bears lives in the jungle.'},
+    {'id': 2, 'title': 'Bear Hunting', 'description': 'A guide for beginners on bear hunting.'},
+    {'id': 3, 'title': 'Future Cyborg', 'description': 'A cyborg travels from the future.'},
+    {'id': 4, 'title': 'The Terminator', 'description': 'A cyborg from the future hunts John Connor.'},
+    {'id': 5, 'title': 'Bears Bears Bears', 'description': 'Bear bear bear bear.'},
+]
 
 
 class TestInvertedIndex(unittest.TestCase):
@@ -13,5 +27,322 @@ class TestInvertedIndex(unittest.TestCase):
 
         return bm25_idf
 
+
+class TestBM25Search(unittest.TestCase):
+
+    def setUp(self):
+        # build & save a small index into a temporary cache directory
+        self.cache_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(inverted_index, 'file_path', Path(self.cache_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.cache_dir.cleanup)
+
+        # tiny blocks, so the corpus spans several blocks per token
+        patcher = mock.patch.object(inverted_index, 'BM25_BLOCK_SIZE', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.builder = InvertedIndex()
+        self.builder.movies = MOVIES
+        self.builder.build(workers=1)
+        self.builder.save()
+
+        self.inverted_index = InvertedIndex()
+        self.inverted_index.load_index()
+
+    def brute_force(self, query, limit):
+        """ scores every document with bm25(), one token at a time """
+        tokens = inverted_index.get_analyzer().analyze(query)
+        scores = {}
+        for doc_id in (movie['id'] for movie in MOVIES):
+            scores[doc_id] = round(sum(self.inverted_index.bm25(doc_id, token) for token in tokens), 2)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return {doc_id: score for doc_id, score in ranked[:limit] if score > 0}
+
+    def test_statistics(self):
+        self.assertEqual(self.inverted_index.no_of_docs, len(MOVIES))
+        self.assertAlmostEqual(self.inverted_index.avg_doc_length,
+                               sum(self.builder.doc_lengths.values()) / len(MOVIES))
+
+    def test_documents_and_postings(self):
+        self.assertEqual(self.inverted_index.get_document(3), MOVIES[2])
+        self.assertEqual(self.inverted_index.get_postings('cyborg'), [3, 4])
+        self.assertEqual(self.inverted_index.get_postings('zebra'), [])
+        self.assertEqual(self.inverted_index.get_tf(5, 'bears'), 7)
+
+    def test_matches_brute_force(self):
+        for query in ['bear', 'cyborg future', 'bear hunting guide', 'future future cyborg']:
+            for limit in [1, 3, 10]:
+                self.assertEqual(self.inverted_index.bm25_search(query, limit),
+                                 self.brute_force(query, limit))
+
+    def test_pruned_strategies_match_exhaustive(self):
+        for query in ['bear', 'cyborg future', 'bear hunting guide john', 'future future cyborg']:
+            for limit in [1, 2, 3, 10]:
+                report = self.inverted_index.compare_strategies(query, limit)
+                for strategy in ('wand', 'bmw'):
+                    self.assertEqual(report[strategy]['results'], report['exhaustive']['results'])
+
+    def test_impact_strategy(self):
+        builder = InvertedIndex()
+        builder.movies = MOVIES
+        builder.build(impacts=True)
+        builder.save()
+
+        impact_index = InvertedIndex()
+        for query in ['bear', 'cyborg future', 'bear hunting guide john']:
+            # every matching document fits in the limit -> same results, exact scores
+            self.assertEqual(impact_index.bm25_search(query, 10, 'impact'),
+                             impact_index.bm25_search(query, 10, 'exhaustive'))
+
+            # impacts were built with the default k1, falls back to exact scoring
+            self.assertEqual(impact_index.bm25_search(query, 2, 'impact', k1=1.2),
+                             impact_index.bm25_search(query, 2, 'exhaustive', k1=1.2))
+
+    def segment_bytes(self):
+        """ contents of the only segment of the saved index """
+        manifest = inverted_index.load_manifest(Path(self.cache_dir.name), inverted_index.manifest_filename)
+        self.assertEqual(len(manifest['segments']), 1)
+        return (Path(self.cache_dir.name)/manifest['segments'][0]['file']).read_bytes()
+
+    def test_parallel_build_is_byte_identical(self):
+        serial = self.segment_bytes()
+
+        with mock.patch.object(inverted_index, 'BUILD_SHARD_SIZE', 1):
+            builder = InvertedIndex()
+            builder.movies = MOVIES
+            builder.build(workers=2)
+            builder.save()
+
+        self.assertEqual(self.segment_bytes(), serial)
+
+    def test_incremental_updates(self):
+        updated = {'id': 2, 'title': 'Bear Watching', 'description': 'A guide for watching cyborg bears.'}
+        added = [{'id': 6, 'title': 'Cyborg Bears', 'description': 'The future of bears.'},
+                 {'id': 7, 'title': 'Jungle', 'description': 'Life in the jungle.'}]
+        live = [MOVIES[0], updated, MOVIES[2], *added, MOVIES[4]]
+
+        index = InvertedIndex()
+        index.add_documents(added)
+        index.update_documents([updated])
+        index.delete_documents([4])
+        self.assertEqual(len(index.segments), 3)
+        with self.assertRaises(ValueError):
+            index.add_documents([MOVIES[0]])
+
+        # same statistics & results as an index built from the live documents
+        builder = InvertedIndex()
+        builder.movies = sorted(live, key=lambda movie: movie['id'])
+        builder.build(workers=1)
+        self.assertEqual(index.no_of_docs, len(live))
+        self.assertAlmostEqual(index.avg_doc_length, sum(builder.doc_lengths.values()) / len(live))
+        self.assertEqual(index.get_postings('cyborg'), [2, 3, 6])
+        self.assertEqual(index.get_document(2), updated)
+        with self.assertRaises(KeyError):
+            index.get_document(4)
+
+        queries = ['bear', 'cyborg future', 'bear hunting guide john', 'jungle bears']
+        before = {query: index.compare_strategies(query, 3) for query in queries}
+        for report in before.values():
+            for strategy in ('wand', 'bmw'):
+                self.assertEqual(report[strategy]['results'], report['exhaustive']['results'])
+
+        index.merge()
+        self.assertEqual(len(index.segments), 1)
+        merged = self.segment_bytes()
+        for query in queries:
+            self.assertEqual(index.compare_strategies(query, 3)['bmw']['results'],
+                             before[query]['exhaustive']['results'])
+
+        builder.save()
+        self.assertEqual(self.segment_bytes(), merged)
+
+    def test_unknown_token(self):
+        self.assertEqual(self.inverted_index.bm25_search('zebra', 5), {})
+
+    def test_result_cache(self):
+        cache = inverted_index.get_result_cache(inverted_index.file_path)
+        results = self.inverted_index.bm25_search('bear hunting', 3)
+        self.assertEqual(self.inverted_index.bm25_search('hunting the bears', 3), results)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+        # other processes share the results through the disk store
+        other = type(cache)(path=inverted_index.file_path/'bm25_results.sqlite')
+        key = inverted_index.result_key(['hunt', 'bear'], 3, inverted_index.BM25_SEARCH_STRATEGY,
+                                        inverted_index.BM25_K1, inverted_index.BM25_B)
+        self.assertEqual(dict(other.get(self.inverted_index.generation_tag(), key)), results)
+
+        # an update changes the generation: cached results aren't used
+        tag = self.inverted_index.generation_tag()
+        self.inverted_index.add_documents([{'id': 6, 'title': 'Bear Hunting', 'description': 'Hunting bears.'}])
+        self.assertNotEqual(self.inverted_index.generation_tag(), tag)
+        updated = self.inverted_index.bm25_search('bear hunting', 3)
+        self.assertEqual(updated, self.inverted_index.bm25_search('bear hunting', 3, use_cache=False))
+        self.assertIn(6, updated)
+
+    def brute_force_bm25f(self, query, limit, fields):
+        """ BM25F of every document, from its analyzed title & description """
+        analyze = inverted_index.get_analyzer().analyze
+        texts = {movie['id']: (analyze(movie['title']), analyze(movie['description'])) for movie in MOVIES}
+        avg_lengths = [sum(len(text[i]) for text in texts.values()) / len(texts) for i in (0, 1)]
+        k1 = inverted_index.BM25_K1
+
+        scores = {}
+        for doc_id, text in texts.items():
+            score = 0.0
+            for token in analyze(query):
+                pseudo_tf = sum(boost * field.count(token) / (1 - b + b * len(field) / avg_length)
+                                for field, avg_length, (boost, b) in zip(text, avg_lengths, fields))
+                score += self.inverted_index.get_bm25_idf(token) * pseudo_tf * (k1 + 1) / (pseudo_tf + k1)
+            scores[doc_id] = round(score, 2)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return {doc_id: score for doc_id, score in ranked[:limit] if score > 0}
+
+    def test_bm25f(self):
+        self.assertTrue(self.inverted_index.has_fields())
+        fields = {'title': {'boost': 3.0, 'b': 0.3}, 'description': {'boost': 1.0, 'b': 0.8}}
+        for query in ['bear', 'cyborg future', 'bear hunting guide john', 'terminator jungle']:
+            for limit in [1, 3, 10]:
+                self.assertEqual(self.inverted_index.bm25_search(query, limit, fields=fields),
+                                 self.brute_force_bm25f(query, limit, [(3.0, 0.3), (1.0, 0.8)]))
+
+                report = self.inverted_index.compare_strategies(query, limit, fields=fields)
+                self.assertNotIn('impact', report)
+                for strategy in ('wand', 'bmw'):
+                    self.assertEqual(report[strategy]['results'], report['exhaustive']['results'])
+
+        # missing fields & values are the defaults
+        self.assertEqual(self.inverted_index.bm25_search('bear', 5, fields={}),
+                         self.brute_force_bm25f('bear', 5, [(field['boost'], field['b'])
+                                                            for field in inverted_index.BM25F_FIELDS.values()]))
+        with self.assertRaises(ValueError):
+            self.inverted_index.bm25_search('bear', 5, fields={'plot': {'boost': 2.0}})
+
+    def test_bm25f_title_boost(self):
+        # "future" is in the title of 3 only: the title boost decides 3 vs 4
+        plain = self.inverted_index.bm25_search('future', 2, fields={'title': {'boost': 1.0, 'b': 0.75}})
+        boosted = self.inverted_index.bm25_search('future', 2, fields={'title': {'boost': 5.0}})
+        self.assertEqual(list(boosted), [3, 4])
+        self.assertGreater(boosted[3] - boosted[4], plain[3] - plain[4])
+
+    def test_bm25f_survives_updates(self):
+        fields = {'title': {'boost': 2.5}}
+        self.inverted_index.add_documents([{'id': 6, 'title': 'Cyborg Bears', 'description': 'Bears of the future.'}])
+        self.inverted_index.delete_documents([2])
+        self.assertTrue(self.inverted_index.has_fields())
+        updated = self.inverted_index.bm25_search('cyborg bear', 5, 'exhaustive', fields=fields)
+        self.assertEqual(self.inverted_index.bm25_search('cyborg bear', 5, 'bmw', fields=fields), updated)
+
+        self.inverted_index.merge()
+        self.assertEqual(len(self.inverted_index.segments), 1)
+        self.assertEqual(self.inverted_index.bm25_search('cyborg bear', 5, 'bmw', fields=fields), updated)
+
+    def test_boolean_search(self):
+        search = self.inverted_index.boolean_search
+        self.assertEqual(search('bear cyborg'), [1, 2, 3, 4, 5])
+        self.assertEqual(search('bear AND hunting'), [2])
+        self.assertEqual(search('(bears OR cyborg) NOT future'), [1, 2, 5])
+        self.assertEqual(search('NOT bear'), [3, 4])
+        self.assertEqual(search('bear cyborg', limit=2), [1, 2])
+        self.assertEqual(search('the'), [])
+
+        # ranked by the BM25 score of the query tokens
+        ranked = self.inverted_index.bm25_search('bear', 5, 'exhaustive')
+        self.assertEqual(search('bear NOT jungle', rank=True), [doc_id for doc_id in ranked if doc_id != 1])
+        self.assertEqual([movie['id'] for movie in self.inverted_index.keyword_search('cyborg AND future')], [3, 4])
+
+    def test_phrases_without_positions(self):
+        # no positions: a phrase matches the documents with all of its tokens
+        self.assertFalse(self.inverted_index.has_positions())
+        self.assertEqual(self.inverted_index.boolean_search('"hunting bear"'), [2])
+        self.assertEqual(self.inverted_index.boolean_search('"future cyborg" NOT john'), [3])
+        self.assertEqual(self.inverted_index.bm25_search('"hunting bear" guide', 5),
+                         {2: self.inverted_index.bm25_search('hunting bear guide', 5)[2]})
+
+    def test_malformed_boolean_queries(self):
+        for query in ['bear AND', '(bear', 'bear)', 'NOT', 'OR bear']:
+            with self.assertRaises(QueryError):
+                self.inverted_index.keyword_search(query)
+
+
+class TestPositions(unittest.TestCase):
+
+    MOVIES = [
+        {'id': 1, 'title': 'Jurassic Park', 'description': 'Dinosaurs escape in a park.'},
+        {'id': 2, 'title': 'Park Jurassic', 'description': 'A jurassic park parody, the park of a jurassic lake.'},
+        {'id': 3, 'title': 'The Lost World', 'description': 'Back to the park: jurassic beasts roam the island park.'},
+        {'id': 4, 'title': 'Lord of the Rings', 'description': 'The rings of the lord.'},
+        {'id': 5, 'title': 'Rings', 'description': 'The lord has rings, lord of rings.'},
+    ]
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(inverted_index, 'file_path', Path(self.cache_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.cache_dir.cleanup)
+
+        patcher = mock.patch.object(inverted_index, 'BM25_BLOCK_SIZE', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        builder = InvertedIndex()
+        builder.movies = self.MOVIES
+        builder.build(workers=1, positions=True)
+        builder.save()
+
+        self.inverted_index = InvertedIndex()
+        self.inverted_index.load_index()
+
+    def test_phrase_search(self):
+        self.assertTrue(self.inverted_index.has_positions())
+        self.assertEqual(self.inverted_index.phrase_search('jurassic park'), [1, 2])
+        self.assertEqual(self.inverted_index.phrase_search('park jurassic'), [2, 3])
+        # stop words keep their place: "lord of the rings" isn't "rings of the lord"
+        self.assertEqual(self.inverted_index.phrase_search('Lord of the Rings'), [4])
+        self.assertEqual(self.inverted_index.phrase_search('lord of rings'), [5])
+        self.assertEqual(self.inverted_index.phrase_search('jurassic dinosaurs'), [])
+
+    def test_quoted_phrases(self):
+        self.assertEqual(inverted_index.split_phrases('"jurassic park" island'), (['jurassic park'], ' jurassic park  island'))
+        self.assertEqual(inverted_index.split_phrases('jurassic "park'), ([], 'jurassic  park'))
+
+        # the documents holding the phrase, with their exhaustive BM25 scores
+        exhaustive = self.inverted_index.bm25_search('park jurassic', 5, 'exhaustive')
+        results = self.inverted_index.bm25_search('"jurassic park"', 5)
+        self.assertEqual(results, {doc_id: exhaustive[doc_id] for doc_id in (2, 1)})
+
+    def test_proximity(self):
+        results = self.inverted_index.bm25_search('jurassic park', 3, proximity=True)
+        plain = self.inverted_index.bm25_search('jurassic park', 3)
+        # "jurassic park" in 1 -> a full boost, only "park jurassic" in 3 -> a third of it
+        self.assertAlmostEqual(results[1], plain[1] + inverted_index.PROXIMITY_WEIGHT)
+        self.assertAlmostEqual(results[3], plain[3] + inverted_index.PROXIMITY_WEIGHT / 3, places=2)
+
+    def test_positions_survive_updates(self):
+        self.inverted_index.add_documents([{'id': 6, 'title': 'Jurassic', 'description': 'Park rangers of jurassic park.'}])
+        self.inverted_index.delete_documents([2])
+        self.assertTrue(self.inverted_index.has_positions())
+        self.assertEqual(self.inverted_index.phrase_search('jurassic park'), [1, 6])
+
+        self.inverted_index.merge()
+        self.assertEqual(len(self.inverted_index.segments), 1)
+        self.assertEqual(self.inverted_index.phrase_search('jurassic park'), [1, 6])
+
+    def test_without_positions(self):
+        builder = InvertedIndex()
+        builder.movies = self.MOVIES
+        builder.build(workers=1)
+        builder.save()
+
+        index = InvertedIndex()
+        self.assertFalse(index.has_positions())
+        with self.assertRaises(ValueError):
+            index.phrase_search('jurassic park')
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -1,6 +1,9 @@
 import unittest
+import json
+import tempfile
+from pathlib import Path
 
-from preprocessing import Preprocessing
+from preprocessing import Preprocessing, Analyzer, GetData, _iter_json_array
 
 class TestPreprocessing(unittest.TestCase):
 
@@ -31,5 +34,60 @@ class TestPreprocessing(unittest.TestCase):
         output = self.preprocessing.stemming()
         self.assertEqual(output, ['wonder', 'bear', 'grizzli'])
 
+    def test_adjacent_stop_words(self):
+        output = Preprocessing('The bear and the cub').stop_words()
+        self.assertEqual(output, ['bear', 'cub'])
+
+
+class TestAnalyzer(unittest.TestCase):
+
+    def setUp(self):
+        self.analyzer = Analyzer()
+
+    def test_matches_preprocessing(self):
+        texts = ['The wonderful bear, Grizzly', 'A family of bears and the cubs!', '']
+        self.assertEqual(self.analyzer.analyze_many(texts),
+                         [Preprocessing(text).stemming() for text in texts])
+
+    def test_stem_memo(self):
+        self.analyzer.analyze('bears bears bears')
+        self.assertEqual(self.analyzer.stem.cache_info().misses, 1)
+
+    def test_positions(self):
+        tokens, positions = self.analyzer.analyze_with_positions('The Lord of the Rings, the lord!')
+        self.assertEqual(tokens, self.analyzer.analyze('The Lord of the Rings, the lord!'))
+        self.assertEqual(list(zip(tokens, positions)), [('lord', 1), ('ring', 4), ('lord', 6)])
+
+
+class TestGetData(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.movies = [{'id': i, 'title': f'Movie {i}', 'description': 'A "bear" ]}, [{'} for i in range(50)]
+
+    def write(self, filename, text):
+        path = Path(self.dir.name)/filename
+        path.write_text(text)
+        return path
+
+    def test_iter_documents_json(self):
+        path = self.write('movies.json', json.dumps({'other': [1, {'movies': []}], 'movies': self.movies}, indent=2))
+        self.assertEqual(list(GetData(path).iter_documents()), self.movies)
+
+        path = self.write('list.json', json.dumps(self.movies))
+        self.assertEqual(list(GetData(path).iter_documents()), self.movies)
+
+    def test_iter_documents_jsonl(self):
+        path = self.write('movies.jsonl', '\n'.join(json.dumps(movie) for movie in self.movies) + '\n')
+        self.assertEqual(list(GetData(path).iter_documents()), self.movies)
+
+    def test_small_chunks(self):
+        # values (even numbers) split across read chunks
+        path = self.write('numbers.json', json.dumps({'movies': [123456, 7.5, self.movies[0]]}))
+        with open(path) as f:
+            self.assertEqual(list(_iter_json_array(f, 'movies', chunk_size=2)), [123456, 7.5, self.movies[0]])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,55 @@
+import unittest
+import io
+import json
+from types import SimpleNamespace
+from unittest import mock
+
+from lib import profiling
+
+
+class TestProfiling(unittest.TestCase):
+
+    def tearDown(self):
+        profiling.disable()
+        profiling.reset()
+
+    def test_disabled_records_nothing(self):
+        with profiling.span('stage'):
+            profiling.count('items', 3)
+
+        self.assertEqual(profiling.report()['spans'], [])
+        self.assertEqual(profiling.report()['counters'], {})
+
+    def test_spans_and_counters(self):
+        profiling.enable()
+        with profiling.span('search'):
+            for _ in range(3):
+                with profiling.span('score'):
+                    profiling.count('docs', 2)
+        profiling.count('docs')
+
+        profile = profiling.report()
+        self.assertEqual([(stage['name'], stage['calls'], stage['depth']) for stage in profile['spans']],
+                         [('search', 1, 0), ('score', 3, 1)])
+        self.assertGreaterEqual(profile['spans'][0]['seconds'], profile['spans'][1]['seconds'])
+        self.assertEqual(profile['counters'], {'docs': 7})
+
+        output = io.StringIO()
+        profiling.print_report('json', output)
+        self.assertEqual(json.loads(output.getvalue())['counters'], {'docs': 7})
+
+        profiling.enable()      # starts over
+        self.assertEqual(profiling.report()['spans'], [])
+
+    @unittest.skipIf(profiling.resource is None, "no resource module")
+    def test_peak_rss_mb(self):
+        usage = SimpleNamespace(ru_maxrss=512 * 1024 * 1024)
+        with mock.patch.object(profiling.resource, 'getrusage', return_value=usage):
+            with mock.patch.object(profiling.sys, 'platform', 'linux'):     # KB
+                self.assertEqual(profiling.peak_rss_mb(), 512 * 1024)
+            with mock.patch.object(profiling.sys, 'platform', 'darwin'):    # bytes
+                self.assertEqual(profiling.peak_rss_mb(children=True), 512)
+
+
+if __name__ == '__main__':
+    unittest.main()
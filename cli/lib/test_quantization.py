@@ -0,0 +1,60 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from quantization import CODECS, CompressedVectors, load_or_build_compressed
+from vectors import l2_normalize, top_k
+
+
+class TestCompressedVectors(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(600, 32)).astype(np.float32)
+        self.queries = l2_normalize(rng.normal(size=(8, 32)))
+        self.exact = top_k(self.queries @ l2_normalize(self.vectors).T, 5)
+
+    def test_sizes(self):
+        sizes = {storage: CompressedVectors.build(self.vectors, storage).bytes_per_vector for storage in CODECS}
+        self.assertEqual(sizes, {'float16': 64, 'int8': 32, 'pq': 32})
+
+    def test_rescored_search_is_exact(self):
+        for storage in CODECS:
+            compressed = CompressedVectors.build(self.vectors, storage)
+            # shortlist of every vector -> exact rescoring of all of them
+            results = compressed.search(self.queries, 5, self.vectors, rescore_factor=len(self.vectors))
+
+            for (rows, scores), expected in zip(results, self.exact):
+                self.assertEqual(rows.tolist(), expected.tolist(), storage)
+                self.assertTrue(np.all(np.diff(scores) <= 0))
+
+    def test_codes_only_scores_are_close(self):
+        for storage, tolerance in (('float16', 1e-2), ('int8', 5e-2)):
+            compressed = CompressedVectors.build(self.vectors, storage)
+            rows, scores = compressed.search(self.queries[0], 5)[0]
+            exact = l2_normalize(self.vectors[rows]) @ self.queries[0]
+            np.testing.assert_allclose(scores, exact, atol=tolerance)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory)/'vectors.pq.npz'
+            compressed = CompressedVectors.build(self.vectors, 'pq')
+            compressed.save(path)
+
+            loaded = CompressedVectors.load(path, self.vectors, 'pq')
+            np.testing.assert_array_equal(loaded.codes, compressed.codes)
+            np.testing.assert_array_equal(loaded.codec.centroids, compressed.codec.centroids)
+
+            # other storage mode or other vectors -> rebuilt
+            self.assertIsNone(CompressedVectors.load(path, self.vectors, 'int8'))
+            changed = self.vectors.copy()
+            changed[0] = changed[1]
+            self.assertIsNone(CompressedVectors.load(path, changed, 'pq'))
+            self.assertEqual(load_or_build_compressed(path, changed, 'pq').fingerprint,
+                             CompressedVectors.load(path, changed, 'pq').fingerprint)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from query_cache import QueryEmbeddingCache, normalize_query
+
+
+class FakeModel:
+    """ deterministic 'embeddings', counts the texts it encodes """
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts):
+        self.encoded.extend(texts)
+        return np.array([[len(text), sum(map(ord, text)), 1.0] for text in texts])
+
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.model = FakeModel()
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("  the \t bear\n"), "the bear")
+
+    def test_memory_hits(self):
+        cache = QueryEmbeddingCache(capacity=2)
+        first = cache.get("the bear", self.model.encode)
+        np.testing.assert_array_equal(cache.get(" the  bear ", self.model.encode), first)
+
+        # one encode() call for the batch, repeats & cached queries are not encoded
+        embeddings = cache.get_many(["cyborg", "the bear", "cyborg"], self.model.encode)
+        self.assertEqual(self.model.encoded, ["the bear", "cyborg"])
+        np.testing.assert_array_equal(embeddings[0], embeddings[2])
+        self.assertEqual(cache.stats(), {'hits': 2, 'disk_hits': 0, 'misses': 2, 'size': 2, 'disk_size': 0})
+
+        # capacity 2 -> least recently used ("the bear") evicted
+        cache.get("future", self.model.encode)
+        cache.get("the bear", self.model.encode)
+        self.assertEqual(self.model.encoded, ["the bear", "cyborg", "future", "the bear"])
+
+    def test_disk_store_survives_restarts(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = QueryEmbeddingCache(capacity=10, directory=directory, disk_capacity=2)
+            expected = cache.get_many(["the bear", "cyborg"], self.model.encode)
+
+            restarted = QueryEmbeddingCache(capacity=10, directory=directory, disk_capacity=2)
+            np.testing.assert_array_equal(restarted.get_many(["the bear", "cyborg"], self.model.encode), expected)
+            self.assertEqual(restarted.stats()['disk_hits'], 2)
+            self.assertEqual(len(self.model.encoded), 2)
+
+            # disk capacity 2 -> "the bear" (least recently used) evicted, slot reused
+            restarted.get("future", self.model.encode)
+            restarted = QueryEmbeddingCache(capacity=10, directory=directory, disk_capacity=2)
+            self.assertEqual(restarted.stats()['disk_size'], 2)
+            np.testing.assert_array_equal(restarted.get("cyborg", self.model.encode), expected[1])
+            restarted.get("the bear", self.model.encode)
+            self.assertEqual(self.model.encoded[-1], "the bear")
+            self.assertEqual(restarted.stats()['disk_size'], 2)
+
+    def test_disk_store_shared_by_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # two processes' caches, both loaded before either wrote
+            first = QueryEmbeddingCache(capacity=10, directory=directory, disk_capacity=4)
+            second = QueryEmbeddingCache(capacity=10, directory=directory, disk_capacity=4)
+            first.get("the bear", self.model.encode)
+            second.get("cyborg", self.model.encode)
+            first.get("future", self.model.encode)
+
+            # every query reads back its own embedding, whichever process wrote it
+            restarted = QueryEmbeddingCache(capacity=10, directory=directory, disk_capacity=4)
+            for text in ["the bear", "cyborg", "future"]:
+                np.testing.assert_array_equal(restarted.get(text, self.model.encode), self.model.encode([text])[0])
+            self.assertEqual(restarted.stats()['disk_hits'], 3)
+
+    def test_unusable_disk_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, 'embeddings.sqlite').write_text("not a database")
+            cache = QueryEmbeddingCache(capacity=10, directory=directory)
+            expected = cache.get("the bear", self.model.encode)
+            np.testing.assert_array_equal(cache.get("the bear", self.model.encode), expected)     # memory still works
+            self.assertEqual(cache.stats()['disk_size'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from rank_fusion import fuse_rrf, fuse_weighted
+
+
+class TestRankFusion(unittest.TestCase):
+
+    def setUp(self):
+        self.bm25 = {10: 9.5, 20: 7.0, 30: 1.0}
+        self.semantic = {20: 0.8, 40: 0.7, 10: 0.2}
+
+    def test_rrf(self):
+        fused = fuse_rrf([self.bm25, self.semantic], 10, k=60)
+        self.assertEqual([doc_id for doc_id, _ in fused], [20, 10, 40, 30])
+        self.assertAlmostEqual(fused[0][1], 1 / 62 + 1 / 61)
+        self.assertEqual(len(fuse_rrf([self.bm25, self.semantic], 2)), 2)
+
+    def test_weighted(self):
+        fused = dict(fuse_weighted([self.bm25, self.semantic], 10, [0.5, 0.5]))
+        self.assertAlmostEqual(fused[10], 0.5 * 1.0 + 0.5 * 0.0)
+        self.assertAlmostEqual(fused[20], 0.5 * 6 / 8.5 + 0.5 * 1.0)
+        self.assertAlmostEqual(fused[30], 0.0)
+
+        # only the semantic scores count
+        fused = fuse_weighted([self.bm25, self.semantic], 2, [0.0, 1.0])
+        self.assertEqual([doc_id for doc_id, _ in fused], [20, 40])
+
+    def test_empty_rankings(self):
+        self.assertEqual(fuse_rrf([{}, {}], 5), [])
+        self.assertEqual(fuse_weighted([{}, {5: 1.0}], 5, [0.5, 0.5]), [(5, 0.5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+from result_cache import ResultCache, result_key
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = Path(self.tmp_dir.name)/'results.sqlite'
+
+    def test_key(self):
+        self.assertEqual(result_key(['bear', 'cub'], 5, 'bmw', 1.5, 0.75), result_key(['cub', 'bear'], 5, 'wand', 1.5, 0.75))
+        self.assertNotEqual(result_key(['bear'], 5, 'bmw', 1.5, 0.75), result_key(['bear', 'bear'], 5, 'bmw', 1.5, 0.75))
+        self.assertNotEqual(result_key(['bear'], 5, 'bmw', 1.5, 0.75), result_key(['bear'], 5, 'impact', 1.5, 0.75))
+        self.assertNotEqual(result_key(['bear'], 5, 'bmw', 1.5, 0.75), result_key(['bear'], 10, 'bmw', 1.5, 0.75))
+
+    def test_memory_lru(self):
+        results = [(1, 2.5), (2, 1.0)]
+        cache = ResultCache(capacity_bytes=1000)
+
+        self.assertIsNone(cache.get('a.1', 'bear'))
+        cache.put('a.1', 'bear', results)
+        self.assertEqual(cache.get('a.1', 'bear'), results)
+
+        # the capacity holds 2 entries: the least recently used is evicted
+        cache.put('a.1', 'cub', results)
+        cache.get('a.1', 'bear')
+        cache.put('a.1', 'deer', results)
+        self.assertIsNone(cache.get('a.1', 'cub'))
+        self.assertEqual(cache.get('a.1', 'bear'), results)
+        self.assertLessEqual(cache.stats()['bytes'], 1000)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_generation_tag(self):
+        cache = ResultCache(path=self.path)
+        cache.put('a.1', 'bear', [(1, 2.5)])
+
+        self.assertIsNone(cache.get('a.2', 'bear'))     # the index changed
+        self.assertEqual(cache.stats()['size'], 0)
+        cache.put('a.2', 'cub', [(3, 1.0)])
+
+        # processes on different generations share the disk store without purging each other's entries
+        old, new = ResultCache(path=self.path), ResultCache(path=self.path)
+        old.put('a.1', 'deer', [(4, 1.0)])
+        new.put('a.2', 'deer', [(5, 2.0)])
+        self.assertEqual(ResultCache(path=self.path).get('a.1', 'deer'), [(4, 1.0)])
+        self.assertEqual(ResultCache(path=self.path).get('a.2', 'deer'), [(5, 2.0)])
+        self.assertEqual(ResultCache(path=self.path).get('a.2', 'cub'), [(3, 1.0)])
+        self.assertIsNone(ResultCache(path=self.path).get('a.2', 'bear'))
+
+    def test_disk_tier(self):
+        ResultCache(path=self.path, disk_capacity=2).put('a.1', 'bear', [(1, 2.5), (2, 1.25)])
+
+        cache = ResultCache(path=self.path, disk_capacity=2)
+        self.assertEqual(cache.get('a.1', 'bear'), [(1, 2.5), (2, 1.25)])
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+        self.assertEqual(cache.get('a.1', 'bear'), [(1, 2.5), (2, 1.25)])
+        self.assertEqual(cache.stats()['hits'], 1)
+
+        # least recently used first out of the disk capacity
+        cache.put('a.1', 'cub', [(3, 1.0)])
+        cache.put('a.1', 'deer', [(4, 1.0)])
+        other = ResultCache(path=self.path, disk_capacity=2)
+        self.assertIsNone(other.get('a.1', 'bear'))
+        self.assertEqual(other.get('a.1', 'deer'), [(4, 1.0)])
+
+    def test_unusable_disk_store(self):
+        self.path.write_text("not a database")
+        cache = ResultCache(path=self.path)
+
+        cache.put('a.1', 'bear', [(1, 2.5)])
+        self.assertEqual(cache.get('a.1', 'bear'), [(1, 2.5)])      # memory still works
+        self.assertIsNone(ResultCache(path=self.path).get('a.1', 'bear'))
+
+
+if __name__ == '__main__':
+    unittest.main()
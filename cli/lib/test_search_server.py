@@ -0,0 +1,161 @@
+import unittest
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
+
+import inverted_index
+from search_server import SearchService, make_server, query_server, server_stats
+
+
+class FakeService:
+    """ echoes the search request """
+    def search(self, kind, query, limit=5, **options):
+        if kind == 'missing':
+            raise ValueError("Unknown search kind")
+        return [{'kind': kind, 'query': query, 'limit': limit, **options}]
+
+    def stats(self):
+        return {'requests': 1}
+
+
+class TestSearchServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = make_server('localhost:0', FakeService())
+        self.address = f"localhost:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_query_server(self):
+        results = query_server(self.address, 'bm25', query="bear", limit=3, k1=1.2)
+        self.assertEqual(results, [{'kind': 'bm25', 'query': "bear", 'limit': 3, 'k1': 1.2}])
+        self.assertEqual(server_stats(self.address), {'requests': 1})
+
+        with self.assertRaisesRegex(ValueError, "Unknown search kind"):
+            query_server(self.address, 'missing', query="bear")
+
+    def test_no_server(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with self.assertRaises(ConnectionError):
+            query_server(self.address, 'bm25', query="bear")
+
+
+class TestKeywordSearch(unittest.TestCase):
+
+    def setUp(self):
+        # a small index (no positions) in a temporary cache directory
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        patcher = mock.patch.object(inverted_index, 'file_path', Path(cache_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        index = inverted_index.InvertedIndex()
+        index.movies = [{'id': 1, 'title': 'Grizzly Bear', 'description': 'A grizzly bear in the woods.'},
+                        {'id': 2, 'title': 'Bear Hunting', 'description': 'Hunting a grizzly.'}]
+        index.build(workers=1)
+        index.save()
+
+        service = SearchService()
+        service.inverted_index = lambda: index
+        self.server = make_server('localhost:0', service)
+        self.address = f"localhost:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_phrase_without_positions(self):
+        results = query_server(self.address, 'keyword', query='"grizzly bear"')
+        self.assertEqual([movie['id'] for movie in results], [1, 2])
+
+    def test_malformed_query(self):
+        for query in ['bear AND', '(bear', 'NOT']:
+            with self.assertRaisesRegex(ValueError, "QueryError"):
+                query_server(self.address, 'keyword', query=query)
+
+
+class StubSemanticSearch:
+    """ SemanticSearch.search() signature, echoes its arguments """
+    def search(self, query, limit, nprobe=8):
+        return [{'query': query, 'limit': limit, 'nprobe': nprobe}]
+
+
+class TestSemanticOptions(unittest.TestCase):
+
+    def setUp(self):
+        service = SearchService()
+        service.semantic_search = StubSemanticSearch
+        self.server = make_server('localhost:0', service)
+        self.address = f"localhost:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_options_forwarded(self):
+        self.assertEqual(query_server(self.address, 'semantic', query="bear", limit=3, nprobe=32),
+                         [{'query': "bear", 'limit': 3, 'nprobe': 32}])
+
+    def test_unknown_option_rejected(self):
+        with self.assertRaisesRegex(ValueError, "TypeError"):
+            query_server(self.address, 'semantic', query="bear", limit=3, top_m=2)
+
+
+class TestSearchService(unittest.TestCase):
+
+    def test_hybrid_search_reused(self):
+        service = SearchService()
+        retrievers = {'index': object(), 'semantic': object()}
+        service.inverted_index = lambda: retrievers['index']
+        service.semantic_search = lambda: retrievers['semantic']
+
+        hybrid = service.hybrid_search()
+        self.assertIs(service.hybrid_search(), hybrid)
+
+        retrievers['semantic'] = object()       # reloaded
+        rebuilt = service.hybrid_search()
+        self.assertIsNot(rebuilt, hybrid)
+        self.assertIs(rebuilt.semantic_search, retrievers['semantic'])
+
+    def test_requests_counted_across_threads(self):
+        service = SearchService()
+
+        def search():
+            for _ in range(500):
+                with self.assertRaises(ValueError):
+                    service.search('missing', "bear")
+
+        threads = [threading.Thread(target=search) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(service.requests, 4000)
+
+
+class TestReload(unittest.TestCase):
+
+    def test_reloaded_when_files_change(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file = Path(directory)/'index_manifest.json'
+            file.write_text('{"generation": 1}')
+
+            service = SearchService()
+            loads = []
+            load = lambda: loads.append(file.read_text()) or len(loads)
+
+            self.assertEqual(service._get('index', [file], load), 1)
+            self.assertEqual(service._get('index', [file], load), 1)
+
+            file.write_text('{"generation": 22}')
+            self.assertEqual(service._get('index', [file], load), 2)
+            self.assertEqual(loads, ['{"generation": 1}', '{"generation": 22}'])
+            self.assertEqual(service.reloads, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+from segment import Segment, TermReader, write_segment, encode_varint, decode_varints
+
+
+class TestVarint(unittest.TestCase):
+
+    def test_round_trip(self):
+        values = [0, 1, 127, 128, 300, 16383, 16384, 2**32 - 1]
+
+        data = bytearray()
+        for value in values:
+            encode_varint(value, data)
+
+        self.assertEqual(decode_varints(bytes(data)), values)
+
+
+class TestSegment(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+        documents = {7: {'id': 7, 'title': 'b'}, 3: {'id': 3, 'title': 'a'}, 9: {'id': 9, 'title': 'ü'}}
+        doc_lengths = {3: 2, 7: 5, 9: 1}
+        index = {'bear': [3, 7, 9], 'cub': [7], 'éclair': [9]}
+        term_frequencies = {3: {'bear': 2}, 7: {'bear': 4, 'cub': 1}, 9: {'bear': 1, 'éclair': 1}}
+
+        path = Path(self.tmp_dir.name)/'test.seg'
+        write_segment(path, documents, doc_lengths, index, term_frequencies, block_size=2)
+
+        self.segment = Segment(path)
+        self.addCleanup(self.segment.close)
+
+    def test_documents(self):
+        self.assertEqual(self.segment.no_of_docs, 3)
+        self.assertEqual(self.segment.total_length, 8)
+        self.assertEqual(list(self.segment.doc_ids), [3, 7, 9])
+        self.assertEqual(self.segment.document(self.segment.docnum(9)), {'id': 9, 'title': 'ü'})
+        self.assertIsNone(self.segment.docnum(4))
+
+    def test_vocabulary(self):
+        self.assertEqual(list(self.segment.terms()), ['bear', 'cub', 'éclair'])
+        self.assertIsNone(self.segment.term_id('deer'))
+        self.assertEqual(self.segment.df(self.segment.term_id('bear')), 3)
+
+    def test_postings_and_blocks(self):
+        term_id = self.segment.term_id('bear')
+
+        self.assertEqual(self.segment.postings(term_id), ([0, 1, 2], [2, 4, 1]))
+        self.assertEqual([self.segment.block_bounds(block) for block in self.segment.blocks(term_id)],
+                         [(1, 4, 2), (2, 1, 1)])
+        self.assertEqual(self.segment.tf(1, term_id), 4)
+        self.assertEqual(self.segment.tf(1, self.segment.term_id('éclair')), 0)
+        self.assertFalse(self.segment.has_positions)
+
+    def test_positions(self):
+        positions = {3: {'bear': [0, 4]}, 7: {'bear': [1, 2, 6, 9], 'cub': [3]}, 9: {'bear': [0], 'éclair': [2]}}
+        path = Path(self.tmp_dir.name)/'positions.seg'
+        write_segment(path, {doc_id: {'id': doc_id} for doc_id in positions}, {3: 2, 7: 5, 9: 1},
+                      {'bear': [3, 7, 9], 'cub': [7], 'éclair': [9]},
+                      {3: {'bear': 2}, 7: {'bear': 4, 'cub': 1}, 9: {'bear': 1, 'éclair': 1}},
+                      block_size=2, positions=positions)
+        segment = Segment(path)
+        self.addCleanup(segment.close)
+
+        bear = segment.term_id('bear')
+        self.assertTrue(segment.has_positions)
+        self.assertEqual(segment.term_positions(bear), [[0, 4], [1, 2, 6, 9], [0]])
+        self.assertEqual(segment.positions(2, bear), [0])
+        self.assertEqual(segment.positions(0, segment.term_id('cub')), [])
+
+        reader = TermReader(segment, segment.term_id('cub'))
+        self.assertIsNone(reader.find(0))
+        self.assertEqual(reader.positions(1), [3])
+        self.assertIsNone(reader.find(2))
+
+    def test_fields(self):
+        self.assertFalse(self.segment.has_fields)
+
+        # title tf & length are stored, the description's are the totals minus the title's
+        path = Path(self.tmp_dir.name)/'fields.seg'
+        write_segment(path, {doc_id: {'id': doc_id} for doc_id in (3, 7, 9)}, {3: 2, 7: 5, 9: 1},
+                      {'bear': [3, 7, 9], 'cub': [7], 'éclair': [9]},
+                      {3: {'bear': 2}, 7: {'bear': 4, 'cub': 1}, 9: {'bear': 1, 'éclair': 1}},
+                      block_size=2, title_lengths={3: 1, 7: 2, 9: 0}, title_frequencies={3: {'bear': 1}, 7: {'bear': 1}})
+        segment = Segment(path)
+        self.addCleanup(segment.close)
+
+        bear = segment.term_id('bear')
+        self.assertTrue(segment.has_fields)
+        self.assertEqual(list(segment.title_lengths), [1, 2, 0])
+        self.assertEqual(segment.title_length, 3)
+        self.assertEqual(segment.title_tfs(bear), [1, 1, 0])
+        self.assertEqual(segment.field_tfs(1, bear), (1, 3))
+        self.assertEqual(segment.field_tfs(1, segment.term_id('éclair')), (0, 0))
+        # block 1 has no title hit: its title bounds are 0
+        self.assertEqual([segment.block_field_bounds(block) for block in segment.blocks(bear)],
+                         [((1, 3), (1, 1)), ((0, 1), (0, 1))])
+
+
+if __name__ == '__main__':
+    unittest.main()
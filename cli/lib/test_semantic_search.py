@@ -0,0 +1,59 @@
+import unittest
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import semantic_search
+from semantic_search import ChunkedSemanticSearch
+from synthetic_corpus import StandInEmbedder
+
+
+MOVIES = [
+    {'id': 1, 'title': 'Jungle Bears', 'description': 'Bears live here. They eat honey. The jungle is big. '
+                                                       'A river runs through it. Cubs swim in the river.'},
+    {'id': 2, 'title': 'Empty', 'description': ''},
+    {'id': 3, 'title': 'Cyborg', 'description': 'A cyborg travels from the future. It hunts John Connor.'},
+]
+
+
+class TestChunkMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        patcher = mock.patch.object(semantic_search, 'file_path', Path(self.cache_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def load(self, movies):
+        search = ChunkedSemanticSearch(model_name='stand-in-test', model=StandInEmbedder(dim=8))
+        search.query_cache.store = None     # memory only
+        search.load_or_create_chunk_embeddings(movies)
+        return search
+
+    def test_loaded_without_chunking(self):
+        built = self.load(MOVIES)
+        self.assertEqual(built.chunks[0], 'Bears live here. They eat honey. The jungle is big. A river runs through it.')
+        self.assertEqual(list(built.chunk_offsets), [0, 2, 2, 3])
+
+        with mock.patch.object(semantic_search, 'semantic_chunk') as semantic_chunk:
+            loaded = self.load(MOVIES)
+        semantic_chunk.assert_not_called()
+
+        self.assertEqual(loaded.chunks, built.chunks)
+        self.assertEqual(list(loaded.chunk_offsets), list(built.chunk_offsets))
+        for name, values in built.chunk_metadata.items():
+            self.assertEqual(list(loaded.chunk_metadata[name]), list(values))
+        self.assertEqual(loaded.search_chunks('cyborg future', 3), built.search_chunks('cyborg future', 3))
+
+    def test_edited_documents_are_chunked_again(self):
+        self.load(MOVIES)
+        edited = [MOVIES[0], MOVIES[1], {**MOVIES[2], 'description': 'A cyborg. It travels. From the future.'}]
+
+        loaded = self.load(edited)
+        self.assertEqual(loaded.chunks[-1], 'A cyborg. It travels. From the future.')
+        self.assertEqual(list(loaded.chunk_metadata['movie_ids']), [1, 1, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+from sqlite_store import SQLiteLRUStore
+
+
+class TestSQLiteLRUStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = Path(self.tmp_dir.name)/'store.sqlite'
+
+    def test_tags(self):
+        store = SQLiteLRUStore(self.path, capacity=10)
+        store.put_many([('bear', 'a.1')], tag='a.1')
+        store.put_many([('bear', b'a.2')], tag='a.2')
+
+        self.assertEqual(store.get('bear', 'a.1'), 'a.1')
+        self.assertEqual(store.get('bear', 'a.2'), b'a.2')
+        self.assertIsNone(store.get('bear'))
+        self.assertEqual(len(store), 2)
+
+    def test_least_recently_used_evicted(self):
+        store = SQLiteLRUStore(self.path, capacity=2)
+        store.put_many([('bear', 'b'), ('cub', 'c')])
+        store.get('bear')
+        store.put_many([('deer', 'd')])
+
+        # another process sees the same entries
+        other = SQLiteLRUStore(self.path, capacity=2)
+        self.assertIsNone(other.get('cub'))
+        self.assertEqual((other.get('bear'), other.get('deer')), ('b', 'd'))
+
+    def test_unusable_file(self):
+        self.path.write_text("not a database")
+        store = SQLiteLRUStore(self.path, capacity=2)
+        store.put_many([('bear', 'b')])
+        self.assertIsNone(store.get('bear'))
+        self.assertEqual(len(store), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from collections import Counter
+from itertools import islice
+
+import numpy as np
+
+from synthetic_corpus import synthetic_movies, synthetic_queries, StandInEmbedder, FUNCTION_WORDS
+
+
+class TestSyntheticCorpus(unittest.TestCase):
+
+    def test_movies_are_deterministic(self):
+        movies = list(synthetic_movies(1500, seed=3))
+
+        self.assertEqual([movie['id'] for movie in movies], list(range(1, 1501)))
+        self.assertEqual(movies, list(synthetic_movies(1500, seed=3)))
+        self.assertNotEqual(movies[:10], list(synthetic_movies(10, seed=4)))
+        # a prefix of a larger corpus is the smaller corpus
+        self.assertEqual(list(islice(synthetic_movies(5000, seed=3), 1500)), movies)
+
+    def test_zipfian_vocabulary(self):
+        counts = Counter(word for movie in synthetic_movies(500)
+                         for word in movie['description'].lower().replace('.', '').split())
+        ranked = [count for _, count in counts.most_common()]
+
+        self.assertEqual(counts.most_common(1)[0][0], 'the')
+        # frequency ~ 1 / rank
+        self.assertAlmostEqual(ranked[0] / ranked[9], 10, delta=3)
+
+    def test_queries_skip_function_words(self):
+        queries = synthetic_queries(200)
+
+        self.assertEqual(queries, synthetic_queries(200))
+        self.assertTrue(all(1 <= len(query.split()) <= 4 for query in queries))
+        self.assertFalse(set(FUNCTION_WORDS) & {word for query in queries for word in query.split()})
+
+    def test_stand_in_embedder(self):
+        texts = ["the bear hunts", "", "a bear hunts the cyborg", "future cyborg"]
+        embeddings = StandInEmbedder(dim=32).encode(texts)
+
+        self.assertEqual(embeddings.shape, (4, 32))
+        self.assertEqual(embeddings.dtype, np.float32)
+        self.assertFalse(embeddings[1].any())
+        # another instance, other batches & order -> the same vectors
+        embedder = StandInEmbedder(dim=32)
+        embedder.encode(["future cyborg"])
+        np.testing.assert_allclose(embedder.encode(texts[::-1])[::-1], embeddings, rtol=1e-5, atol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+import numpy as np
+
+from vectors import l2_normalize, top_k, aggregate_by_group
+
+
+class TestVectors(unittest.TestCase):
+
+    def test_l2_normalize(self):
+        output = l2_normalize([[3, 4], [0, 0]])
+        np.testing.assert_allclose(output, [[0.6, 0.8], [0, 0]])
+        self.assertEqual(output.dtype, np.float32)
+
+    def test_top_k(self):
+        scores = np.array([[0.1, 0.9, 0.5, 0.9, 0.2],
+                           [0.3, 0.2, 0.1, 0.0, 0.4]])
+        self.assertEqual(top_k(scores, 2).tolist(), [[1, 3], [4, 0]])
+        self.assertEqual(top_k(scores, 10).tolist(), [[1, 3, 2, 4, 0], [4, 0, 1, 2, 3]])
+        self.assertEqual(top_k(scores, 0).shape, (2, 0))
+
+    def test_top_k_matches_sorting(self):
+        rng = np.random.default_rng(0)
+        embeddings = l2_normalize(rng.normal(size=(1000, 16)))
+        queries = l2_normalize(rng.normal(size=(5, 16)))
+        scores = queries @ embeddings.T
+
+        for limit in (1, 10, 1000):
+            expected = np.argsort(-scores, axis=1, kind='stable')[:, :limit]
+            self.assertEqual(top_k(scores, limit).tolist(), expected.tolist())
+
+    def test_aggregate_by_group(self):
+        # groups: [0.1, 0.5] [0.9, 0.7, 0.9] [] [0.3]
+        scores = np.array([0.1, 0.5, 0.9, 0.7, 0.9, 0.3])
+        offsets = np.array([0, 2, 5, 5, 6])
+
+        group_scores, best_items = aggregate_by_group(scores, offsets)
+        self.assertEqual(group_scores.tolist(), [0.5, 0.9, -np.inf, 0.3])
+        self.assertEqual(best_items.tolist(), [1, 2, -1, 5])     # first of equal scores
+
+        group_scores, best_items = aggregate_by_group(scores, offsets, top_m=2)
+        np.testing.assert_allclose(group_scores, [0.3, 0.9, -np.inf, 0.3])
+        self.assertEqual(best_items.tolist(), [1, 2, -1, 5])
+
+        group_scores, best_items = aggregate_by_group(np.array([]), np.array([0, 0]))
+        self.assertEqual(best_items.tolist(), [-1])
+
+    def test_aggregate_by_group_matches_loop(self):
+        rng = np.random.default_rng(0)
+        offsets = np.r_[0, np.cumsum(rng.integers(0, 5, size=50))]
+        scores = rng.normal(size=offsets[-1])
+
+        for top_m in (1, 3):
+            group_scores, best_items = aggregate_by_group(scores, offsets, top_m)
+            for i, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+                if start == end:
+                    continue
+                best = np.sort(scores[start:end])[::-1][:top_m]
+                self.assertAlmostEqual(group_scores[i], best.mean())
+                self.assertEqual(best_items[i], start + np.argmax(scores[start:end]))
+
+
+if __name__ == '__main__':
+    unittest.main()
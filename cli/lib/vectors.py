@@ -0,0 +1,120 @@
+"""
+    vectors
+
+        NumPy helpers shared by the semantic search paths.
+
+        l2_normalize
+            scales every row to unit length once, so cosine similarity
+            becomes a plain dot product (matrix @ query)
+
+        top_k
+            indices of the best `limit` scores of every row, using
+            np.argpartition (O(n)) instead of sorting every score
+
+        aggregate_by_group
+            scores of items (chunks) -> scores of their groups (movies),
+            the max or the mean of the best m, without a Python loop
+
+        fingerprint
+            cheap hash of an embedding matrix, stored with the indexes
+            built from it (stale -> rebuilt)
+"""
+import hashlib
+
+import numpy as np
+
+
+def l2_normalize(matrix):
+    """
+    Docstring for l2_normalize
+
+    :param matrix: (n, dim) or (dim,) array
+    :return: float32 copy with unit-length rows (all-zero rows stay zero)
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def top_k(scores, limit):
+    """
+    Docstring for top_k
+
+    :param scores: (no. of queries, n) array
+    :param limit: no. of results per query
+    :return: (no. of queries, min(limit, n)) indices, best score first
+             (equal scores -> lower index first)
+    """
+    scores = np.atleast_2d(scores)
+    limit = max(0, min(limit, scores.shape[1]))
+
+    if limit == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.intp)
+
+    if limit < scores.shape[1]:
+        candidates = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    # last key sorts first: score (descending), then index
+    order = np.lexsort((candidates, -candidate_scores), axis=1)
+
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def aggregate_by_group(scores, offsets, top_m=1):
+    """
+    Docstring for aggregate_by_group
+
+    :param scores: (n,) score of every item
+    :param offsets: (no. of groups + 1,) items of a group are contiguous,
+                    group i is scores[offsets[i]:offsets[i + 1]]
+    :param top_m: a group scores the mean of its best top_m items
+                  (1 -> max, O(n) with np.maximum.reduceat, else a sort)
+    :return: (group scores, best item of every group), -inf & -1 for
+             groups without items
+    """
+    scores = np.asarray(scores)
+    counts = np.diff(offsets)
+    item_groups = np.repeat(np.arange(len(counts)), counts)
+
+    group_scores = np.full(len(counts), -np.inf)
+    best_items = np.full(len(counts), -1, dtype=np.int64)
+    non_empty = np.flatnonzero(counts)
+    if len(non_empty) == 0:
+        return group_scores, best_items
+
+    if top_m == 1:
+        group_scores[non_empty] = np.maximum.reduceat(scores, offsets[non_empty])
+
+        # best item -> the first one scoring its group's max
+        hits = np.flatnonzero(scores == np.repeat(group_scores, counts))
+        first = np.ones(len(hits), dtype=bool)
+        first[1:] = item_groups[hits[1:]] != item_groups[hits[:-1]]
+        best_items[item_groups[hits[first]]] = hits[first]
+
+        return group_scores, best_items
+
+    # by group (positions of the groups unchanged), then best score first
+    order = np.lexsort((-scores, item_groups))
+    kept = np.arange(len(order)) - np.repeat(offsets[:-1], counts) < top_m
+
+    sums = np.bincount(item_groups[kept], weights=scores[order][kept], minlength=len(counts))
+    group_scores[non_empty] = sums[non_empty] / np.minimum(counts[non_empty], top_m)
+    best_items[non_empty] = order[offsets[non_empty]]
+
+    return group_scores, best_items
+
+
+def fingerprint(vectors):
+    """ hash of the shape & a sample of rows (cheap, detects rebuilt embeddings).
+        An edit of a single unsampled row can go unnoticed: indexes built
+        from the vectors only use them to pick candidates, the final
+        scores come from the current vectors """
+    sample = np.ascontiguousarray(vectors[::max(1, len(vectors) // 256)], dtype=np.float32)
+
+    digest = hashlib.sha1(repr(tuple(vectors.shape)).encode())
+    digest.update(sample.tobytes())
+    return digest.digest()
@@ -10,4 +10,86 @@ be reused across different parts of codebase
 BM25_K1 = 1.5    # a common value is 1.5
 
 
-BM25_B = 0.75
\ No newline at end of file
+BM25_B = 0.75
+
+# no. of postings per block, each block stores the upper bounds
+# (max tf, min doc length) used to skip it during top-k search
+BM25_BLOCK_SIZE = 64
+
+# top-k strategy used by bm25_search: 'exhaustive', 'wand' or 'bmw' (Block-Max WAND)
+BM25_SEARCH_STRATEGY = 'bmw'
+
+# no. of levels BM25 impacts are quantized to (8 bits -> 255, 0 is unused)
+BM25_IMPACT_LEVELS = 255
+
+# no. of processes used by `build` (None -> one per CPU, 1 -> serial)
+BUILD_WORKERS = None
+# no. of movies per build shard (a corpus of a single shard is built serially)
+BUILD_SHARD_SIZE = 256
+
+# `add` / `update` / `delete` write small segments, once an index has more
+# than this many segments they are merged back into one
+INDEX_MAX_SEGMENTS = 8
+
+# no. of distinct tokens whose Porter stem is memoized by the text Analyzer
+ANALYZER_STEM_CACHE_SIZE = 2**16
+
+# IVF approximate nearest neighbour index of the embeddings {refer lib/ann.py}
+ANN_LISTS = None            # no. of k-means clusters (None -> sqrt(no. of vectors))
+ANN_NPROBE = 8              # clusters scanned per query (more -> better recall, slower)
+ANN_KMEANS_ITERATIONS = 10
+ANN_TRAIN_SIZE = 50000      # centroids are trained on at most this many vectors
+
+# how the embedding caches are kept in memory for search {refer lib/quantization.py}:
+# 'float32' (exact), 'float16', 'int8' or 'pq' (product quantization)
+EMBEDDING_STORAGE = 'float32'
+EMBEDDING_PQ_SUBSPACES = 48     # pq bytes per vector (must divide the dimension, 384)
+EMBEDDING_RESCORE_FACTOR = 4    # limit * this best compressed matches are rescored in float32
+
+# query embeddings cached per model {refer lib/query_cache.py}
+QUERY_CACHE_SIZE = 1024         # kept in memory (LRU)
+QUERY_CACHE_DISK_SIZE = 20000   # kept under cache/query_embeddings/ (LRU, ~1.5 KB each), 0 -> memory only
+
+# chunked semantic search: a movie scores the mean of its best CHUNK_TOP_M
+# chunks (1 -> its best chunk). With an ANN index or compressed embeddings
+# only the best limit * CHUNK_CANDIDATES chunks are scored
+CHUNK_TOP_M = 1
+CHUNK_CANDIDATES = 10
+
+# embeddings are encoded EMBEDDING_BATCH_SIZE texts per model call, in windows of
+# EMBEDDING_WINDOW texts (sorted by length, checkpointed) {refer lib/embedding_store.py}
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_WINDOW = 4096
+
+# hybrid (BM25 + semantic) search {refer lib/hybrid_search.py}
+RRF_K = 60                      # reciprocal rank fusion: 1 / (RRF_K + rank)
+HYBRID_ALPHA = 0.5              # weighted fusion: ALPHA * bm25 + (1 - ALPHA) * semantic
+HYBRID_CANDIDATE_FACTOR = 5     # each retriever returns limit * this candidates
+
+# "host:port" of the search server {refer lib/search_server.py}, used by
+# search_server_cli.py serve & the CLIs' --server option
+SERVER_ADDRESS = 'localhost:8765'
+
+# `batch` subcommands {refer lib/batch_search.py}
+BATCH_WORKERS = None            # processes running BM25 queries (None -> one per CPU, 1 -> serial)
+BATCH_SEMANTIC_SIZE = 256       # semantic queries per encode() call & matrix product
+
+# proximity boost of bm25_search (index built with positions): the best
+# limit * PROXIMITY_CANDIDATES documents get PROXIMITY_WEIGHT * sum of 1 / span
+# of the consecutive query token pairs {refer InvertedIndex._proximity_rerank}
+PROXIMITY_WEIGHT = 1.0
+PROXIMITY_CANDIDATES = 10
+
+# operator joining the words of a boolean keyword query that have none between
+# them: 'OR' -> `search bear jungle` matches either word, 'AND' -> both
+BOOLEAN_DEFAULT_OPERATOR = 'OR'
+
+# BM25 results cached per index {refer lib/result_cache.py}
+RESULT_CACHE_MEMORY_BYTES = 16 * 2**20  # estimated memory of the results kept in memory (LRU)
+RESULT_CACHE_DISK_SIZE = 10000          # results kept in cache/bm25_results.sqlite (LRU), 0 -> memory only
+
+# BM25F {refer InvertedIndex._bm25f_score}: every field's tf is weighted by its
+# boost & normalized by its own length (b) before the k1 saturation, so a
+# title hit outweighs a passing mention in a long description
+BM25F_FIELDS = {'title': {'boost': 2.0, 'b': 0.5},
+                'description': {'boost': 1.0, 'b': 0.75}}
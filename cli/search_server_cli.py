@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from lib.search_server import SearchService, serve, server_stats
+from parameters import SERVER_ADDRESS, EMBEDDING_STORAGE
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search Server CLI")
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+
+    # serve cmd parser
+    serve_parser = subparsers.add_parser("serve", help="Keeps the index & the embedding model loaded, serves queries over HTTP")
+    serve_parser.add_argument("--address", type=str, default=SERVER_ADDRESS, help="host:port to listen on")
+    serve_parser.add_argument("--ann", action='store_true', help="semantic & chunk searches use the IVF indexes")
+    serve_parser.add_argument("--storage", choices=['float32', 'float16', 'int8', 'pq'], default=EMBEDDING_STORAGE,
+                              help="search compressed embeddings (rescored in float32)")
+    serve_parser.add_argument("--lazy", action='store_true', help="load the index / model on their first query")
+
+    # stats cmd parser
+    stats_parser = subparsers.add_parser("stats", help="Requests served, reloads & query cache of a running server")
+    stats_parser.add_argument("--address", type=str, default=SERVER_ADDRESS, help="host:port of the server")
+
+    args = parser.parse_args()
+
+    match args.command:
+        case "serve":
+            serve(args.address, SearchService(args.ann, args.storage), preload=not args.lazy)
+
+        case "stats":
+            for name, value in server_stats(args.address).items():
+                print(f"{name}: {value}")
+
+        case _:
+            parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
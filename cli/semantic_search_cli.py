@@ -3,17 +3,17 @@
 import argparse
 from pathlib import Path
 
+from lib import profiling
 from lib.preprocessing import GetData
-from lib.semantic_search import (verify_model, 
-                                 embed_text,
-                                 verify_embeddings,
-                                 embed_query_text,
-                                 search,
-                                 semantic_chunk,
-                                 ChunkedSemanticSearch)
+from lib.chunking import semantic_chunk
+from parameters import ANN_NPROBE, EMBEDDING_STORAGE, CHUNK_TOP_M, SERVER_ADDRESS, BATCH_SEMANTIC_SIZE
 
 def main():
     parser = argparse.ArgumentParser(description="Semantic Search CLI")
+    parser.add_argument("--profile", action='store_const', const='text', default=None,
+                        help="print the time spent per stage & counters (to stderr)")
+    parser.add_argument("--profile-json", dest='profile', action='store_const', const='json',
+                        help="--profile as a single JSON line (metrics pipelines)")
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     verify_parser = subparsers.add_parser("verify", help="verifies all-MiniLM-L6-v2 is properly loaded")
@@ -30,6 +30,13 @@ def main():
     search_parser = subparsers.add_parser("search", help="semantic search for relevant results")
     search_parser.add_argument("query", type=str, help="user query on which search is performed")
     search_parser.add_argument("--limit", type=int, nargs='?', default=5, help="user query on which search is performed")
+    search_parser.add_argument("--ann", action='store_true', help="approximate search with the IVF index (built on first use)")
+    search_parser.add_argument("--nprobe", type=int, default=ANN_NPROBE, help="clusters scanned with --ann (more -> better recall, slower)")
+    search_parser.add_argument("--storage", choices=['float32', 'float16', 'int8', 'pq'], default=EMBEDDING_STORAGE,
+                               help="search compressed embeddings (rescored in float32)")
+    search_parser.add_argument("--cache-stats", action='store_true', help="print the query embedding cache hits / misses")
+    search_parser.add_argument("--server", nargs='?', const=SERVER_ADDRESS, default=None,
+                               help="send the query to a running search server (default address: %(const)s), --ann & --storage are the server's")
     
     chunk_parser = subparsers.add_parser("chunk", help="split long text into smaller pieces for embedding")
     chunk_parser.add_argument("text", type=str, help="text to chunk")
@@ -43,8 +50,49 @@ def main():
 
     embed_chunks_parser = subparsers.add_parser("embed_chunks", help="generates embeddings for all the chunks")
 
+    search_chunked_parser = subparsers.add_parser("search_chunked", help="semantic search over the chunks of every movie")
+    search_chunked_parser.add_argument("query", type=str, help="user query on which search is performed")
+    search_chunked_parser.add_argument("--limit", type=int, default=5, help="no. of movies")
+    search_chunked_parser.add_argument("--top-m", type=int, default=CHUNK_TOP_M,
+                                       help="a movie scores the mean of its best M chunks (1 -> its best chunk)")
+    search_chunked_parser.add_argument("--ann", action='store_true', help="approximate search with the IVF index of the chunks")
+    search_chunked_parser.add_argument("--nprobe", type=int, default=ANN_NPROBE, help="clusters scanned with --ann")
+    search_chunked_parser.add_argument("--storage", choices=['float32', 'float16', 'int8', 'pq'], default=EMBEDDING_STORAGE,
+                                       help="search compressed chunk embeddings (rescored in float32)")
+    search_chunked_parser.add_argument("--server", nargs='?', const=SERVER_ADDRESS, default=None,
+                                       help="send the query to a running search server (default address: %(const)s), --ann & --storage are the server's")
+
+    batch_parser = subparsers.add_parser("batch", help="semantic search of a file of queries, JSONL results")
+    batch_parser.add_argument("queries", type=str, nargs='?', default='-',
+                              help='one query per line or JSONL {"query": ...} (default: stdin)')
+    batch_parser.add_argument("--output", type=str, default=None, help="JSONL results file (default: stdout)")
+    batch_parser.add_argument("--limit", type=int, default=5, help="no. of results per query")
+    batch_parser.add_argument("--ann", action='store_true', help="approximate search with the IVF index (built on first use)")
+    batch_parser.add_argument("--nprobe", type=int, default=ANN_NPROBE, help="clusters scanned with --ann")
+    batch_parser.add_argument("--storage", choices=['float32', 'float16', 'int8', 'pq'], default=EMBEDDING_STORAGE,
+                              help="search compressed embeddings (rescored in float32)")
+    batch_parser.add_argument("--batch-size", type=int, default=BATCH_SEMANTIC_SIZE,
+                              help="queries per encode() call & matrix product")
+
 
     args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    if getattr(args, 'server', None):
+        from lib.search_server import query_server
+    elif args.command not in (None, "chunk", "semantic_chunk"):
+        # NumPy & lib.semantic_search (torch & the model on first encode) are
+        # only imported by the commands using them, chunking starts instantly
+        from lib.semantic_search import (verify_model,
+                                         embed_text,
+                                         verify_embeddings,
+                                         embed_query_text,
+                                         search,
+                                         search_chunked,
+                                         print_embedding_report,
+                                         query_cache_stats,
+                                         ChunkedSemanticSearch)
 
     match args.command:
         case "verify":
@@ -60,13 +108,21 @@ def main():
             embed_query_text(args.query)
 
         case "search":
-            result = search(args.query, args.limit)
+            if args.server:
+                result = query_server(args.server, 'semantic', query=args.query, limit=args.limit, nprobe=args.nprobe)
+            else:
+                result = search(args.query, args.limit, args.ann, args.nprobe, args.storage)
 
             underline = '\033[4m'
             end = '\033[0m'
             for i, res in enumerate(result):
                 print(f"{i+1}. {underline}{res['title']}{end} (score: {res['score']})\n\t {res['description']}\n\n")
 
+            if args.cache_stats and not args.server:
+                stats = query_cache_stats()
+                print(f"query cache: {stats['hits']} hits, {stats['disk_hits']} disk hits, {stats['misses']} misses "
+                      f"({stats['size']} in memory, {stats['disk_size']} on disk)")
+
         case "chunk":
             overlap = args.overlap
             chunk_size = args.chunk_size
@@ -101,11 +157,40 @@ def main():
             movies_data = GetData(Path(__file__).resolve().parents[1]/'data'/'movies.json').get_file_data_json()
             documents = movies_data['movies']
 
-            embeddings = ChunkedSemanticSearch().load_or_create_chunk_embeddings(documents)
+            chunked_search = ChunkedSemanticSearch()
+            embeddings = chunked_search.load_or_create_chunk_embeddings(documents)
             print(f"Generated {len(embeddings)} chunked embeddings")
+            print_embedding_report(chunked_search.embedding_report)
+
+        case "search_chunked":
+            if args.server:
+                result = query_server(args.server, 'chunks', query=args.query, limit=args.limit,
+                                      top_m=args.top_m, nprobe=args.nprobe)
+            else:
+                result = search_chunked(args.query, args.limit, args.top_m, args.ann, args.nprobe, args.storage)
+
+            for i, res in enumerate(result):
+                print(f"{i+1}. {res['title']} (score: {res['score']:.4f})\n\t chunk {res['chunk_idx'] + 1}: {res['chunk']}\n")
+
+        case "batch":
+            import sys
+            from lib.batch_search import read_queries, batch_semantic_search, write_results, print_batch_report
+
+            queries = read_queries(args.queries)
+            batch = batch_semantic_search(queries, args.limit, args.ann, args.nprobe, args.storage, args.batch_size)
+
+            if args.output:
+                with open(args.output, 'w') as output:
+                    report = write_results(batch, output)
+            else:
+                report = write_results(batch, sys.stdout)
+            print_batch_report(report)
 
         case _:
             parser.print_help()
 
+    if args.profile:
+        profiling.print_report(args.profile)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file